@@ -1,6 +1,7 @@
 """
 Streamlit 用户界面：Prompt 助手 (Professional Clean Design)
 """
+import os
 import streamlit as st
 import time
 import re
@@ -8,7 +9,9 @@ from ollama_client import OllamaClient
 from gemini_client import GeminiClient
 from vector_store import VectorStore
 from rag_generator import RAGGenerator
-from config import TOP_K, GEMINI_MODEL
+from retrieval_client import RetrievalClient
+from manifest import manifest_path_for
+from config import TOP_K, GEMINI_MODEL, INDEX_PATH, RETRIEVAL_SERVER_URL
 try:
     from prompt_templates import STYLES
 except ImportError:
@@ -196,13 +199,9 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 初始化 session state
-if 'vector_store' not in st.session_state:
-    st.session_state.vector_store = None
+# 初始化 session state（每个会话只保存风格、输入与生成器配置；索引、模型等由进程内所有会话共享）
 if 'rag_generator' not in st.session_state:
     st.session_state.rag_generator = None
-if 'ollama_client' not in st.session_state:
-    st.session_state.ollama_client = None
 if 'gemini_client' not in st.session_state:
     st.session_state.gemini_client = None
 if 'current_style' not in st.session_state:
@@ -219,34 +218,70 @@ def strip_think_tags(text: str) -> str:
     return re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
 
 
-def init_components():
-    """初始化组件"""
-    if st.session_state.ollama_client is None:
-        st.session_state.ollama_client = OllamaClient()
-        st.session_state.ollama_client.warm_connection()
+def index_version() -> int:
+    """索引的版本号（manifest 的修改时间），重新建库后变化"""
+    try:
+        return os.stat(manifest_path_for(INDEX_PATH)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+@st.cache_resource(show_spinner="系统启动中...", max_entries=1)
+def load_vector_store(version: int) -> VectorStore:
+    """
+    进程级共享的只读向量库：所有会话共用同一份索引、元数据库与 Embedding 模型
+    
+    Args:
+        version: index_version()，重新建库后加载新索引，旧索引随缓存淘汰释放
+    """
+    vector_store = VectorStore()
+    if not vector_store.exists():
+        # 异常不会被缓存，补建索引后刷新页面即可
+        raise FileNotFoundError("索引文件缺失")
+    vector_store.load_index()
+    try:
+        vector_store.encoder.encode(["init"])
+    except:
+        pass
+    return vector_store
+
+
+@st.cache_resource(show_spinner="连接检索服务...")
+def load_retrieval_client() -> RetrievalClient:
+    """配置了 RETRIEVAL_SERVER_URL 时通过检索服务检索，本进程不加载模型与索引"""
+    client = RetrievalClient()
+    client.health()
+    return client
+
 
+@st.cache_resource
+def load_ollama_client() -> OllamaClient:
+    """进程级共享的 Ollama 客户端，HTTP 连接池在会话间复用"""
+    client = OllamaClient()
+    client.warm_connection()
+    return client
+
+
+def init_components():
+    """初始化组件，返回共享的检索器（VectorStore 或检索服务客户端）；不可用时返回 None"""
+    try:
+        if RETRIEVAL_SERVER_URL:
+            vector_store = load_retrieval_client()
+        else:
+            vector_store = load_vector_store(index_version())
+    except (FileNotFoundError, ValueError, ConnectionError) as e:
+        # ValueError: 索引与当前模型配置不兼容（manifest 校验失败）；ConnectionError: 检索服务不可用
+        st.error(str(e))
+        return None
+    
     if st.session_state.gemini_client is None:
         st.session_state.gemini_client = GeminiClient()
     
-    if st.session_state.vector_store is None:
-        with st.spinner("系统启动中..."):
-            st.session_state.vector_store = VectorStore()
-            if st.session_state.vector_store.exists():
-                st.session_state.vector_store.load_index()
-                try:
-                    st.session_state.vector_store.encoder.encode(["init"])
-                except:
-                    pass
-            else:
-                st.error("索引文件缺失")
-                return False
-    
     if st.session_state.rag_generator is None:
-        st.session_state.rag_generator = RAGGenerator(
-            st.session_state.vector_store,
-            st.session_state.ollama_client
-        )
-    return True
+        st.session_state.rag_generator = RAGGenerator(vector_store, load_ollama_client())
+    # 重新建库后共享向量库会换成新实例
+    st.session_state.rag_generator.vector_store = vector_store
+    return vector_store
 
 def display_result(item, index, distance=None):
     """显示结果卡片"""
@@ -292,7 +327,8 @@ def main():
         </div>
     """, unsafe_allow_html=True)
 
-    if not init_components():
+    vector_store = init_components()
+    if vector_store is None:
         st.stop()
 
     # --- 1. 风格选择 (四大金刚) ---
@@ -357,7 +393,7 @@ def main():
                     st.error("❌ API Key 未配置")
             else:
                 # Ollama
-                st.session_state.rag_generator.set_client(st.session_state.ollama_client)
+                st.session_state.rag_generator.set_client(load_ollama_client())
                 st.caption(f"✅ Local Ollama")
             
             st.divider()
@@ -382,7 +418,7 @@ def main():
         else:
             st.subheader("🔍 检索结果")
             with st.spinner("检索知识库..."):
-                results = st.session_state.vector_store.search(user_input, top_k=top_k)
+                results = vector_store.search(user_input, top_k=top_k)
                 if not results:
                     st.info("无相关结果")
                 else:
@@ -403,7 +439,7 @@ def main():
             with col_ref:
                 st.markdown("**📚 参考来源**")
                 with st.spinner("检索中..."):
-                    results_with_dist = st.session_state.vector_store.search(user_input, top_k=top_k)
+                    results_with_dist = vector_store.search(user_input, top_k=top_k)
                     results = [item for item, _ in results_with_dist]
                     
                     if not results:
@@ -0,0 +1,73 @@
+"""
+降维评测脚本：对比 PCA 与 Matryoshka 截断在不同维度下相对全维索引的 recall@k
+
+从现有的 db/knowledge.index（未降维）中取出全部向量，随机留出一部分作为查询，
+以全维精确检索的结果为基准，逐个维度拟合降维变换后做精确检索，报告召回率、
+向量占用与单条查询延迟。无需加载 Embedding 模型。
+
+用法:
+    python bench_dim.py [--dims 64,128,256,384,512,768] [--queries 500] [--k 10]
+"""
+import argparse
+import os
+import time
+import numpy as np
+import faiss
+from bench_index import load_vectors, recall_at_k
+from config import INDEX_PATH, IVF_TRAIN_SIZE
+from dim_reduction import DimReducer
+
+
+def exact_search(base: np.ndarray, queries: np.ndarray, k: int):
+    """Flat L2 精确检索，返回 (结果 id, 单条查询平均毫秒)"""
+    index = faiss.IndexFlatL2(base.shape[1])
+    index.add(base)
+    start = time.perf_counter()
+    labels = np.vstack([index.search(queries[i:i + 1], k)[1] for i in range(len(queries))])
+    return labels, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="降维维度与 recall@k 评测")
+    parser.add_argument("--index", default=INDEX_PATH, help="作为数据源的未降维 Flat 索引路径")
+    parser.add_argument("--dims", default="64,128,256,384,512,768", help="逗号分隔的目标维度")
+    parser.add_argument("--queries", type=int, default=500, help="留出作为查询的向量数")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 中的 k")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    reducer_path = os.path.splitext(args.index)[0] + ".reducer.npz"
+    if os.path.exists(reducer_path):
+        print(f"✗ {args.index} 已经过降维（{reducer_path}），请用未降维的索引评测")
+        return
+
+    vectors = load_vectors(args.index)
+    rng = np.random.default_rng(args.seed)
+    perm = rng.permutation(len(vectors))
+    queries = np.ascontiguousarray(vectors[perm[:args.queries]])
+    base = np.ascontiguousarray(vectors[perm[args.queries:]])
+    full_dim = base.shape[1]
+    # PCA 与建库时一样只用不超过 IVF_TRAIN_SIZE 条样本拟合
+    sample = base[:IVF_TRAIN_SIZE]
+    print(f"库向量: {len(base)} 条，查询: {len(queries)} 条，k={args.k}，原始维度 {full_dim}\n")
+
+    ground_truth, full_ms = exact_search(base, queries, args.k)
+    rows = [("-", full_dim, 1.0, full_ms, base.nbytes / 1024 / 1024)]
+    for dim in [int(d) for d in args.dims.split(",") if 0 < int(d) < full_dim]:
+        for kind in ("pca", "truncate"):
+            reducer = DimReducer.fit(kind, sample, dim)
+            reduced = reducer.transform(base)
+            labels, ms = exact_search(reduced, reducer.transform(queries), args.k)
+            rows.append((kind, dim, recall_at_k(ground_truth, labels, args.k), ms, reduced.nbytes / 1024 / 1024))
+
+    print("="*68)
+    print(f"{'降维方式':<12}{'维度':>8}{f'recall@{args.k}':>12}{'查询(ms)':>12}{'向量(MB)':>12}{'压缩比':>10}")
+    print("-"*68)
+    for kind, dim, recall, ms, size_mb in rows:
+        print(f"{kind:<12}{dim:>8}{recall:>12.4f}{ms:>12.3f}{size_mb:>12.2f}{full_dim / dim:>10.1f}x")
+    print("="*68)
+    print("注: 以全维 Flat 精确检索为基准；选定维度后设置 DIM_REDUCTION 与 REDUCED_DIM 并全量重建索引")
+
+
+if __name__ == "__main__":
+    main()
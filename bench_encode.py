@@ -0,0 +1,146 @@
+"""
+编码吞吐评测脚本
+
+1. 单进程下对比三种批处理方式：文件顺序固定 64 条一批、整体调用 encode(batch_size=64)（原建库方式）、
+   按 token 长度分桶（ENCODE_TOKEN_BUDGET / ENCODE_MAX_BATCH）
+2. 多进程编码池（EncodePool）在不同进程数下的吞吐与并行效率
+
+从结构化 JSONL 中取出检索文本（与建库时一致），不经过向量缓存，直接计时编码。
+每个进程数的编码池先预热（加载模型）再计时，启动耗时单独列出。
+
+用法:
+    python bench_encode.py [--limit 4000] [--workers 1,2,4,8] [--threads 1] [--backend torch]
+"""
+import argparse
+import os
+import time
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from config import (
+    EMBEDDING_MODEL, MODEL_CACHE_DIR, LOCAL_FILES_ONLY, PROCESSED_DATA_DIR, ONNX_THREADS,
+    ENCODE_TOKEN_BUDGET, ENCODE_MAX_BATCH,
+)
+from encode_pool import EncodePool
+from length_batching import encode_bucketed, fixed_batches, length_batches, padding_efficiency, token_lengths
+from metadata_store import iter_jsonl
+from onnx_encoder import OnnxEncoder, EMBEDDING_BACKENDS
+from vector_store import build_search_text
+
+
+def default_workers() -> str:
+    """1, 2, 4, ... 直到 CPU 核心数"""
+    cpus = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return ",".join(map(str, counts))
+
+
+def encode_fixed(encoder, texts, batch_size: int) -> np.ndarray:
+    """文件顺序固定大小分批，每批单独调用一次 encode"""
+    return np.concatenate([
+        np.asarray(encoder.encode([texts[i] for i in batch], batch_size=len(batch)), dtype='float32')
+        for batch in fixed_batches(len(texts), batch_size)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding 编码吞吐评测")
+    parser.add_argument("--data", default=os.path.join(PROCESSED_DATA_DIR, "structured_data.jsonl"))
+    parser.add_argument("--limit", type=int, default=4000, help="参与评测的文本数")
+    parser.add_argument("--workers", default=default_workers(), help="逗号分隔的进程数列表，留空跳过多进程评测")
+    parser.add_argument("--threads", type=int, default=1, help="每个进程的算子内线程数（0 = 按核心数平均分配）")
+    parser.add_argument("--backend", default="torch", choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--token-budget", type=int, default=ENCODE_TOKEN_BUDGET)
+    parser.add_argument("--max-batch", type=int, default=ENCODE_MAX_BATCH)
+    args = parser.parse_args()
+
+    texts = []
+    for item in iter_jsonl(args.data):
+        texts.append(build_search_text(item))
+        if len(texts) >= args.limit:
+            break
+    print(f"评测文本: {len(texts)} 条（{args.data}），后端: {args.backend}，CPU 核心: {os.cpu_count()}\n")
+
+    if args.backend == "onnx_int8":
+        encoder = OnnxEncoder(EMBEDDING_MODEL, cache_folder=MODEL_CACHE_DIR,
+                              local_files_only=LOCAL_FILES_ONLY, threads=ONNX_THREADS)
+    else:
+        encoder = SentenceTransformer(EMBEDDING_MODEL, cache_folder=MODEL_CACHE_DIR,
+                                      local_files_only=LOCAL_FILES_ONLY, device="cpu")
+    encoder.encode(texts[:64], batch_size=64)
+
+    # 1. 批处理方式对比
+    lengths = token_lengths(encoder, texts)
+    bucketed = length_batches(lengths, args.token_budget, args.max_batch)
+    fixed = fixed_batches(len(texts), 64)
+    methods = [
+        ("固定64(文件顺序)", len(fixed), padding_efficiency(lengths, fixed),
+         lambda: encode_fixed(encoder, texts, 64)),
+        ("固定64(整体调用)", len(fixed), None,
+         lambda: np.asarray(encoder.encode(texts, batch_size=64), dtype='float32')),
+        ("按token分桶", len(bucketed), padding_efficiency(lengths, bucketed),
+         lambda: encode_bucketed(encoder, texts, args.token_budget, args.max_batch)),
+    ]
+    print(f"token 长度: 平均 {lengths.mean():.1f}，中位数 {np.median(lengths):.0f}，最大 {lengths.max()}；"
+          f"分桶预算 {args.token_budget} tokens，每批最多 {args.max_batch} 条")
+    batching_rows = []
+    reference = None
+    for name, num_batches, efficiency, run in methods:
+        start = time.perf_counter()
+        embeddings = run()
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = embeddings
+        drift = float(np.abs(embeddings - reference).max())
+        batching_rows.append((name, num_batches, efficiency, len(texts) / seconds, drift))
+
+    print("="*80)
+    print(f"{'批处理方式':<18}{'批次数':>8}{'填充效率':>12}{'条/秒':>12}{'相对文件顺序':>14}{'最大误差':>12}")
+    print("-"*80)
+    for name, num_batches, efficiency, throughput, drift in batching_rows:
+        efficiency = f"{efficiency:.1%}" if efficiency is not None else "-"
+        print(f"{name:<18}{num_batches:>8}{efficiency:>12}{throughput:>12.1f}"
+              f"{throughput / batching_rows[0][3]:>14.2f}{drift:>12.1e}")
+    print("="*80)
+    print("注: 填充效率 = 有效 token / 补齐后 token；整体调用时 sentence-transformers 内部会先按字符数排序\n")
+    bucketed_seconds = len(texts) / batching_rows[-1][3]
+    del encoder
+
+    # 2. 多进程编码池（进程内同样按 token 分桶）
+    if not args.workers:
+        return
+    rows = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        start = time.perf_counter()
+        with EncodePool(EMBEDDING_MODEL, workers, args.threads, cache_folder=MODEL_CACHE_DIR,
+                        local_files_only=LOCAL_FILES_ONLY, backend=args.backend) as pool:
+            # 预热：让每个进程都完成模型加载
+            pool.encode(texts[:workers * 256], args.token_budget, args.max_batch)
+            startup_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            embeddings = pool.encode(texts, args.token_budget, args.max_batch)
+            seconds = time.perf_counter() - start
+            threads = pool.threads
+        rows.append((workers, threads, seconds, startup_seconds, float(np.abs(embeddings - reference).max())))
+
+    print("="*96)
+    print(f"{'进程数':<8}{'线程/进程':>10}{'条/秒':>12}{'耗时(s)':>12}{'启动(s)':>10}"
+          f"{'相对首行':>12}{'并行效率':>10}{'相对单进程':>12}{'最大误差':>10}")
+    print("-"*96)
+    first_workers, _, first_seconds, _, _ = rows[0]
+    for workers, threads, seconds, startup_seconds, drift in rows:
+        speedup = first_seconds / seconds
+        efficiency = speedup / (workers / first_workers)
+        print(f"{workers:<8}{threads:>10}{len(texts) / seconds:>12.1f}{seconds:>12.2f}{startup_seconds:>10.2f}"
+              f"{speedup:>12.2f}{efficiency:>10.0%}{bucketed_seconds / seconds:>12.2f}{drift:>10.1e}")
+    print("="*96)
+    print("注: 相对首行 = 相对进程数列表第一项的加速比；并行效率 = 加速比 / 进程数倍数；"
+          "相对单进程 = 相对单进程按 token 分桶；启动耗时不计入吞吐")
+
+
+if __name__ == "__main__":
+    main()
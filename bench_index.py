@@ -0,0 +1,174 @@
+"""
+索引后端评测脚本：对比各 ANN 索引与精确 Flat 索引的 recall@k 与检索延迟
+
+从现有索引的全精度向量文件（EXACT_RERANK 建库时写出）或 Flat 索引中取出全部向量，随机留出一部分作为查询，
+其余向量分别构建 INDEX_TYPES 中的各类索引，以 Flat 的结果为基准计算召回率。
+对压缩索引额外给出"压缩检索 + 全精度精确重排"的结果。无需加载 Embedding 模型。
+
+用法:
+    python bench_index.py [--queries 500] [--k 10]
+"""
+import argparse
+import os
+import time
+import numpy as np
+import faiss
+from config import INDEX_PATH, RERANK_FACTOR, VECTORS_DTYPE, VECTORS_PATH, VECTOR_IDS_PATH
+from vector_store import (
+    INDEX_TYPES, create_index, train_index, index_kind, make_search_params, rerank_exact, sidecar_path,
+)
+
+
+# 各后端需要扫描的检索参数
+NPROBE_SWEEP = [1, 4, 8, 16, 32, 64]
+EF_SEARCH_SWEEP = [16, 32, 64, 128, 256]
+
+# 有损压缩的索引类型，额外评测精确重排
+COMPRESSED_TYPES = ("sq8", "pq", "ivf_pq", "ivf_sq8")
+
+
+def index_ids(index) -> np.ndarray:
+    """索引中全部向量的 id（IndexIDMap2 读 id 映射表，IVF 读各倒排表）"""
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        # 旧版索引按位置寻址
+        return np.arange(index.ntotal, dtype='int64')
+    invlists = ivf.invlists
+    return np.concatenate([np.empty(0, dtype='int64')] + [
+        faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+        for i in range(ivf.nlist) if invlists.list_size(i)
+    ])
+
+
+def load_vectors(index_path: str) -> np.ndarray:
+    """
+    取出索引中全部记录的原始向量
+
+    优先读取与索引放在一起的全精度向量文件（适用于任何索引类型）；没有该文件时只能从 Flat 索引还原，
+    IVF / PQ / SQ / HNSW 索引不保存（或只保存有损的）原始向量，直接报错。
+    """
+    # downcast 得到的对象不持有底层索引，read_index 的返回值需要保留到函数结束
+    loaded = faiss.read_index(index_path)
+    index = faiss.downcast_index(loaded)
+    print(f"✓ 已加载索引: {index_path} ({index.ntotal} 条, {index.d} 维)")
+
+    vectors_path = sidecar_path(index_path, ".vectors.bin", VECTORS_PATH)
+    ids_path = sidecar_path(index_path, ".vectors.ids", VECTOR_IDS_PATH)
+    if os.path.exists(vectors_path) and os.path.exists(ids_path):
+        row_ids = np.fromfile(ids_path, dtype='int64')
+        vectors = np.memmap(vectors_path, dtype=VECTORS_DTYPE, mode='r', shape=(len(row_ids), index.d))
+        # 向量文件只追加：同一 id 以最后一行为准，已删除记录的旧行不在索引中
+        order = np.argsort(row_ids, kind='stable')
+        sorted_ids = row_ids[order]
+        last = np.append(sorted_ids[1:] != sorted_ids[:-1], True)
+        sorted_ids, rows = sorted_ids[last], order[last]
+        rows = np.sort(rows[np.isin(sorted_ids, index_ids(index))])
+        print(f"✓ 已读取全精度向量: {vectors_path} ({len(rows)} 条, {VECTORS_DTYPE})")
+        return np.asarray(vectors[rows], dtype='float32')
+
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if not isinstance(inner, faiss.IndexFlat):
+        raise SystemExit(f"✗ {index_path} 是 {type(inner).__name__} 索引，无法还原原始向量，"
+                         f"且没有全精度向量文件 {vectors_path}；请以 EXACT_RERANK=1 重建索引，"
+                         f"或用 --index 指定一个 flat 索引")
+    # Flat 索引按位置存放向量，IndexIDMap2 的稳定 id 不影响按位置读取
+    return inner.reconstruct_n(0, inner.ntotal)
+
+
+def recall_at_k(ground_truth: np.ndarray, result: np.ndarray, k: int) -> float:
+    """recall@k：结果前 k 个中命中真实前 k 个的比例"""
+    hits = 0
+    for gt_row, res_row in zip(ground_truth[:, :k], result[:, :k]):
+        hits += len(set(gt_row.tolist()) & set(res_row.tolist()))
+    return hits / (len(ground_truth) * k)
+
+
+def time_search(index, queries: np.ndarray, k: int, params=None):
+    """逐条查询计时（模拟线上单请求场景），返回 (结果 id, 平均毫秒, p95 毫秒)"""
+    labels = np.empty((len(queries), k), dtype='int64')
+    latencies = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, labels[i:i + 1] = index.search(queries[i:i + 1], k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return labels, float(np.mean(latencies)), float(np.percentile(latencies, 95))
+
+
+def time_search_rerank(index, queries: np.ndarray, k: int, full_vectors: np.ndarray, params=None):
+    """压缩索引取 k*RERANK_FACTOR 个候选，再用全精度向量精确重排"""
+    labels = np.full((len(queries), k), -1, dtype='int64')
+    latencies = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, candidates = index.search(queries[i:i + 1], k * RERANK_FACTOR, params=params)
+        _, ids = rerank_exact(queries[i], candidates[0], full_vectors, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        labels[i, :len(ids)] = ids
+    return labels, float(np.mean(latencies)), float(np.percentile(latencies, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN 索引 recall@k 与延迟评测")
+    parser.add_argument("--index", default=INDEX_PATH, help="作为数据源的索引路径（flat 索引，或带全精度向量文件的任意索引）")
+    parser.add_argument("--queries", type=int, default=500, help="留出作为查询的向量数")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 中的 k")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.index)
+    rng = np.random.default_rng(args.seed)
+    perm = rng.permutation(len(vectors))
+    queries = np.ascontiguousarray(vectors[perm[:args.queries]])
+    base = np.ascontiguousarray(vectors[perm[args.queries:]])
+    dimension = base.shape[1]
+    full_vectors = base.astype(VECTORS_DTYPE)
+
+    print(f"库向量: {len(base)} 条，查询: {len(queries)} 条，k={args.k}\n")
+
+    rows = []
+    ground_truth = None
+    for index_type in INDEX_TYPES:
+        index = create_index(index_type, dimension, len(base))
+        start = time.perf_counter()
+        train_index(index, base)
+        index.add_with_ids(base, np.arange(len(base), dtype='int64'))
+        build_seconds = time.perf_counter() - start
+        size_mb = len(faiss.serialize_index(index)) / 1024 / 1024
+        kind = index_kind(index)
+
+        if kind == "ivf":
+            sweep = [("nprobe", v, make_search_params(kind, args.k, nprobe=v)) for v in NPROBE_SWEEP]
+        elif kind == "hnsw":
+            sweep = [("efSearch", v, make_search_params(kind, args.k, ef_search=v)) for v in EF_SEARCH_SWEEP]
+        else:
+            sweep = [("-", "-", None)]
+
+        for param_name, param_value, params in sweep:
+            param = f"{param_name}={param_value}" if params is not None else "-"
+            labels, mean_ms, p95_ms = time_search(index, queries, args.k, params)
+            if ground_truth is None:
+                # 第一个后端是 flat，即精确结果
+                ground_truth = labels
+            rows.append((index_type, param, recall_at_k(ground_truth, labels, args.k),
+                         mean_ms, p95_ms, size_mb, build_seconds))
+
+            if index_type in COMPRESSED_TYPES:
+                labels, mean_ms, p95_ms = time_search_rerank(index, queries, args.k, full_vectors, params)
+                rows.append((f"{index_type}+rerank", param, recall_at_k(ground_truth, labels, args.k),
+                             mean_ms, p95_ms, size_mb, build_seconds))
+
+    print("="*96)
+    print(f"{'索引类型':<16}{'检索参数':<16}{f'recall@{args.k}':>12}{'平均(ms)':>12}{'p95(ms)':>12}"
+          f"{'索引(MB)':>14}{'构建(s)':>12}")
+    print("-"*96)
+    for index_type, param, recall, mean_ms, p95_ms, size_mb, build_seconds in rows:
+        print(f"{index_type:<16}{param:<16}{recall:>12.4f}{mean_ms:>12.3f}{p95_ms:>12.3f}"
+              f"{size_mb:>14.2f}{build_seconds:>12.2f}")
+    print("="*96)
+    print(f"注: +rerank 行的全精度向量以 {VECTORS_DTYPE} 内存映射存放于磁盘，不计入索引内存")
+
+
+if __name__ == "__main__":
+    main()
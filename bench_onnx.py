@@ -0,0 +1,104 @@
+"""
+ONNX int8 后端评测脚本：对比 PyTorch 全精度编码器与 ONNX Runtime int8 量化编码器
+
+报告三项指标：
+- 单条查询编码延迟（batch=1，模拟线上检索）与建库吞吐（batch=64）的加速比
+- 同一文本两种后端向量的余弦相似度（漂移）
+- 在评测文本内部做近邻检索时，int8 向量的 recall@k（以全精度向量的近邻为准）
+
+用法:
+    python bench_onnx.py [--limit 2000] [--queries 200] [--k 10]
+"""
+import argparse
+import os
+import time
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from config import EMBEDDING_MODEL, MODEL_CACHE_DIR, LOCAL_FILES_ONLY, PROCESSED_DATA_DIR, ONNX_THREADS
+from metadata_store import iter_jsonl
+from onnx_encoder import OnnxEncoder
+from vector_store import build_search_text
+
+
+def time_queries(encoder, queries, repeat: int = 1):
+    """逐条编码计时，返回 (平均毫秒, p95 毫秒)"""
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            encoder.encode([query], batch_size=1)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.mean(latencies)), float(np.percentile(latencies, 95))
+
+
+def time_batch(encoder, texts, batch_size: int):
+    """批量编码，返回 (向量, 条/秒)"""
+    start = time.perf_counter()
+    embeddings = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype='float32')
+    return embeddings, len(texts) / (time.perf_counter() - start)
+
+
+def neighbors(vectors: np.ndarray, k: int) -> np.ndarray:
+    """评测文本内部的 k 近邻（余弦，排除自身）"""
+    normed = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    sims = normed @ normed.T
+    np.fill_diagonal(sims, -np.inf)
+    return np.argsort(-sims, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyTorch 与 ONNX int8 Embedding 后端对比")
+    parser.add_argument("--data", default=os.path.join(PROCESSED_DATA_DIR, "structured_data.jsonl"))
+    parser.add_argument("--limit", type=int, default=2000, help="建库吞吐与漂移评测的文本数")
+    parser.add_argument("--queries", type=int, default=200, help="单条延迟评测的查询数（取原始提示词）")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    texts, queries = [], []
+    for item in iter_jsonl(args.data):
+        texts.append(build_search_text(item))
+        if len(queries) < args.queries and item.get("raw"):
+            queries.append(item["raw"])
+        if len(texts) >= args.limit:
+            break
+    print(f"评测文本: {len(texts)} 条，查询: {len(queries)} 条（{args.data}）\n")
+
+    encoders = [
+        ("torch fp32", SentenceTransformer(EMBEDDING_MODEL, cache_folder=MODEL_CACHE_DIR,
+                                           local_files_only=LOCAL_FILES_ONLY, device="cpu")),
+        ("onnx int8", OnnxEncoder(EMBEDDING_MODEL, cache_folder=MODEL_CACHE_DIR,
+                                  local_files_only=LOCAL_FILES_ONLY, threads=ONNX_THREADS)),
+    ]
+
+    rows = []
+    embeddings = {}
+    for name, encoder in encoders:
+        # 预热
+        encoder.encode(queries[:8], batch_size=8)
+        mean_ms, p95_ms = time_queries(encoder, queries)
+        embeddings[name], throughput = time_batch(encoder, texts, args.batch_size)
+        rows.append((name, mean_ms, p95_ms, throughput))
+
+    reference, quantized = embeddings["torch fp32"], embeddings["onnx int8"]
+    cosine = (reference * quantized).sum(axis=1) / np.maximum(
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(quantized, axis=1), 1e-12)
+    k = min(args.k, len(texts) - 1)
+    truth, approx = neighbors(reference, k), neighbors(quantized, k)
+    recall = np.mean([len(set(t) & set(a)) / k for t, a in zip(truth.tolist(), approx.tolist())])
+
+    base_mean, base_p95, base_throughput = rows[0][1:]
+    print("="*84)
+    print(f"{'后端':<14}{'查询平均(ms)':>14}{'查询p95(ms)':>14}{'建库(条/秒)':>14}{'查询加速':>12}{'建库加速':>12}")
+    print("-"*84)
+    for name, mean_ms, p95_ms, throughput in rows:
+        print(f"{name:<14}{mean_ms:>14.2f}{p95_ms:>14.2f}{throughput:>14.1f}"
+              f"{base_mean / mean_ms:>12.2f}{throughput / base_throughput:>12.2f}")
+    print("="*84)
+    print(f"余弦漂移: 平均 {cosine.mean():.5f}，最小 {cosine.min():.5f}，"
+          f"P1 {np.percentile(cosine, 1):.5f}（1.0 表示完全一致）")
+    print(f"近邻一致性: int8 向量的 recall@{k} = {recall:.4f}（以全精度向量的近邻为准）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+启动耗时评测脚本：统计各入口脚本的模块导入耗时（基于 python -X importtime）
+
+只执行入口脚本顶层的 import 语句（不运行 main），在独立子进程中用 -X importtime 计时，
+报告总导入耗时、子进程总耗时，以及耗时最多的第三方依赖。每个入口重复多次取最小值。
+用 --json 保存结果，便于在改动前后对比。
+
+用法:
+    python bench_startup.py [--runs 3] [--top 5] [--json startup.json] [入口脚本 ...]
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+ENTRY_POINTS = ("app.py", "process_data.py", "build_index.py", "test_ollama_only.py", "test_connection.py")
+
+# -X importtime 的输出格式：import time: <自身微秒> | <累计微秒> | <每层缩进两个空格><模块名>
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def entry_imports(path: str) -> str:
+    """入口脚本顶层的 import 语句"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def project_modules() -> set:
+    return {os.path.splitext(name)[0] for name in os.listdir(ROOT_DIR) if name.endswith(".py")}
+
+
+def measure(code: str) -> Optional[Dict]:
+    """
+    在子进程中执行 code 并解析 importtime 输出
+
+    Returns:
+        {"import_ms", "process_ms", "packages": {顶层第三方包: 累计毫秒}}；导入失败时返回 None
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=ROOT_DIR, capture_output=True, text=True)
+    process_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        print(f"✗ 导入失败: {errors[-1] if errors else result.returncode}")
+        return None
+
+    local = project_modules()
+    import_us = 0
+    packages = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)) // 2, match.group(4)
+        if depth == 0:
+            import_us += cumulative
+        # 第三方包只统计顶层包本身（累计耗时已包含其子模块）；被其他包间接导入时与上层有重叠
+        if ("." not in name and name not in local and name not in sys.stdlib_module_names
+                and not name.startswith("_") and name not in packages):
+            packages[name] = cumulative / 1000
+    return {"import_ms": import_us / 1000, "process_ms": process_ms, "packages": packages}
+
+
+def best_of(code: str, runs: int) -> Optional[Dict]:
+    """重复 runs 次取导入耗时最小的一次（首次运行可能包含 .pyc 编译）"""
+    results = []
+    for _ in range(runs):
+        result = measure(code)
+        if result is None:
+            return None
+        results.append(result)
+    return min(results, key=lambda r: r["import_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入口脚本启动导入耗时评测")
+    parser.add_argument("entries", nargs="*", default=list(ENTRY_POINTS), help="入口脚本（默认全部）")
+    parser.add_argument("--runs", type=int, default=3, help="每个入口重复次数，取最小值")
+    parser.add_argument("--top", type=int, default=5, help="列出耗时最多的第三方依赖个数")
+    parser.add_argument("--json", help="把结果保存为 JSON")
+    args = parser.parse_args()
+
+    # 先编译一遍 .pyc，避免第一个入口吃亏
+    measure("pass")
+    baseline = best_of("pass", args.runs)
+    rows: List = [("(空解释器)", baseline)]
+    for entry in args.entries:
+        print(f"正在评测: {entry}...")
+        rows.append((entry, best_of(entry_imports(os.path.join(ROOT_DIR, entry)), args.runs)))
+
+    print("\n" + "="*100)
+    print(f"{'入口':<22}{'导入(ms)':>10}{'进程(ms)':>10}  耗时最多的第三方依赖 (累计 ms)")
+    print("-"*100)
+    for entry, result in rows:
+        if result is None:
+            print(f"{entry:<22}{'失败':>10}")
+            continue
+        heaviest = sorted(((name, ms) for name, ms in result["packages"].items() if ms >= 1),
+                          key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"{entry:<22}{result['import_ms']:>10.1f}{result['process_ms']:>10.1f}  "
+              + ", ".join(f"{name} {ms:.0f}" for name, ms in heaviest))
+    print("="*100)
+    print("注: 导入 = 顶层模块累计导入耗时之和（含解释器自身启动时的导入）；进程 = 子进程从启动到退出的总耗时；"
+          "依赖耗时互有重叠")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({entry: result for entry, result in rows}, f, ensure_ascii=False, indent=2)
+        print(f"✓ 结果已保存: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,53 @@
 """
-索引构建脚本：从 JSONL 文件构建向量索引
+索引构建脚本：从 JSONL 文件构建向量索引（默认使用 data/processed 下的全部文件）
+
+用法:
+    python build_index.py            交互式构建
+    python build_index.py --check    对照 manifest 校验现有索引（重新计算校验和），报告需要重建的部分
+    python build_index.py --rebuild-lexical    从元数据库重建 BM25 索引（VectorStore.upsert / delete 之后）
 """
 import sys
 import os
-from vector_store import VectorStore
-from config import PROCESSED_DATA_DIR, INDEX_PATH, METADATA_PATH
+from vector_store import VectorStore, manifest_config, check_index_files
+from metadata_store import resolve_jsonl_paths
+from manifest import REBUILD, UPDATE, manifest_path_for
+from config import PROCESSED_DATA_DIR, INDEX_PATH, METADATA_DB_PATH, EMBEDDING_MODEL, EMBEDDING_BACKEND, INDEX_TYPE
+
+
+def check():
+    """校验现有索引，返回进程退出码（0 = 一致，1 = 需要更新或重建）；只读 manifest 与文件，不加载模型"""
+    if not os.path.exists(INDEX_PATH):
+        print(f"✗ 索引文件不存在: {INDEX_PATH}")
+        return 1
+    print(f"正在校验: {manifest_path_for(INDEX_PATH)}")
+    issues = check_index_files(INDEX_PATH, manifest_config(EMBEDDING_MODEL, EMBEDDING_BACKEND, INDEX_TYPE),
+                               deep=True)
+    if not issues:
+        print("✓ 索引与 manifest 一致，无需重建")
+        return 0
+    labels = {REBUILD: "需全量重建", UPDATE: "需增量更新"}
+    for level, message in issues:
+        print(f"  [{labels.get(level, '提示')}] {message}")
+    levels = {level for level, _ in issues}
+    if REBUILD in levels:
+        print("\n✗ 请运行 python build_index.py 并选择全量重建")
+    elif UPDATE in levels:
+        print("\n⚠️  请运行 python build_index.py 并选择增量模式")
+    return 1 if levels & {REBUILD, UPDATE} else 0
+
+
+def rebuild_lexical():
+    """重建 BM25 词法索引，返回进程退出码"""
+    store = VectorStore()
+    if not store.exists():
+        print(f"✗ 索引文件不存在: {INDEX_PATH}")
+        return 1
+    try:
+        store.rebuild_lexical()
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+    return 0
 
 
 def main():
@@ -14,35 +57,31 @@ def main():
     print("="*60)
     
     # 查找 JSONL 文件
-    jsonl_files = []
-    if os.path.exists(PROCESSED_DATA_DIR):
-        for file in os.listdir(PROCESSED_DATA_DIR):
-            if file.endswith('.jsonl'):
-                jsonl_files.append(os.path.join(PROCESSED_DATA_DIR, file))
+    jsonl_files = resolve_jsonl_paths(PROCESSED_DATA_DIR) if os.path.exists(PROCESSED_DATA_DIR) else []
     
     if not jsonl_files:
         print(f"\n✗ 未找到 JSONL 文件，请先运行 ETL Pipeline 处理数据")
         print(f"  数据目录: {PROCESSED_DATA_DIR}")
         return
     
-    # 选择文件
+    # 选择文件（默认使用全部文件，分块流式读取）
     if len(jsonl_files) == 1:
-        selected_file = jsonl_files[0]
-        print(f"\n找到文件: {selected_file}")
+        selected_files = jsonl_files
+        print(f"\n找到文件: {jsonl_files[0]}")
     else:
         print("\n找到多个 JSONL 文件:")
         for i, f in enumerate(jsonl_files, 1):
             print(f"  {i}. {f}")
         
-        choice = input("\n请选择文件编号 (直接回车使用第一个): ").strip()
+        choice = input("\n请选择文件编号 (直接回车使用全部文件): ").strip()
         if choice:
             try:
-                selected_file = jsonl_files[int(choice) - 1]
+                selected_files = [jsonl_files[int(choice) - 1]]
             except (ValueError, IndexError):
-                print("无效选择，使用第一个文件")
-                selected_file = jsonl_files[0]
+                print("无效选择，使用全部文件")
+                selected_files = jsonl_files
         else:
-            selected_file = jsonl_files[0]
+            selected_files = jsonl_files
     
     # 检查现有索引
     store = VectorStore()
@@ -53,25 +92,34 @@ def main():
             store.load_index()
             existing_count = store.index.ntotal
             print(f"\n检测到现有索引: {existing_count} 条记录")
+        except ValueError as e:
+            # manifest 校验失败：增量模式会自动改为全量重建
+            print(f"\n⚠️  {e}")
+            existing_count = 0
         except:
             existing_count = 0
     else:
         existing_count = 0
     
     # 构建索引
-    print(f"\n使用文件: {selected_file}")
+    print(f"\n使用文件: {', '.join(selected_files)}")
     print(f"输出索引: {INDEX_PATH}")
-    print(f"输出元数据: {METADATA_PATH}")
+    print(f"输出元数据: {METADATA_DB_PATH}")
     
+    prune = False
     if has_existing:
         print("\n构建模式:")
-        print("  1. 增量模式 (推荐) - 只处理新增数据，快速更新")
+        print("  1. 增量模式 (推荐) - 只处理新增和内容变化的数据，快速更新")
         print("  2. 全量重建 - 删除旧索引，重新构建全部数据")
+        print("  3. 同步模式 - 增量更新，并删除文件中已不存在的记录")
         
-        mode_choice = input("\n请选择模式 (1/2，默认1): ").strip()
+        mode_choice = input("\n请选择模式 (1/2/3，默认1): ").strip()
         incremental = mode_choice != '2'
+        prune = mode_choice == '3'
         
-        if incremental:
+        if prune:
+            print("✓ 使用同步模式")
+        elif incremental:
             print("✓ 使用增量模式")
         else:
             print("⚠️  使用全量重建模式")
@@ -85,7 +133,7 @@ def main():
         return
     
     try:
-        store.build_index(selected_file, incremental=incremental)
+        store.build_index(selected_files, incremental=incremental, prune=prune)
         print("\n✓ 构建完成！")
     except Exception as e:
         print(f"\n✗ 构建失败: {e}")
@@ -94,5 +142,9 @@ def main():
 
 
 if __name__ == "__main__":
+    if "--check" in sys.argv[1:]:
+        sys.exit(check())
+    if "--rebuild-lexical" in sys.argv[1:]:
+        sys.exit(rebuild_lexical())
     main()
 
@@ -22,6 +22,10 @@ MODEL_CACHE_DIR = str(BASE_DIR / "models")
 # 离线模式开关：设置为 "1" 时仅使用本地文件，不访问网络
 LOCAL_FILES_ONLY = os.getenv("LOCAL_FILES_ONLY", "0") == "1"
 
+# Embedding 推理后端：torch（PyTorch 全精度）或 onnx_int8（ONNX Runtime int8 动态量化，CPU 上更快，首次使用时导出到 models/onnx/）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # onnxruntime 算子内线程数，0 = 自动
+
 # Ollama 保活配置（降低 TTFT）
 OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "5m")  # 示例：30m、2h；设置为 "0" 关闭保活
 
@@ -38,8 +42,92 @@ PROCESSED_DATA_DIR = os.path.join(DATA_DIR, "processed")  # 存放处理后的 J
 # 向量索引配置
 DB_DIR = "db"  # 向量索引数据库目录
 INDEX_PATH = os.path.join(DB_DIR, "knowledge.index")
-METADATA_PATH = os.path.join(DB_DIR, "metadata.jsonl")
+METADATA_DB_PATH = os.path.join(DB_DIR, "metadata.db")  # SQLite 元数据库，按索引 id 随机读取
+METADATA_PATH = os.path.join(DB_DIR, "metadata.jsonl")  # 旧版 JSONL 元数据，仅用于兼容读取与迁移
+METADATA_OFFSETS_PATH = os.path.join(DB_DIR, "metadata.offsets")  # 旧版 JSONL 的字节偏移表
 VECTOR_DIM = 1024  # bge-m3 的维度，如果使用其他模型需要调整
+# 可选降维：none（默认）、pca（建库时拟合 PCA 投影）或 truncate（Matryoshka 式截断前 d 维），降维后重新归一化
+# 变换矩阵与索引一起保存（db/knowledge.reducer.npz），检索时自动作用于查询；修改后需全量重建索引
+DIM_REDUCTION = os.getenv("DIM_REDUCTION", "none")
+REDUCED_DIM = int(os.getenv("REDUCED_DIM", "256"))
+
+# ANN 索引后端配置
+# 可选: flat（精确暴力检索，默认）、ivf_flat、ivf_pq、hnsw
+# 压缩索引: sq8（8bit 标量量化，约 1/4 内存）、pq（乘积量化）、ivf_sq8，建议配合 EXACT_RERANK 使用
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # IVF 聚类中心数，0 表示按数据量自动选择（约 4*sqrt(N)）
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))  # 检索时探查的聚类数，越大召回越高、速度越慢
+IVF_TRAIN_SIZE = int(os.getenv("IVF_TRAIN_SIZE", "100000"))  # 训练样本上限，超过时随机采样
+PQ_M = int(os.getenv("PQ_M", "64"))  # PQ 子量化器个数，必须整除向量维度
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))  # 每个子量化器的编码位数
+HNSW_M = int(os.getenv("HNSW_M", "32"))  # HNSW 每个节点的邻居数
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))  # 建图时的搜索宽度
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))  # 检索时的搜索宽度，越大召回越高、速度越慢
+
+# 精确重排配置：内存中只保留压缩索引，从磁盘内存映射的全精度向量中对候选集精确重排
+EXACT_RERANK = os.getenv("EXACT_RERANK", "0") == "1"
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))  # 从压缩索引中多取的候选倍数
+VECTORS_PATH = os.path.join(DB_DIR, "vectors.bin")  # 全精度向量文件（追加写入，逐行存储）
+VECTOR_IDS_PATH = os.path.join(DB_DIR, "vectors.ids")  # 向量文件每行对应的记录 id（int64）
+VECTORS_DTYPE = os.getenv("VECTORS_DTYPE", "float16")  # float16 或 float32
+
+# 建库时每次读取、编码并写入的记录数，决定建库的内存占用
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "2048"))
+# 建库时的多进程编码：ENCODE_WORKERS > 1 时把文本分片交给多个进程并行编码（0/1 = 单进程，-1 = 每个 CPU 核心一个进程）
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "0"))
+ENCODE_THREADS_PER_WORKER = int(os.getenv("ENCODE_THREADS_PER_WORKER", "0"))  # 每个进程的算子内线程数，0 = 按核心数平均分配
+# 建库编码按 token 长度分桶：每批 (最长 token 数 × 条数) 不超过预算，短文本批次更大，长文本批次更小
+ENCODE_TOKEN_BUDGET = int(os.getenv("ENCODE_TOKEN_BUDGET", "8192"))
+ENCODE_MAX_BATCH = int(os.getenv("ENCODE_MAX_BATCH", "256"))
+
+# 向量缓存：按 (模型, 检索文本哈希) 持久化 Embedding，重建或切换索引类型时只编码新文本
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+EMBEDDING_CACHE_DIR = os.path.join(DB_DIR, "embedding_cache")
+
+# 查询缓存：进程内 LRU，缓存归一化查询文本的向量（以及 FAISS 候选），Streamlit 重跑时跳过编码
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))  # 设置为 0 关闭
+QUERY_CANDIDATE_CACHE = os.getenv("QUERY_CANDIDATE_CACHE", "1") == "1"
+
+# 近重复检测：建库时用 MinHash/LSH 对 raw 文本的字符 shingle 聚类，检索时同簇只保留一条
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.29"))  # shingle Jaccard 阈值：建库时与簇代表比较，检索时与已采纳结果比较
+NEAR_DUP_SHINGLE = int(os.getenv("NEAR_DUP_SHINGLE", "3"))  # shingle 字符数
+NEAR_DUP_PERMUTATIONS = int(os.getenv("NEAR_DUP_PERMUTATIONS", "64"))  # MinHash 签名长度
+NEAR_DUP_BANDS = int(os.getenv("NEAR_DUP_BANDS", "32"))  # LSH 分段数，需整除签名长度
+
+# MMR 多样性重排：在候选向量上按 λ·相关度 − (1−λ)·与已选结果的相似度 重新排序
+MMR_ENABLED = os.getenv("MMR_ENABLED", "0") == "1"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 越大越偏向相关度，1.0 等价于不重排
+
+# 过滤检索：满足条件的记录不超过该数量时，近似索引（IVF/HNSW）改为在这些记录上精确计算距离，
+# 避免选择性很强的过滤条件下近似检索召回不足
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "2048"))
+
+# 混合检索：BM25 词法检索（中文字符二元组）与向量检索的结果用 RRF 融合
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")  # vector / hybrid
+BM25_PATH = os.path.join(DB_DIR, "bm25.npz")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Cross-Encoder 重排：RAG 生成前对候选池重新打分，超出耗时预算时保持向量检索的顺序
+CROSS_ENCODER_RERANK = os.getenv("CROSS_ENCODER_RERANK", "0") == "1"
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "BAAI/bge-reranker-base")
+CROSS_ENCODER_CANDIDATES = int(os.getenv("CROSS_ENCODER_CANDIDATES", "20"))  # 候选池大小
+CROSS_ENCODER_BUDGET_MS = int(os.getenv("CROSS_ENCODER_BUDGET_MS", "400"))  # 单次请求（检索 + 重排）的耗时预算
+CROSS_ENCODER_MAX_LENGTH = int(os.getenv("CROSS_ENCODER_MAX_LENGTH", "256"))  # (查询, 候选) 对的最大 token 数
+
+# 启动加速：以内存映射方式加载索引（页面按需载入），并在后台预读文件页
+MMAP_INDEX = os.getenv("MMAP_INDEX", "1") == "1"
+PREFETCH_ON_LOAD = os.getenv("PREFETCH_ON_LOAD", "1") == "1"
+
+# 检索服务：设置 RETRIEVAL_SERVER_URL 后 app.py / RAGGenerator 通过 HTTP 调用独立的检索进程
+# （python retrieval_server.py），各进程不再各自加载 Embedding 模型与索引
+RETRIEVAL_SERVER_URL = os.getenv("RETRIEVAL_SERVER_URL", "")  # 例如 http://127.0.0.1:8765，留空则进程内检索
+RETRIEVAL_HOST = os.getenv("RETRIEVAL_HOST", "127.0.0.1")
+RETRIEVAL_PORT = int(os.getenv("RETRIEVAL_PORT", "8765"))
+RETRIEVAL_BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5"))  # 合并并发查询的等待窗口
+RETRIEVAL_MAX_BATCH = int(os.getenv("RETRIEVAL_MAX_BATCH", "64"))  # 单批最多查询数，达到后立即检索
+RETRIEVAL_TIMEOUT = int(os.getenv("RETRIEVAL_TIMEOUT", "30"))  # 客户端请求超时（秒）
 
 # RAG 检索配置
 TOP_K = 5  # 检索 Top-K 个相似结果
@@ -47,3 +135,5 @@ TOP_K = 5  # 检索 Top-K 个相似结果
 # 请求配置
 REQUEST_TIMEOUT = 300  # Ollama 请求超时时间（秒）
 MAX_RETRIES = 3  # 最大重试次数
+ETL_CONCURRENCY = int(os.getenv("ETL_CONCURRENCY", "4"))  # ETL 同时在途的 LLM 请求数，1 = 逐条处理；建议与 Ollama 的 OLLAMA_NUM_PARALLEL 一致
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "128"))  # 异步生成（agenerate / astream_generate）的并发连接上限
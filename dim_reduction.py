@@ -0,0 +1,93 @@
+"""
+降维模块：把 Embedding 压缩到更低维度后再入库，索引体积与距离计算量随维度线性下降
+
+- pca: 在建库样本上拟合 PCA 投影矩阵（去均值后投影到方差最大的方向）
+- truncate: Matryoshka 式截断，只保留前 d 维（适合按 Matryoshka 方式训练的模型）
+
+两种方式都会在降维后重新归一化为单位向量。变换矩阵与索引存放在一起，检索时自动作用于查询向量。
+"""
+import os
+import numpy as np
+
+
+DIM_REDUCTIONS = ("none", "pca", "truncate")
+
+
+class DimReducer:
+    """
+    降维变换
+
+    Attributes:
+        kind: pca / truncate
+        input_dim: 模型输出维度
+        output_dim: 降维后的维度
+        mean: PCA 的样本均值（truncate 为 None）
+        components: PCA 投影矩阵 (output_dim, input_dim)，按方差降序（truncate 为 None）
+    """
+
+    def __init__(self, kind: str, input_dim: int, output_dim: int,
+                 mean: np.ndarray = None, components: np.ndarray = None):
+        self.kind = kind
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.mean = mean
+        self.components = components
+
+    @classmethod
+    def fit(cls, kind: str, embeddings: np.ndarray, output_dim: int) -> "DimReducer":
+        """
+        拟合降维变换
+
+        Args:
+            kind: pca / truncate
+            embeddings: 样本向量 (n, input_dim)；truncate 只用到维度
+            output_dim: 目标维度，需小于模型维度
+        """
+        if kind not in DIM_REDUCTIONS or kind == "none":
+            raise ValueError(f"不支持的降维方式: {kind}，可选: pca, truncate")
+        input_dim = embeddings.shape[1]
+        if not 0 < output_dim < input_dim:
+            raise ValueError(f"降维目标维度 {output_dim} 需在 1 到模型维度 {input_dim} 之间")
+        if kind == "truncate":
+            return cls(kind, input_dim, output_dim)
+
+        if len(embeddings) < output_dim:
+            raise ValueError(f"PCA 样本数 ({len(embeddings)}) 少于目标维度 ({output_dim})")
+        embeddings = np.asarray(embeddings, dtype='float64')
+        mean = embeddings.mean(axis=0)
+        centered = embeddings - mean
+        # 协方差矩阵只有 input_dim × input_dim，特征分解比对样本做 SVD 便宜
+        eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered / max(len(embeddings) - 1, 1))
+        top = np.argsort(eigenvalues)[::-1][:output_dim]
+        explained = eigenvalues[top].sum() / max(eigenvalues.sum(), 1e-12)
+        print(f"✓ PCA 拟合完成: {input_dim} → {output_dim} 维，保留方差 {explained:.1%}（样本 {len(embeddings)} 条）")
+        return cls(kind, input_dim, output_dim, mean.astype('float32'),
+                   np.ascontiguousarray(eigenvectors[:, top].T, dtype='float32'))
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        """降维并重新归一化为单位向量"""
+        embeddings = np.asarray(embeddings, dtype='float32')
+        if self.kind == "truncate":
+            reduced = embeddings[:, :self.output_dim]
+        else:
+            reduced = (embeddings - self.mean) @ self.components.T
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        return np.ascontiguousarray(reduced / np.maximum(norms, 1e-12), dtype='float32')
+
+    @classmethod
+    def load(cls, path: str) -> "DimReducer":
+        with np.load(path) as data:
+            kind = str(data["kind"])
+            return cls(kind, int(data["input_dim"]), int(data["output_dim"]),
+                       data["mean"] if kind == "pca" else None,
+                       data["components"] if kind == "pca" else None)
+
+    def save(self, path: str):
+        """原子写入（临时文件名需以 .npz 结尾，否则 np.savez 会自动追加后缀）"""
+        tmp_path = path + ".tmp.npz"
+        arrays = {"kind": np.array(self.kind), "input_dim": np.array(self.input_dim),
+                  "output_dim": np.array(self.output_dim)}
+        if self.kind == "pca":
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
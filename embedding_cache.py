@@ -0,0 +1,118 @@
+"""
+向量缓存模块：按 (模型, 检索文本哈希) 持久化 Embedding，重建索引时只编码从未见过的文本
+"""
+import hashlib
+import os
+import numpy as np
+from typing import List
+
+
+def text_keys(texts: List[str]) -> np.ndarray:
+    """检索文本的 64 位哈希（int64）"""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+         for t in texts],
+        dtype='int64',
+    )
+
+
+class EmbeddingCache:
+    """
+    基于追加文件的 Embedding 磁盘缓存
+
+    每个模型对应两个文件：<model>.f32 逐行存放 float32 向量，<model>.keys 存放对应的文本哈希。
+    打开时只读入哈希并排序用于查找，向量通过内存映射按需读取。
+    建库过程中新写入的哈希先放在内存中的有序增量表里，增量表超过主表的一定比例时才合并，
+    合并次数随数据量按几何级数增长；向量文件在读取到映射范围之外的行时才重新映射。
+    """
+
+    _MIN_DELTA = 65536  # 主表较小时增量表的合并阈值
+
+    def __init__(self, cache_dir: str, model_name: str, dimension: int):
+        self.dimension = dimension
+        slug = model_name.replace("/", "--")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vectors_path = os.path.join(cache_dir, f"{slug}.f32")
+        self.keys_path = os.path.join(cache_dir, f"{slug}.keys")
+        self._load()
+
+    def _load(self):
+        """
+        读入哈希表并映射向量文件
+
+        写入中断时两个文件的行数可能不一致，或末尾留下半行；两个文件都截断到完整行数较少的一方，
+        之后的追加才会落在正确的行边界上
+        """
+        row_bytes = self.dimension * 4
+        vector_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        key_size = os.path.getsize(self.keys_path) if os.path.exists(self.keys_path) else 0
+        rows = min(vector_size // row_bytes, key_size // 8)
+        if vector_size != rows * row_bytes or key_size != rows * 8:
+            for path, size in ((self.vectors_path, rows * row_bytes), (self.keys_path, rows * 8)):
+                if os.path.exists(path):
+                    os.truncate(path, size)
+
+        keys = np.fromfile(self.keys_path, dtype='int64', count=rows) if rows else np.empty(0, dtype='int64')
+        order = np.argsort(keys, kind='stable')
+        self._sorted_keys = keys[order]
+        self._sorted_rows = order
+        self._delta_keys = np.empty(0, dtype='int64')
+        self._delta_rows = np.empty(0, dtype='int64')
+        self._rows = rows
+        self._vectors = None
+        self._map_vectors()
+
+    def _map_vectors(self):
+        self._vectors = (
+            np.memmap(self.vectors_path, dtype='float32', mode='r', shape=(self._rows, self.dimension))
+            if self._rows else None
+        )
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @staticmethod
+    def _find(sorted_keys: np.ndarray, sorted_rows: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        if len(sorted_keys) == 0:
+            return np.full(len(keys), -1, dtype='int64')
+        pos = np.searchsorted(sorted_keys, keys)
+        pos = np.minimum(pos, len(sorted_keys) - 1)
+        return np.where(sorted_keys[pos] == keys, sorted_rows[pos], -1)
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """返回每个哈希在缓存中的行号，未命中为 -1"""
+        rows = self._find(self._sorted_keys, self._sorted_rows, keys)
+        if len(self._delta_keys):
+            missing = rows < 0
+            rows[missing] = self._find(self._delta_keys, self._delta_rows, keys[missing])
+        return rows
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        """读取指定行的向量"""
+        if len(rows) and (self._vectors is None or rows.max() >= len(self._vectors)):
+            self._map_vectors()
+        return np.asarray(self._vectors[rows], dtype='float32')
+
+    def put(self, keys: np.ndarray, embeddings: np.ndarray):
+        """追加新向量（先写向量再写哈希，中断时多出的向量会在下次打开时截掉）"""
+        if len(keys) == 0:
+            return
+        keys = np.ascontiguousarray(keys, dtype='int64')
+        with open(self.vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(embeddings, dtype='float32').tobytes())
+        with open(self.keys_path, 'ab') as f:
+            f.write(keys.tobytes())
+
+        rows = np.arange(self._rows, self._rows + len(keys), dtype='int64')
+        self._rows += len(keys)
+        order = np.argsort(keys, kind='stable')
+        pos = np.searchsorted(self._delta_keys, keys[order])
+        self._delta_keys = np.insert(self._delta_keys, pos, keys[order])
+        self._delta_rows = np.insert(self._delta_rows, pos, rows[order])
+
+        if len(self._delta_keys) > max(len(self._sorted_keys) // 4, self._MIN_DELTA):
+            pos = np.searchsorted(self._sorted_keys, self._delta_keys)
+            self._sorted_keys = np.insert(self._sorted_keys, pos, self._delta_keys)
+            self._sorted_rows = np.insert(self._sorted_rows, pos, self._delta_rows)
+            self._delta_keys = self._delta_keys[:0]
+            self._delta_rows = self._delta_rows[:0]
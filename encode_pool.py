@@ -0,0 +1,110 @@
+"""
+多进程编码池：建库时把文本分片交给多个 CPU 工作进程并行编码
+
+单个进程里 PyTorch 的算子内并行在小批量上扩展性很差，多核建库机器上大部分核心处于空闲。
+每个工作进程各自加载一份 Embedding 模型，并限制自己的算子内线程数，避免进程之间争抢核心。
+"""
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Tuple
+import numpy as np
+from length_batching import encode_bucketed
+
+
+# 需要编码的文本少于该数量时不启动编码池，直接在主进程编码
+POOL_MIN_TEXTS = 256
+
+# 工作进程内的模型实例（每个进程加载一次）
+_worker_encoder = None
+
+
+def resolve_pool_size(workers: int, threads_per_worker: int = 0) -> Tuple[int, int]:
+    """
+    计算 (进程数, 每进程线程数)
+
+    Args:
+        workers: 工作进程数，<= 0 时使用全部 CPU 核心
+        threads_per_worker: 每个进程的算子内线程数，<= 0 时按 CPU 核心数平均分配
+    """
+    cpus = os.cpu_count() or 1
+    workers = workers if workers > 0 else cpus
+    threads = threads_per_worker if threads_per_worker > 0 else max(1, cpus // workers)
+    return workers, threads
+
+
+def _init_worker(model_name: str, cache_folder: str, local_files_only: bool, threads: int, backend: str):
+    """工作进程初始化：先限制线程数再导入 torch / onnxruntime，然后加载模型"""
+    global _worker_encoder
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    if backend == "onnx_int8":
+        from onnx_encoder import OnnxEncoder
+        _worker_encoder = OnnxEncoder(model_name, cache_folder=cache_folder,
+                                      local_files_only=local_files_only, threads=threads)
+        return
+    import torch
+    torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    _worker_encoder = SentenceTransformer(
+        model_name, cache_folder=cache_folder, local_files_only=local_files_only, device="cpu",
+    )
+
+
+def _encode_shard(texts: List[str], token_budget: int, max_batch: int) -> np.ndarray:
+    return encode_bucketed(_worker_encoder, texts, token_budget, max_batch)
+
+
+class EncodePool:
+    """
+    Embedding 多进程编码池
+
+    用法:
+        with EncodePool(model_name, workers=8, threads_per_worker=2) as pool:
+            embeddings = pool.encode(texts)
+    """
+
+    def __init__(self, model_name: str, workers: int, threads_per_worker: int = 0,
+                 cache_folder: str = None, local_files_only: bool = False, backend: str = "torch"):
+        self.workers, self.threads = resolve_pool_size(workers, threads_per_worker)
+        # spawn：工作进程不继承父进程已初始化的 torch 线程池与 FAISS 状态
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, cache_folder, local_files_only, self.threads, backend),
+        )
+        print(f"✓ 已启动多进程编码池: {self.workers} 个进程 × {self.threads} 线程")
+
+    def encode(self, texts: List[str], token_budget: int, max_batch: int) -> np.ndarray:
+        """
+        分片并行编码，结果顺序与输入一致
+
+        文本先按字符长度排序再切分，同一分片内长度相近，进程内再按 token 长度分桶编码；
+        每个进程约分到 4 个分片，空闲的进程会领取下一个分片，使负载大致均衡。
+        """
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        order = np.argsort([len(t) for t in texts], kind='stable')
+        shard_size = math.ceil(len(texts) / (self.workers * 4))
+        shards = [order[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        results = self._executor.map(
+            _encode_shard, ([texts[i] for i in shard] for shard in shards), repeat(token_budget), repeat(max_batch)
+        )
+        embeddings = None
+        for shard, vectors in zip(shards, results):
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype='float32')
+            embeddings[shard] = vectors
+        return embeddings
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,127 @@
+"""
+ETL 断点日志：记录每条原始提示词的处理状态与它在输出 JSONL 中的字节偏移
+
+日志与输出文件放在一起（<输出文件>.journal），每行 {"key", "status", "offset"}，同一 key 以最后一行为准。
+key = hash(原始提示词, 模型, 系统提示词版本)，与 LLM 输出的翻译结果无关，重跑时可以精确跳过已完成的记录；
+换模型或修改系统提示词后 key 随之变化，记录会重新处理。
+"""
+import bisect
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Iterable, Optional
+
+
+DONE = "done"
+FAILED = "failed"
+
+
+def journal_path_for(output_path: str) -> str:
+    return output_path + ".journal"
+
+
+def record_key(text: str, model: str, prompt_version: str) -> str:
+    """断点日志中一条原始提示词的 key"""
+    return hashlib.blake2b(f"{model}\0{prompt_version}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def prompt_version(system_prompt: str) -> str:
+    """系统提示词的版本（内容哈希），修改提示词后自动变化"""
+    return hashlib.blake2b(system_prompt.encode("utf-8"), digest_size=4).hexdigest()
+
+
+class ETLJournal:
+    """
+    追加写入的断点日志
+
+    Attributes:
+        entries: key -> {"status": done / failed, "offset": 输出文件中的字节偏移}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._file = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = {"status": entry["status"], "offset": entry["offset"]}
+                    except (ValueError, KeyError):
+                        # 写到一半中断的最后一行
+                        continue
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.entries.get(key)
+
+    def record(self, key: str, status: str, offset: int):
+        """记录一条结果并立即落盘（先写输出再写日志）"""
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({"key": key, "status": status, "offset": offset}) + "\n")
+        self._file.flush()
+        self.entries[key] = {"status": status, "offset": offset}
+
+    def reset(self):
+        """清空日志（覆盖输出文件时）"""
+        self.close()
+        self.entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def end_offset(self, output_path: str) -> Optional[int]:
+        """日志覆盖到的输出文件末尾（最后一条已记录的行结束处）；日志为空时返回 None"""
+        if not self.entries:
+            return None
+        last = max(entry["offset"] for entry in self.entries.values())
+        with open(output_path, "rb") as f:
+            f.seek(last)
+            return last + len(f.readline())
+
+    def compact(self, remap: Callable[[int], int] = None):
+        """重写为每个 key 一行；remap 用于输出文件删除行之后更新偏移"""
+        self.close()
+        if remap is not None:
+            self.entries = {key: {"status": entry["status"], "offset": remap(entry["offset"])}
+                            for key, entry in self.entries.items()}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, entry in self.entries.items():
+                f.write(json.dumps({"key": key, **entry}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def drop_lines(path: str, offsets: Iterable[int]) -> Callable[[int], int]:
+    """
+    从 JSONL 文件中删除从给定字节偏移开始的行（先写临时文件再替换）
+
+    Returns:
+        旧偏移 -> 新偏移 的映射函数（用于更新断点日志）
+    """
+    offsets = set(offsets)
+    dropped_at, dropped_total = [], []
+    total = 0
+    tmp_path = path + ".tmp"
+    with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+        position = 0
+        for line in src:
+            if position in offsets:
+                total += len(line)
+                dropped_at.append(position)
+                dropped_total.append(total)
+            else:
+                dst.write(line)
+            position += len(line)
+    os.replace(tmp_path, path)
+
+    def remap(offset: int) -> int:
+        # 减去位于该行之前的所有被删除行的长度
+        i = bisect.bisect_left(dropped_at, offset)
+        return offset - (dropped_total[i - 1] if i else 0)
+    return remap
@@ -2,14 +2,17 @@
 ETL Pipeline：数据清洗与结构化模块
 从 Excel/CSV 读取原始提示词，通过 Qwen 3 解析成结构化 JSON
 """
-import pandas as pd
 import json
 import jsonlines
 import os
-from typing import List, Dict, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Dict, Optional, Tuple
 from tqdm import tqdm
 from ollama_client import OllamaClient
-from config import PROCESSED_DATA_DIR, RAW_DATA_DIR
+from etl_journal import ETLJournal, DONE, FAILED, drop_lines, journal_path_for, prompt_version, record_key
+from config import PROCESSED_DATA_DIR, RAW_DATA_DIR, ETL_CONCURRENCY
 
 
 class ETLPipeline:
@@ -161,6 +164,8 @@ class ETLPipeline:
         Returns:
             提示词文本列表
         """
+        # pandas 导入较慢，只在读取表格时导入
+        import pandas as pd
         try:
             # 如果未指定工作表，先检查有哪些工作表
             if sheet_name is None:
@@ -183,7 +188,7 @@ class ETLPipeline:
             if isinstance(df, dict):
                 # 如果是字典，使用第一个 DataFrame
                 df = list(df.values())[0]
-                print(f"检测到多个工作表，使用第一个")
+                print("检测到多个工作表，使用第一个")
             
             # 如果没有指定列，使用第一列
             if column is None:
@@ -213,6 +218,7 @@ class ETLPipeline:
         Returns:
             提示词文本列表
         """
+        import pandas as pd
         try:
             df = pd.read_csv(file_path)
             
@@ -229,25 +235,79 @@ class ETLPipeline:
             print(f"✗ 加载 CSV 失败: {e}")
             return []
     
-    def process_batch(self, texts: List[str], output_path: str = None, append: bool = False) -> str:
+    def _iter_parsed(self, texts: List[str], concurrency: int) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        按原顺序产出 (原始文本, 解析结果)
+        
+        concurrency > 1 时用线程池同时发出多个 LLM 请求；先完成的结果暂存，轮到它时立即产出。
+        最多提前提交 4 × concurrency 条，个别慢请求不会让暂存的结果无限增长。
+        """
+        if concurrency <= 1:
+            for text in texts:
+                yield text, self._parse_with_llm(text)
+            return
+        
+        remaining = iter(texts)
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="etl")
+        try:
+            pending = deque((text, executor.submit(self._parse_with_llm, text))
+                            for text in islice(remaining, concurrency * 4))
+            while pending:
+                text, future = pending.popleft()
+                parsed = future.result()
+                next_text = next(remaining, None)
+                if next_text is not None:
+                    pending.append((next_text, executor.submit(self._parse_with_llm, next_text)))
+                yield text, parsed
+        finally:
+            # 中断时取消尚未开始的请求，只等待已发出的请求
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def process_batch(self, texts: List[str], output_path: str = None, append: bool = False,
+                      concurrency: int = None) -> str:
         """
         批量处理文本，生成结构化 JSONL 文件
         
+        每条结果写入后记入断点日志（<输出文件>.journal）。中断后以追加模式重跑，
+        已完成的记录按 hash(原始提示词, 模型, 系统提示词版本) 精确跳过，失败的记录重新请求，
+        重试后删除上次写入的占位记录。
+        
         Args:
             texts: 原始文本列表
             output_path: 输出文件路径（可选）
-            append: 是否追加模式（True=追加，False=覆盖）
+            append: 是否追加模式（True=追加/续跑，False=覆盖）
+            concurrency: 同时在途的 LLM 请求数（默认 ETL_CONCURRENCY），输出顺序与输入一致
         
         Returns:
             输出文件路径
         """
+        concurrency = max(1, ETL_CONCURRENCY if concurrency is None else concurrency)
         if output_path is None:
             output_path = os.path.join(PROCESSED_DATA_DIR, "structured_data.jsonl")
         
-        # 如果追加模式，读取现有数据，避免重复
+        journal = ETLJournal(journal_path_for(output_path))
+        if not (append and os.path.exists(output_path)):
+            journal.reset()
+        else:
+            # 每条记录先写输出再写日志，中断时最多有一行没有记入日志：截掉后对应记录重新处理。
+            # 多于一行说明输出文件已被替换，日志不再可信
+            end = journal.end_offset(output_path)
+            if end is not None and os.path.getsize(output_path) > end:
+                with open(output_path, "r+b") as f:
+                    f.seek(end)
+                    tail = f.read(1 << 20)
+                    if len(tail.splitlines()) <= 1 and end + len(tail) == os.path.getsize(output_path):
+                        print("⚠️  输出文件末尾有 1 条记录未记入断点日志，截断后重新处理")
+                        f.truncate(end)
+                    else:
+                        print("⚠️  断点日志与输出文件不一致，忽略断点日志")
+                        journal.reset()
+        output_size = os.path.getsize(output_path) if append and os.path.exists(output_path) else 0
+        
+        # 如果追加模式，读取现有数据，避免重复（断点日志之前生成的旧文件只能按 raw 文本比较）
         existing_raws = set()
         if append and os.path.exists(output_path):
-            print(f"检测到现有文件，读取已有数据以避免重复...")
+            print("检测到现有文件，读取已有数据以避免重复...")
             try:
                 with jsonlines.open(output_path, mode='r') as reader:
                     for item in reader:
@@ -258,14 +318,35 @@ class ETLPipeline:
             except Exception as e:
                 print(f"  读取现有文件失败: {e}，将覆盖文件")
                 append = False
+                journal.reset()
+                output_size = 0
         
-        # 过滤掉已存在的文本
-        if existing_raws:
-            original_count = len(texts)
-            texts = [t for t in texts if t not in existing_raws]
-            skipped_count = original_count - len(texts)
-            if skipped_count > 0:
-                print(f"  跳过 {skipped_count} 条已存在的记录")
+        # 过滤掉已完成的文本：日志中有记录的按日志判断，其余按 raw 文本比较
+        version = prompt_version(self.system_prompt)
+        model = getattr(self.client, "model", "")
+        pending_texts, pending_keys = [], []
+        retried = {}  # key -> 上次失败时写入的占位记录偏移
+        done_count = skipped_count = 0
+        for text in texts:
+            key = record_key(text, model, version)
+            entry = journal.get(key)
+            if entry is not None and entry["offset"] < output_size:
+                if entry["status"] == DONE:
+                    done_count += 1
+                    continue
+                retried[key] = entry["offset"]
+            elif text in existing_raws:
+                skipped_count += 1
+                continue
+            pending_texts.append(text)
+            pending_keys.append(key)
+        if done_count > 0:
+            print(f"  断点日志: 跳过 {done_count} 条已完成的记录")
+        if retried:
+            print(f"  断点日志: 重试 {len(retried)} 条上次失败的记录")
+        if skipped_count > 0:
+            print(f"  跳过 {skipped_count} 条已存在的记录")
+        texts = pending_texts
         
         if not texts:
             print("\n所有记录都已存在，无需处理")
@@ -273,40 +354,54 @@ class ETLPipeline:
         
         processed_count = 0
         failed_count = 0
+        if concurrency > 1:
+            print(f"  并发请求数: {concurrency}")
+            if hasattr(self.client, "set_pool_size"):
+                self.client.set_pool_size(concurrency)
         
-        # 根据模式选择写入方式
-        mode = 'a' if append else 'w'
-        with jsonlines.open(output_path, mode=mode) as writer:
-            for text in tqdm(texts, desc="处理中"):
-                parsed = self._parse_with_llm(text)
-                
-                if parsed:
-                    writer.write(parsed)
-                    processed_count += 1
-                else:
-                    failed_count += 1
-                    # 即使解析失败，也保存原始数据
-                    writer.write({
-                        "subject": "",
-                        "art_style": "",
-                        "visual_elements": [],
-                        "mood": "",
-                        "technical": [],
-                        "raw": text
-                    })
+        # 根据模式选择写入方式；每条记录写入后立即刷新并记入断点日志，中断时已完成的记录不会丢失
+        mode = 'ab' if append else 'wb'
+        try:
+            with open(output_path, mode) as f, jsonlines.Writer(f, flush=True) as writer, \
+                    tqdm(total=len(texts), desc="处理中", unit="条") as progress:
+                for (text, parsed), key in zip(self._iter_parsed(texts, concurrency), pending_keys):
+                    progress.update(1)
+                    offset = f.tell()
+                    
+                    if parsed:
+                        writer.write(parsed)
+                        processed_count += 1
+                    else:
+                        failed_count += 1
+                        # 即使解析失败，也保存原始数据
+                        writer.write({
+                            "subject": "",
+                            "art_style": "",
+                            "visual_elements": [],
+                            "mood": "",
+                            "technical": [],
+                            "raw": text
+                        })
+                    journal.record(key, DONE if parsed else FAILED, offset)
+                    progress.set_postfix(失败=failed_count)
+        finally:
+            # 已重试的记录删除上次的占位记录（中断时也只删除已经重新写入的部分）
+            superseded = [offset for key, offset in retried.items() if journal.get(key)["offset"] != offset]
+            if superseded:
+                journal.compact(drop_lines(output_path, superseded))
+            journal.close()
         
-        print(f"\n✓ 处理完成！")
+        print("\n✓ 处理完成！")
         print(f"  成功: {processed_count} 条")
         print(f"  失败: {failed_count} 条")
         if append:
-            print(f"  模式: 追加到现有文件")
+            print("  模式: 追加到现有文件")
         else:
-            print(f"  模式: 覆盖文件")
+            print("  模式: 覆盖文件")
         print(f"  输出文件: {output_path}")
         
         return output_path
 
-
 if __name__ == "__main__":
     # 测试示例
     pipeline = ETLPipeline()
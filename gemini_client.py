@@ -1,10 +1,13 @@
 """
 Gemini 客户端：负责与 Google Gemini API 通信
+
+google.generativeai 导入较慢，只在配置了 API Key 时才导入。
+异步接口（agenerate / astream_generate）使用 SDK 的异步传输，同一事件循环上的并发请求不超过 LLM_MAX_CONNECTIONS
 """
-import google.generativeai as genai
-from config import GEMINI_API_KEY, GEMINI_MODEL
+from config import GEMINI_API_KEY, GEMINI_MODEL, LLM_MAX_CONNECTIONS
+import asyncio
 import time
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 class GeminiClient:
     """Google Gemini API 客户端封装"""
@@ -13,9 +16,13 @@ class GeminiClient:
         self.api_key = api_key or GEMINI_API_KEY
         self.model_name = model_name or GEMINI_MODEL
         self.is_configured = False
+        # 异步并发上限，绑定创建它的事件循环
+        self._async_slots = None
+        self._async_loop = None
         
         if self.api_key:
             try:
+                import google.generativeai as genai
                 genai.configure(api_key=self.api_key)
                 self.model = genai.GenerativeModel(self.model_name)
                 self.is_configured = True
@@ -38,6 +45,7 @@ class GeminiClient:
             if "404" in str(e) or "not found" in str(e).lower():
                 print(f"提示: 模型 {self.model_name} 可能不可用，尝试列出可用模型...")
                 try:
+                    import google.generativeai as genai
                     for m in genai.list_models():
                         if 'generateContent' in m.supported_generation_methods:
                             print(f"- {m.name}")
@@ -50,13 +58,8 @@ class GeminiClient:
         if not self.is_configured:
              return "错误: 未配置 Gemini API Key"
         
-        full_prompt = prompt
-        if system:
-             full_prompt = f"System Instruction:\n{system}\n\nUser Request:\n{prompt}"
-             
-        generation_config = genai.types.GenerationConfig(
-            temperature=temperature
-        )
+        full_prompt = self._full_prompt(prompt, system)
+        generation_config = {'temperature': temperature}
         
         try:
             response = self.model.generate_content(
@@ -78,13 +81,8 @@ class GeminiClient:
              yield "错误: 请先在 .env 中配置 GEMINI_API_KEY"
              return
 
-        full_prompt = prompt
-        if system:
-             full_prompt = f"System Instruction:\n{system}\n\nUser Request:\n{prompt}"
-             
-        generation_config = genai.types.GenerationConfig(
-            temperature=temperature
-        )
+        full_prompt = self._full_prompt(prompt, system)
+        generation_config = {'temperature': temperature}
         
         try:
             response = self.model.generate_content(
@@ -102,6 +100,68 @@ class GeminiClient:
             else:
                  yield f"Gemini Stream Error: {error_msg}"
 
+    def _full_prompt(self, prompt: str, system: str = None) -> str:
+        """系统提示词拼接在用户请求之前"""
+        if system:
+            return f"System Instruction:\n{system}\n\nUser Request:\n{prompt}"
+        return prompt
+
+    def _get_async_slots(self) -> asyncio.Semaphore:
+        """当前事件循环上的并发上限"""
+        loop = asyncio.get_running_loop()
+        if self._async_slots is None or self._async_loop is not loop:
+            self._async_slots = asyncio.Semaphore(LLM_MAX_CONNECTIONS)
+            self._async_loop = loop
+        return self._async_slots
+
+    async def agenerate(self, prompt: str, system: str = None, temperature: float = 0.7) -> str:
+        """generate 的异步版本"""
+        if not self.is_configured:
+            return "错误: 未配置 Gemini API Key"
+        async with self._get_async_slots():
+            try:
+                response = await self.model.generate_content_async(
+                    self._full_prompt(prompt, system),
+                    generation_config={'temperature': temperature}
+                )
+                return response.text
+            except Exception as e:
+                return f"Gemini API Error: {str(e)}"
+
+    async def astream_generate(
+        self,
+        prompt: str,
+        system: str = None,
+        temperature: float = 0.7,
+    ) -> AsyncGenerator[str, None]:
+        """stream_generate 的异步版本"""
+        if not self.is_configured:
+            yield "错误: 请先在 .env 中配置 GEMINI_API_KEY"
+            return
+
+        async with self._get_async_slots():
+            try:
+                response = await self.model.generate_content_async(
+                    self._full_prompt(prompt, system),
+                    stream=True,
+                    generation_config={'temperature': temperature}
+                )
+                async for chunk in response:
+                    if chunk.text:
+                        yield chunk.text
+            except Exception as e:
+                error_msg = str(e)
+                if "404" in error_msg:
+                    yield f"错误: 模型 '{self.model_name}' 未找到 (404)。请在 .env 中设置正确的 GEMINI_MODEL (例如 gemini-1.5-flash)。"
+                else:
+                    yield f"Gemini Stream Error: {error_msg}"
+
+    async def aclose(self):
+        """兼容接口（与 OllamaClient 相同），SDK 自行管理连接，这里只释放当前事件循环的并发上限"""
+        if self._async_loop is asyncio.get_running_loop():
+            self._async_slots = None
+            self._async_loop = None
+
     def warm_connection(self):
         """兼容接口，Gemini 不需要显式预热连接"""
         pass
@@ -111,6 +171,7 @@ class GeminiClient:
         self.model_name = model_name
         if self.is_configured:
             try:
+                import google.generativeai as genai
                 self.model = genai.GenerativeModel(self.model_name)
                 return True
             except Exception as e:
@@ -0,0 +1,71 @@
+"""
+按长度分桶的动态批处理：建库编码时按 token 长度排序分批，每批大小由 token 预算决定
+
+文件顺序下一个批次会被补齐到其中最长的文本，短文本大部分计算都浪费在填充上；
+按长度排序后同一批次的文本长度相近，短文本可以用更大的批次，长文本自动缩小批次，
+编码完成后按原顺序还原。
+"""
+import numpy as np
+from typing import List
+from tqdm import tqdm
+
+
+def token_lengths(encoder, texts: List[str]) -> np.ndarray:
+    """每条文本的 token 数（含特殊符号，按模型最大长度截断）；编码器没有分词器时按字符数估计"""
+    tokenizer = getattr(encoder, "tokenizer", None)
+    if tokenizer is None:
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    else:
+        max_length = getattr(encoder, "max_seq_length", None)
+        input_ids = tokenizer(texts, truncation=max_length is not None, max_length=max_length)["input_ids"]
+        lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(texts))
+    return np.maximum(lengths, 1)
+
+
+def length_batches(lengths: np.ndarray, token_budget: int, max_batch: int) -> List[np.ndarray]:
+    """
+    按长度升序分批，每批的 (最长 token 数 × 条数) 不超过 token_budget，条数不超过 max_batch
+
+    Returns:
+        每个批次的原始下标；单条超出预算的文本自成一批
+    """
+    order = np.argsort(lengths, kind='stable')
+    sorted_lengths = lengths[order]
+    batches = []
+    start = 0
+    while start < len(order):
+        # 升序排列，批次内最长的是最后一条
+        end = start + 1
+        while (end < len(order) and end - start < max_batch
+               and sorted_lengths[end] * (end - start + 1) <= token_budget):
+            end += 1
+        batches.append(order[start:end])
+        start = end
+    return batches
+
+
+def padding_efficiency(lengths: np.ndarray, batches: List[np.ndarray]) -> float:
+    """有效 token 占补齐后总 token 的比例"""
+    padded = sum(int(lengths[batch].max()) * len(batch) for batch in batches)
+    return float(lengths.sum()) / padded if padded else 1.0
+
+
+def fixed_batches(count: int, batch_size: int) -> List[np.ndarray]:
+    """按原顺序固定大小分批（用于对比）"""
+    return [np.arange(i, min(i + batch_size, count)) for i in range(0, count, batch_size)]
+
+
+def encode_bucketed(encoder, texts: List[str], token_budget: int, max_batch: int,
+                    show_progress_bar: bool = False) -> np.ndarray:
+    """按长度分桶编码，返回与 texts 顺序一致的 float32 向量"""
+    batches = length_batches(token_lengths(encoder, texts), token_budget, max_batch)
+    embeddings = None
+    for batch in tqdm(batches, desc="编码中", disable=not show_progress_bar):
+        vectors = np.asarray(
+            encoder.encode([texts[i] for i in batch], batch_size=len(batch), show_progress_bar=False),
+            dtype='float32',
+        )
+        if embeddings is None:
+            embeddings = np.empty((len(texts), vectors.shape[1]), dtype='float32')
+        embeddings[batch] = vectors
+    return embeddings if embeddings is not None else np.empty((0, 0), dtype='float32')
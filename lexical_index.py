@@ -0,0 +1,176 @@
+"""
+词法检索模块：中文按字符二元组切分的 BM25 倒排索引
+
+postings 以 CSR 形式存放在几个 NumPy 数组中（词项哈希、偏移、文档行号、预计算的 BM25 权重），
+查询时只需切片求和，不需要任何 Python 层的字典或对象。
+"""
+import hashlib
+import os
+import re
+import unicodedata
+from array import array
+from collections import Counter
+import numpy as np
+from typing import Dict, Iterable, List, Tuple
+from config import BM25_K1, BM25_B
+
+
+# 汉字连续片段，或英文/数字单词
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+|[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：统一全半角与大小写后，英文/数字按单词切分，汉字按字符二元组切分（单字片段保留单字）
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).lower()):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def term_keys(terms: List[str]) -> np.ndarray:
+    """词项的 64 位哈希（int64），用作词典键"""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+         for t in terms],
+        dtype='int64',
+    )
+
+
+def lexical_text(item: Dict) -> str:
+    """参与词法检索的文本：原始提示词加上各结构化字段"""
+    parts = [item.get("raw") or "", item.get("subject") or "", item.get("art_style") or "",
+             item.get("mood") or ""]
+    parts.extend(item.get("visual_elements") or [])
+    parts.extend(item.get("technical") or [])
+    return " ".join(p for p in parts if isinstance(p, str))
+
+
+class BM25Index:
+    """
+    基于 NumPy 数组的 BM25 索引
+
+    Attributes:
+        doc_ids: 每个文档行对应的记录 id
+        keys: 按升序排列的词项哈希
+        offsets: 词项 i 的 postings 位于 [offsets[i], offsets[i+1])
+        rows: postings 中的文档行号
+        weights: postings 对应的 BM25 词项权重（idf 与长度归一化已预先计算）
+    """
+
+    def __init__(self, doc_ids: np.ndarray, keys: np.ndarray, offsets: np.ndarray,
+                 rows: np.ndarray, weights: np.ndarray):
+        self.doc_ids = doc_ids
+        self.keys = keys
+        self.offsets = offsets
+        self.rows = rows
+        self.weights = weights
+
+    @classmethod
+    def build(cls, records: Iterable[Tuple[int, Dict]], k1: float = None, b: float = None) -> "BM25Index":
+        """从 (id, 记录) 构建索引"""
+        k1 = BM25_K1 if k1 is None else k1
+        b = BM25_B if b is None else b
+
+        # 用紧凑的 array 累积 postings，避免逐条保存 Python 整数对象
+        vocab = {}
+        doc_ids, lengths = array('q'), array('f')
+        rows, cols, tfs = array('i'), array('q'), array('f')
+        for row, (rid, item) in enumerate(records):
+            tokens = tokenize(lexical_text(item))
+            doc_ids.append(rid)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                cols.append(vocab.setdefault(term, len(vocab)))
+                rows.append(row)
+                tfs.append(tf)
+
+        n = len(doc_ids)
+        doc_ids = np.frombuffer(doc_ids, dtype='int64')
+        cols = np.frombuffer(cols, dtype='int64')
+        rows = np.frombuffer(rows, dtype='int32')
+        tfs = np.frombuffer(tfs, dtype='float32')
+        lengths = np.frombuffer(lengths, dtype='float32')
+
+        df = np.bincount(cols, minlength=len(vocab))
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        avgdl = max(float(lengths.mean()), 1.0) if n else 1.0
+        norm = k1 * (1 - b + b * lengths[rows] / avgdl)
+        weights = (idf[cols] * tfs * (k1 + 1) / (tfs + norm)).astype('float32')
+
+        # 词项按哈希排序，postings 按词项分组排列
+        keys = term_keys(list(vocab))
+        term_order = np.argsort(keys)
+        term_rank = np.empty_like(term_order)
+        term_rank[term_order] = np.arange(len(term_order))
+        posting_order = np.argsort(term_rank[cols], kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(df[term_order]))).astype('int64')
+
+        return cls(doc_ids, keys[term_order], offsets,
+                   rows[posting_order], weights[posting_order])
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            return cls(data["doc_ids"], data["keys"], data["offsets"], data["rows"], data["weights"])
+
+    def save(self, path: str):
+        """原子写入（临时文件名需以 .npz 结尾，否则 np.savez 会自动追加后缀）"""
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, doc_ids=self.doc_ids, keys=self.keys, offsets=self.offsets,
+                 rows=self.rows, weights=self.weights)
+        os.replace(tmp_path, path)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, query: str, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            k: 返回数量
+            allowed: 只在这些记录 id 中检索（升序），为 None 时不过滤
+
+        Returns:
+            (scores, ids)，按得分降序，只包含得分大于 0 的记录
+        """
+        counts = Counter(tokenize(query))
+        if not counts or len(self.keys) == 0:
+            return np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+
+        keys = term_keys(list(counts))
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[pos] == keys
+        if not found.any():
+            return np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+
+        slices = [slice(self.offsets[p], self.offsets[p + 1]) for p in pos[found]]
+        query_tf = np.repeat(np.fromiter(counts.values(), dtype='float32')[found],
+                             [s.stop - s.start for s in slices])
+        rows = np.concatenate([self.rows[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices]) * query_tf
+        scores = np.bincount(rows, weights=weights, minlength=len(self.doc_ids))
+
+        if allowed is not None:
+            scores[~np.isin(self.doc_ids, allowed)] = 0
+
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return scores[hits].astype('float32'), self.doc_ids[hits]
+
+
+def rrf_fuse(rankings: List[np.ndarray], k: int = 60) -> np.ndarray:
+    """倒数排名融合（RRF）：score(d) = Σ 1 / (k + rank)，rank 从 1 开始；返回按融合得分降序的 id"""
+    scores = {}
+    for ranking in rankings:
+        for rank, rid in enumerate(ranking.tolist(), start=1):
+            scores[rid] = scores.get(rid, 0.0) + 1.0 / (k + rank)
+    return np.array(sorted(scores, key=scores.get, reverse=True), dtype='int64')
@@ -0,0 +1,135 @@
+"""
+索引 manifest：记录索引由什么模型、什么数据、什么参数构建，加载时据此快速校验
+
+加载时只读取一个小 JSON 文件并对各文件做 stat，比较大小与修改时间，不读取文件内容；
+需要确认文件内容完整时用 check_manifest(deep=True) 重新计算校验和。
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+MANIFEST_VERSION = 1
+
+# 问题级别：需要全量重建 / 需要增量更新 / 仅提示
+REBUILD = "rebuild"
+UPDATE = "update"
+WARNING = "warning"
+
+_MTIME_CHANGED = "修改时间变化"
+
+
+def manifest_path_for(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + ".manifest.json"
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    """文件内容的 blake2b 校验和"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path: str, checksum: bool = True) -> Dict:
+    """文件指纹：大小、修改时间（纳秒）与可选的内容校验和"""
+    stat = os.stat(path)
+    fingerprint = {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if checksum:
+        fingerprint["checksum"] = file_checksum(path)
+    return fingerprint
+
+
+def read_manifest(path: str) -> Optional[Dict]:
+    """读取 manifest，不存在或无法解析时返回 None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path: str, manifest: Dict):
+    """原子写入 manifest"""
+    manifest = {"version": MANIFEST_VERSION, "created_at": time.strftime("%Y-%m-%d %H:%M:%S"), **manifest}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _file_changed(fingerprint: Dict, deep: bool) -> Optional[str]:
+    """文件与指纹是否一致；返回不一致的原因"""
+    path = fingerprint["path"]
+    if not os.path.exists(path):
+        return "文件不存在"
+    stat = os.stat(path)
+    if stat.st_size != fingerprint["size"]:
+        return f"大小 {fingerprint['size']} → {stat.st_size}"
+    if deep and fingerprint.get("checksum"):
+        return None if file_checksum(path) == fingerprint["checksum"] else "校验和不一致"
+    if stat.st_mtime_ns != fingerprint["mtime_ns"]:
+        return _MTIME_CHANGED
+    return None
+
+
+def check_manifest(manifest: Dict, expected: Dict, deep: bool = False,
+                   structure_level: str = REBUILD) -> List[Tuple[str, str]]:
+    """
+    校验 manifest
+
+    Args:
+        manifest: read_manifest 的结果
+        expected: 当前配置，键与 manifest 相同（model / backend / model_dimension / index_type /
+                  reduction / metric / search_text_version），为 None 的项不检查
+        deep: 是否重新计算文件校验和（默认只比较大小与修改时间）
+        structure_level: 索引类型或降维方式与配置不一致时的级别。这两项只能通过全量重建生效，
+                         默认为 REBUILD；只读加载时现有索引仍可检索，可降为 WARNING
+
+    Returns:
+        [(级别, 说明)]，级别为 REBUILD / UPDATE / WARNING；空列表表示一致
+    """
+    issues = []
+    if manifest.get("version") != MANIFEST_VERSION:
+        issues.append((WARNING, f"manifest 版本 {manifest.get('version')} 与当前 {MANIFEST_VERSION} 不同"))
+
+    # 决定向量空间的参数，不一致时只能全量重建
+    labels = {
+        "model": "Embedding 模型",
+        "backend": "Embedding 后端",
+        "model_dimension": "模型维度",
+        "metric": "距离度量",
+        "search_text_version": "检索文本构建规则版本",
+    }
+    for key, label in labels.items():
+        if expected.get(key) is not None and manifest.get(key) != expected[key]:
+            issues.append((REBUILD, f"{label}: 索引为 {manifest.get(key)}，当前为 {expected[key]}"))
+    # 索引结构与降维方式：增量更新只会沿用旧结构，全量重建后才会生效
+    for key, label in (("index_type", "索引类型"), ("reduction", "降维方式")):
+        if expected.get(key) is not None and manifest.get(key) != expected[key]:
+            issues.append((structure_level, f"{label}: 索引为 {manifest.get(key)}，配置为 {expected[key]}，"
+                                            f"全量重建后生效"))
+
+    if manifest.get("lexical_stale"):
+        issues.append((WARNING, "BM25 索引在 upsert / delete 后尚未重建，混合检索时会在内存中临时重建；"
+                                "可运行 python build_index.py --rebuild-lexical"))
+
+    for fingerprint in manifest.get("artifacts", []):
+        reason = _file_changed(fingerprint, deep)
+        if reason == _MTIME_CHANGED:
+            # 复制目录等操作也会改变修改时间，只有内容校验才能确定
+            issues.append((WARNING, f"索引文件 {fingerprint['path']} 的修改时间与 manifest 不同，"
+                                    f"可运行 python build_index.py --check 校验内容"))
+        elif reason:
+            issues.append((REBUILD, f"索引文件 {fingerprint['path']} 与 manifest 不一致（{reason}）"))
+
+    for fingerprint in manifest.get("sources", []):
+        reason = _file_changed(fingerprint, deep)
+        if reason == "文件不存在":
+            issues.append((WARNING, f"源文件 {fingerprint['path']} 已不存在（同步删除需带 prune 增量更新）"))
+        elif reason:
+            issues.append((UPDATE, f"源文件 {fingerprint['path']} 在建库后有变化（{reason}），增量更新即可"))
+    return issues
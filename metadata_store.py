@@ -0,0 +1,461 @@
+"""
+元数据存储模块：按索引 id 随机访问元数据，避免启动时解析全部记录
+"""
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+from pathlib import Path
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+def record_id(item: Dict) -> int:
+    """
+    记录的稳定 id：对原始提示词 raw 做内容哈希（raw 为空时使用整条记录）
+
+    取 63 位，保证是正的 int64，可同时作为 FAISS 标签和 SQLite 主键。
+    """
+    key = (item.get("raw") or "").strip() or json.dumps(item, ensure_ascii=False, sort_keys=True)
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
+
+
+# 建立倒排索引、可在检索时过滤的字段
+FACET_FIELDS = ("art_style", "mood", "visual_elements", "technical")
+
+
+def record_facets(item: Dict) -> Set[Tuple[str, str]]:
+    """记录在各过滤字段上的取值 (字段, 值)，列表字段展开为多个值"""
+    facets = set()
+    for field in FACET_FIELDS:
+        values = item.get(field) or []
+        if isinstance(values, str):
+            values = [values]
+        facets.update((field, v.strip()) for v in values if isinstance(v, str) and v.strip())
+    return facets
+
+
+def normalize_filters(filters: Dict) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    """
+    校验并规范化过滤条件：{字段: 值 或 值列表}，不同字段之间为"且"，同一字段的多个值为"或"
+
+    Returns:
+        排序后的 ((字段, (值, ...)), ...)，可直接作为缓存键
+    """
+    normalized = []
+    for field, values in filters.items():
+        if field not in FACET_FIELDS:
+            raise ValueError(f"不支持按 {field} 过滤，可选字段: {', '.join(FACET_FIELDS)}")
+        if isinstance(values, str):
+            values = [values]
+        values = tuple(sorted({v.strip() for v in values if v and v.strip()}))
+        if values:
+            normalized.append((field, values))
+    return tuple(sorted(normalized))
+
+
+def serialize_record(item: Dict) -> str:
+    """元数据库中记录的存储格式，也用于判断记录内容是否变化"""
+    return json.dumps(item, ensure_ascii=False)
+
+
+def build_offsets(buffer) -> np.ndarray:
+    """
+    扫描 JSONL 内容，生成每条非空记录的起始字节位置（末尾追加文件长度，共 N+1 个）
+
+    只查找换行符，不解析 JSON。
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    newlines = np.flatnonzero(data == ord('\n'))
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(data)]))
+    # 跳过空行，空行会被并入上一条记录的尾部（json.loads 会忽略空白）
+    keep = line_ends > line_starts
+    return np.concatenate((line_starts[keep], [len(data)])).astype('int64')
+
+
+def write_offsets(offsets_path: str, offsets) -> None:
+    """原子写入偏移表（先写临时文件再替换，避免正在映射该文件的进程读到半截数据）"""
+    tmp_path = offsets_path + ".tmp"
+    np.asarray(offsets, dtype='int64').tofile(tmp_path)
+    os.replace(tmp_path, offsets_path)
+
+
+class JsonlMetadata:
+    """
+    基于偏移表的 JSONL 元数据只读视图
+
+    通过 mmap 按需读取并解码单条记录，加载耗时与记录数无关；
+    偏移表缺失或与 JSONL 不一致时会扫描一次换行符重建。
+    """
+
+    def __init__(self, jsonl_path: str, offsets_path: str):
+        self.jsonl_path = jsonl_path
+        self.offsets_path = offsets_path
+
+        self._file = open(jsonl_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        # 空文件无法 mmap
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.offsets = self._load_offsets(size)
+
+    def _load_offsets(self, size: int) -> np.ndarray:
+        """加载偏移表，末尾记录的文件长度不一致时视为过期"""
+        if os.path.exists(self.offsets_path) and os.path.getsize(self.offsets_path) >= 8:
+            offsets = np.memmap(self.offsets_path, dtype='int64', mode='r')
+            if offsets[-1] == size:
+                return offsets
+            print("⚠️  元数据偏移表已过期，正在重建...")
+
+        offsets = build_offsets(self._buffer)
+        try:
+            write_offsets(self.offsets_path, offsets)
+        except OSError as e:
+            print(f"⚠️  偏移表写入失败（不影响使用）: {e}")
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> Dict:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return json.loads(self._buffer[start:end])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get(self, idx: int) -> Optional[Dict]:
+        """按 id 读取单条记录，不存在时返回 None"""
+        return self[idx] if 0 <= idx < len(self) else None
+
+    def get_many(self, ids: List[int]) -> List[Dict]:
+        """批量读取，仅解码传入的记录"""
+        return [self[i] for i in ids]
+
+    def get_clusters(self, ids: Iterable[int]) -> Dict[int, int]:
+        """旧版 JSONL 元数据没有近重复簇信息"""
+        return {}
+
+    def filter_ids(self, filters) -> np.ndarray:
+        raise ValueError("旧版 JSONL 元数据没有倒排索引，不支持过滤检索，请全量重建索引")
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+
+class SqliteMetadataStore:
+    """
+    基于 SQLite 的元数据存储
+
+    以 FAISS 索引 id 为主键，查询时按主键读取并只解码命中的记录；
+    写入通过 INSERT 追加，不需要重写整个文件。
+    """
+
+    def __init__(self, db_path: str, readonly: bool = False):
+        self.db_path = db_path
+        self.readonly = readonly
+
+        if readonly:
+            uri = Path(db_path).absolute().as_uri() + "?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            # 近重复簇、shingle 哈希与 LSH 桶（见 near_dup.py），增量更新时用于给新记录归簇
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dup_clusters "
+                "(id INTEGER PRIMARY KEY, cluster_id INTEGER NOT NULL, shingles BLOB)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(dup_clusters)")}
+            if "shingles" not in columns:
+                # 旧版库没有 shingle 哈希，这些记录在增量归簇时不参与比较
+                self._conn.execute("ALTER TABLE dup_clusters ADD COLUMN shingles BLOB")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS dup_clusters_cluster ON dup_clusters (cluster_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lsh_buckets (bucket INTEGER NOT NULL, id INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS lsh_buckets_bucket ON lsh_buckets (bucket)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS lsh_buckets_id ON lsh_buckets (id)")
+            # 过滤字段的倒排索引：(字段, 值) -> id
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS facets (field TEXT NOT NULL, value TEXT NOT NULL, id INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS facets_value ON facets (field, value, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS facets_id ON facets (id)")
+            self._conn.commit()
+
+        # Streamlit 会在多个线程中复用同一个实例，sqlite3 连接本身不是线程安全的
+        self._lock = threading.Lock()
+        self._count = None
+
+    def __len__(self) -> int:
+        if self._count is None:
+            with self._lock:
+                self._count = self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        return self._count
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        """按 id 读取单条记录，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM records WHERE id = ?", (int(record_id),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __getitem__(self, record_id: int) -> Dict:
+        item = self.get(record_id)
+        if item is None:
+            raise IndexError(record_id)
+        return item
+
+    def get_serialized(self, ids: Iterable[int], chunk_size: int = 500) -> Dict[int, str]:
+        """批量读取未解码的记录 {id: JSON 文本}，按块查询以避开 SQLite 参数个数上限"""
+        ids = [int(i) for i in ids]
+        found = {}
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM records WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+            found.update(rows)
+        return found
+
+    def get_many(self, ids: List[int]) -> List[Dict]:
+        """批量读取，按传入顺序返回，跳过不存在的 id"""
+        ids = [int(i) for i in ids]
+        found = self.get_serialized(ids)
+        return [json.loads(found[i]) for i in ids if i in found]
+
+    def ids(self) -> Iterator[int]:
+        """按顺序遍历全部 id（不解码记录）"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM records ORDER BY id").fetchall()
+        for (record_id,) in rows:
+            yield record_id
+
+    def items(self, batch_size: int = 1000) -> Iterator[Tuple[int, Dict]]:
+        """按 id 顺序遍历全部 (id, 记录)，分批读取以控制内存"""
+        last_id = None
+        while True:
+            with self._lock:
+                if last_id is None:
+                    rows = self._conn.execute(
+                        "SELECT id, data FROM records ORDER BY id LIMIT ?", (batch_size,)
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT id, data FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                        (last_id, batch_size),
+                    ).fetchall()
+            if not rows:
+                return
+            for record_id, data in rows:
+                yield record_id, json.loads(data)
+            last_id = rows[-1][0]
+
+    def __iter__(self) -> Iterator[Dict]:
+        for _, item in self.items():
+            yield item
+
+    def add(self, records: Iterable[Tuple[int, Dict]]) -> None:
+        """在一个事务中写入 (id, 记录) 及其倒排索引，id 已存在时覆盖"""
+        records = [(int(i), item) for i, item in records]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records (id, data) VALUES (?, ?)",
+                ((i, serialize_record(item)) for i, item in records),
+            )
+            self._conn.executemany("DELETE FROM facets WHERE id = ?", ((i,) for i, _ in records))
+            self._conn.executemany(
+                "INSERT INTO facets (field, value, id) VALUES (?, ?, ?)",
+                ((field, value, i) for i, item in records for field, value in record_facets(item)),
+            )
+        self._count = None
+
+    def delete(self, ids: Iterable[int]) -> int:
+        """在一个事务中删除记录（连同近重复信息），返回实际删除的条数"""
+        ids = [(int(i),) for i in ids]
+        with self._lock, self._conn:
+            cursor = self._conn.executemany("DELETE FROM records WHERE id = ?", ids)
+            deleted = cursor.rowcount
+            self._conn.executemany("DELETE FROM dup_clusters WHERE id = ?", ids)
+            self._conn.executemany("DELETE FROM lsh_buckets WHERE id = ?", ids)
+            self._conn.executemany("DELETE FROM facets WHERE id = ?", ids)
+        self._count = None
+        return deleted
+
+    def add_near_dups(self, rows: Iterable[Tuple[int, int, np.ndarray]], buckets: Iterable[Tuple[int, int]]) -> None:
+        """写入记录的近重复簇 id、shingle 哈希与 LSH 桶（只有簇代表登记在桶中），覆盖这些记录原有的桶"""
+        rows = [(int(i), int(c), np.asarray(h, dtype='uint32').tobytes()) for i, c, h in rows]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM lsh_buckets WHERE id = ?", ((i,) for i, _, _ in rows))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO dup_clusters (id, cluster_id, shingles) VALUES (?, ?, ?)", rows
+            )
+            self._conn.executemany(
+                "INSERT INTO lsh_buckets (bucket, id) VALUES (?, ?)",
+                ((int(b), int(i)) for b, i in buckets),
+            )
+
+    def get_near_dups(self, ids: Iterable[int], chunk_size: int = 500) -> Dict[int, Tuple[int, np.ndarray]]:
+        """批量读取 {id: (簇 id, shingle 哈希)}，跳过没有 shingle 哈希的记录"""
+        ids = [int(i) for i in ids]
+        found = {}
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, cluster_id, shingles FROM dup_clusters "
+                    f"WHERE id IN ({placeholders}) AND shingles IS NOT NULL", chunk
+                ).fetchall()
+            found.update((i, (c, np.frombuffer(h, dtype='uint32'))) for i, c, h in rows)
+        return found
+
+    def has_near_dups(self) -> bool:
+        """库中是否有近重复簇信息（旧版库没有对应的表）"""
+        try:
+            with self._lock:
+                return self._conn.execute("SELECT 1 FROM dup_clusters LIMIT 1").fetchone() is not None
+        except sqlite3.OperationalError:
+            return False
+
+    def get_clusters(self, ids: Iterable[int], chunk_size: int = 500) -> Dict[int, int]:
+        """批量读取 {id: 簇 id}，没有簇信息的 id 不出现在结果中"""
+        ids = [int(i) for i in ids]
+        found = {}
+        try:
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                with self._lock:
+                    rows = self._conn.execute(
+                        f"SELECT id, cluster_id FROM dup_clusters WHERE id IN ({placeholders})", chunk
+                    ).fetchall()
+                found.update(rows)
+        except sqlite3.OperationalError:
+            return {}
+        return found
+
+    def filter_ids(self, filters) -> np.ndarray:
+        """
+        按倒排索引求满足过滤条件的 id（升序 int64）
+
+        Args:
+            filters: {字段: 值 或 值列表} 或 normalize_filters 的结果
+        """
+        if isinstance(filters, dict):
+            filters = normalize_filters(filters)
+        result = None
+        for field, values in filters:
+            placeholders = ",".join("?" * len(values))
+            try:
+                with self._lock:
+                    rows = self._conn.execute(
+                        f"SELECT DISTINCT id FROM facets WHERE field = ? AND value IN ({placeholders})",
+                        (field, *values),
+                    ).fetchall()
+            except sqlite3.OperationalError:
+                raise ValueError("元数据库中没有倒排索引，不支持过滤检索，请全量重建索引")
+            ids = np.fromiter((i for (i,) in rows), dtype='int64', count=len(rows))
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+            if len(result) == 0:
+                break
+        return np.unique(result) if result is not None else np.empty(0, dtype='int64')
+
+    def facet_values(self, field: str) -> List[Tuple[str, int]]:
+        """某个过滤字段的全部取值及记录数，按记录数降序"""
+        try:
+            with self._lock:
+                return self._conn.execute(
+                    "SELECT value, COUNT(*) AS n FROM facets WHERE field = ? GROUP BY value ORDER BY n DESC",
+                    (field,),
+                ).fetchall()
+        except sqlite3.OperationalError:
+            return []
+
+    def cluster_count(self) -> int:
+        """近重复簇的个数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT cluster_id) FROM dup_clusters").fetchone()[0]
+
+    def bucket_members(self, buckets: Iterable[int], chunk_size: int = 500) -> Dict[int, List[int]]:
+        """给定 LSH 桶中的记录：{桶编号: [id, ...]}"""
+        buckets = [int(b) for b in buckets]
+        members = {}
+        for start in range(0, len(buckets), chunk_size):
+            chunk = buckets[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT bucket, id FROM lsh_buckets WHERE bucket IN ({placeholders})", chunk
+                ).fetchall()
+            for bucket, i in rows:
+                members.setdefault(bucket, []).append(i)
+        return members
+
+    def close(self):
+        self._conn.close()
+
+
+def iter_jsonl(jsonl_path: str) -> Iterator[Dict]:
+    """逐行读取 JSONL，跳过空行"""
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def resolve_jsonl_paths(paths) -> List[str]:
+    """把文件路径、路径列表或目录（取其中全部 .jsonl，按文件名排序）展开为文件列表"""
+    if isinstance(paths, str):
+        paths = [paths]
+    resolved = []
+    for path in paths:
+        if os.path.isdir(path):
+            resolved.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith('.jsonl'))
+        else:
+            resolved.append(path)
+    return resolved
+
+
+def scan_record_ids(paths: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    第一遍扫描：按文件顺序返回每条记录的稳定 id，以及"是否为该 id 最后一次出现"的掩码
+
+    只保留 int64 id 与布尔掩码（每条约 9 字节），用于在分块处理时让重复记录以最后一次出现为准。
+    """
+    ids = np.fromiter((record_id(item) for path in paths for item in iter_jsonl(path)), dtype='int64')
+    # 倒序后 np.unique 取到的第一次出现即原顺序中的最后一次出现
+    _, last_from_end = np.unique(ids[::-1], return_index=True)
+    latest = np.zeros(len(ids), dtype=bool)
+    latest[len(ids) - 1 - last_from_end] = True
+    return ids, latest
+
+
+def iter_jsonl_chunks(paths: List[str], chunk_size: int) -> Iterator[List[Dict]]:
+    """依次读取多个 JSONL 文件，每次产出最多 chunk_size 条记录"""
+    chunk = []
+    for path in paths:
+        for item in iter_jsonl(path):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,133 @@
+"""
+近重复检测模块：基于字符 shingle 的 MinHash/LSH，建库时把相似的提示词归入同一个近重复簇
+
+检索时只需比较簇 id，不再对候选结果两两计算文本相似度。
+"""
+import hashlib
+import zlib
+import numpy as np
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from config import NEAR_DUP_THRESHOLD, NEAR_DUP_SHINGLE, NEAR_DUP_PERMUTATIONS, NEAR_DUP_BANDS
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+def dedup_text(item: Dict) -> str:
+    """参与近重复判断的文本：原始提示词，统一小写并折叠空白"""
+    return " ".join((item.get("raw") or "").lower().split())
+
+
+def shingle_hashes(text: str, size: int) -> np.ndarray:
+    """字符级 shingle（中文没有空格分词，按字符切分更稳定）的 32 位哈希，去重后升序排列"""
+    if len(text) <= size:
+        shingles = [text] if text else []
+    else:
+        shingles = [text[i:i + size] for i in range(len(text) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                                 dtype=np.uint32, count=len(shingles)))
+
+
+def jaccard_many(hashes: np.ndarray, candidates: List[np.ndarray]) -> np.ndarray:
+    """一条记录与多个候选之间的精确 Jaccard，一次向量化算完"""
+    lengths = np.fromiter((len(c) for c in candidates), dtype=np.int64, count=len(candidates))
+    if not lengths.sum():
+        return np.zeros(len(candidates))
+    owners = np.repeat(np.arange(len(candidates)), lengths)
+    inter = np.bincount(owners, weights=np.isin(np.concatenate(candidates), hashes),
+                        minlength=len(candidates))
+    return inter / np.maximum(len(hashes) + lengths - inter, 1)
+
+
+class NearDupDetector:
+    """
+    MinHash + LSH 近重复检测（leader 聚类）
+
+    每条记录的 shingle 集合压缩为 NEAR_DUP_PERMUTATIONS 个最小哈希，按 NEAR_DUP_BANDS 个分段
+    分桶。每个簇有一个代表（第一条入簇的记录，簇 id 即其记录 id），桶中只登记代表；新记录只与
+    同桶的代表计算精确 Jaccard，加入得分最高且超过阈值的簇，否则自成一簇。簇之间不做传递合并，
+    同簇记录都与代表相似，不会因为相似链把无关的提示词连成一个大簇。桶与 shingle 哈希存放在
+    元数据库中，建库时逐块归簇，内存占用与数据总量无关。
+    """
+
+    def __init__(self, threshold: float = None, shingle_size: int = None,
+                 num_perm: int = None, bands: int = None, seed: int = 1):
+        self.threshold = NEAR_DUP_THRESHOLD if threshold is None else threshold
+        self.shingle_size = shingle_size or NEAR_DUP_SHINGLE
+        self.num_perm = num_perm or NEAR_DUP_PERMUTATIONS
+        self.bands = bands or NEAR_DUP_BANDS
+        if self.num_perm % self.bands:
+            raise ValueError(f"NEAR_DUP_PERMUTATIONS ({self.num_perm}) 必须是 NEAR_DUP_BANDS ({self.bands}) 的整数倍")
+
+        # 哈希族 h(x) = (a*x + b) mod p；a, b < 2^31 且 x < 2^32，乘加不会溢出 uint64
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, self.num_perm, dtype=np.uint64)
+
+    def shingle_hashes(self, item: Dict) -> np.ndarray:
+        return shingle_hashes(dedup_text(item), self.shingle_size)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        """MinHash 签名"""
+        x = hashes.astype(np.uint64)
+        return ((x[:, None] * self._a + self._b) % _MERSENNE_PRIME).min(axis=0)
+
+    def bucket_keys(self, signature: np.ndarray) -> List[int]:
+        """LSH 桶编号：每个分段的签名哈希为一个 int64，分段序号参与哈希以区分不同分段"""
+        keys = []
+        for band, chunk in enumerate(signature.reshape(self.bands, -1)):
+            digest = hashlib.blake2b(chunk.tobytes(), digest_size=8, person=band.to_bytes(2, "big")).digest()
+            keys.append(int.from_bytes(digest, "big", signed=True))
+        return keys
+
+    def assign(self, records: Dict[int, Dict], store) -> Tuple[List[Tuple[int, int, np.ndarray]], List[Tuple[int, int]]]:
+        """
+        增量归簇：与同桶的已有簇代表及本批新产生的代表比较，加入 Jaccard 最高且不低于阈值的簇
+
+        Args:
+            records: {稳定 id: 记录}，需已写入 store
+            store: SqliteMetadataStore，提供已有记录的桶、簇与 shingle 哈希
+
+        Returns:
+            ([(id, 簇 id, shingle 哈希)], [(桶编号, 簇代表 id)])，交给 store.add_near_dups 写入；
+            没有 raw 的记录自成一簇
+        """
+        prepared = {}
+        for rid, item in records.items():
+            hashes = self.shingle_hashes(item)
+            prepared[rid] = (hashes, self.bucket_keys(self.signature(hashes)) if len(hashes) else [])
+
+        # 已归簇的记录被更新时 raw 不变（id 由 raw 决定），沿用原来的簇，簇代表仍是代表
+        previous = {i: cluster for i, (cluster, _) in store.get_near_dups(records.keys()).items()}
+        # 整批一次取回同桶的已有簇代表（旧版库中桶里还登记了普通成员，在这里排除）
+        members = store.bucket_members({key for _, keys in prepared.values() for key in keys})
+        existing = store.get_near_dups({i for ids in members.values() for i in ids} - set(records))
+        leaders = {i: hashes for i, (cluster, hashes) in existing.items() if cluster == i}
+
+        batch_buckets = defaultdict(list)
+        rows, bucket_rows = [], []
+        for rid, (hashes, keys) in prepared.items():
+            if rid in previous:
+                cluster = previous[rid]
+            else:
+                candidates = set()
+                for key in keys:
+                    candidates.update(i for i in members.get(key, ()) if i in leaders)
+                    candidates.update(batch_buckets.get(key, ()))
+                candidates = sorted(candidates)
+
+                cluster = rid
+                if candidates:
+                    scores = jaccard_many(hashes, [leaders[c] for c in candidates])
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        cluster = candidates[best]
+
+            rows.append((rid, cluster, hashes))
+            if cluster == rid:
+                leaders[rid] = hashes
+                for key in keys:
+                    batch_buckets[key].append(rid)
+                    bucket_rows.append((key, rid))
+        return rows, bucket_rows
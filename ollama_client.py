@@ -1,11 +1,17 @@
 """
 Ollama 客户端：负责与 PC 端的 Ollama 服务通信
+
+同步接口基于 requests；异步接口（agenerate / astream_generate）基于 aiohttp，
+同一事件循环上的并发请求共用一个连接池（上限 LLM_MAX_CONNECTIONS），事件循环结束前调用 aclose()
 """
+import asyncio
 import requests
 import json
 import time
-from typing import Dict, Optional, Generator
-from config import OLLAMA_HOST, OLLAMA_MODEL, REQUEST_TIMEOUT, MAX_RETRIES,OLLAMA_KEEP_ALIVE
+from typing import AsyncGenerator, Dict, Generator
+from config import (
+    OLLAMA_HOST, OLLAMA_MODEL, REQUEST_TIMEOUT, MAX_RETRIES, OLLAMA_KEEP_ALIVE, LLM_MAX_CONNECTIONS,
+)
 
 
 class OllamaClient:
@@ -17,6 +23,14 @@ class OllamaClient:
         self.base_url = f"{self.host}/api"
         # 复用 HTTP 连接，降低 TCP/TLS/握手开销
         self.session = requests.Session()
+        # aiohttp 会话不能跨事件循环使用，每个事件循环一个，首次异步调用时创建
+        self._async_sessions = {}
+
+    def set_pool_size(self, size: int):
+        """同步会话的连接池大小，多线程并发请求时需不小于线程数（requests 默认 10）"""
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def warm_connection(self, timeout: int = 5):
         """
@@ -63,19 +77,7 @@ class OllamaClient:
         Returns:
             生成的文本内容
         """
-        data = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": temperature,
-                "keep_alive": OLLAMA_KEEP_ALIVE,
-            }
-        }
-        
-        if system:
-            data["system"] = system
-        
+        data = self._generate_data(prompt, system, temperature, stream=False)
         response = self._make_request("generate", data)
         return response.get("response", "")
 
@@ -88,19 +90,7 @@ class OllamaClient:
         """
         流式生成文本，逐步返回 token
         """
-        data = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": True,
-            "options": {
-                "temperature": temperature,
-                "keep_alive": OLLAMA_KEEP_ALIVE,
-                }
-        }
-
-        if system:
-            data["system"] = system
-
+        data = self._generate_data(prompt, system, temperature, stream=True)
         with self.session.post(
             f"{self.base_url}/generate",
             json=data,
@@ -123,6 +113,98 @@ class OllamaClient:
                 if token:
                     yield token
     
+    def _generate_data(self, prompt: str, system: str, temperature: float, stream: bool) -> Dict:
+        """/api/generate 的请求体"""
+        data = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": temperature,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+            }
+        }
+        if system:
+            data["system"] = system
+        return data
+    
+    async def _get_async_session(self):
+        """当前事件循环上的 aiohttp 会话，连接数不超过 LLM_MAX_CONNECTIONS，超出的请求排队等待空闲连接"""
+        import aiohttp
+        await self._close_orphan_sessions()
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=LLM_MAX_CONNECTIONS),
+                # 与 requests 的 timeout 一致：限制单次读取的等待时间，不限制整个流式生成的时长
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=REQUEST_TIMEOUT),
+            )
+            self._async_sessions[loop] = session
+        return session
+    
+    async def _close_orphan_sessions(self):
+        """关闭事件循环已结束、却没有调用 aclose() 的会话，释放其连接池"""
+        for loop in [loop for loop in self._async_sessions if loop.is_closed()]:
+            session = self._async_sessions.pop(loop)
+            if session.closed:
+                continue
+            print("⚠️  事件循环结束前没有调用 OllamaClient.aclose()，在新的事件循环中关闭旧会话")
+            try:
+                await session.close()
+            except Exception as e:
+                print(f"⚠️  关闭旧会话失败: {e}")
+    
+    async def agenerate(self, prompt: str, system: str = None, temperature: float = 0.7) -> str:
+        """generate 的异步版本，失败时按指数退避重试"""
+        import aiohttp
+        data = self._generate_data(prompt, system, temperature, stream=False)
+        for retry_count in range(MAX_RETRIES + 1):
+            try:
+                session = await self._get_async_session()
+                async with session.post(f"{self.base_url}/generate", json=data) as response:
+                    response.raise_for_status()
+                    return (await response.json()).get("response", "")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if retry_count == MAX_RETRIES:
+                    raise Exception(f"请求失败，已重试 {MAX_RETRIES} 次: {str(e)}")
+                wait_time = 2 ** retry_count  # 指数退避
+                print(f"请求失败，{wait_time}秒后重试... (尝试 {retry_count + 1}/{MAX_RETRIES})")
+                await asyncio.sleep(wait_time)
+    
+    async def astream_generate(
+        self,
+        prompt: str,
+        system: str = None,
+        temperature: float = 0.7,
+    ) -> AsyncGenerator[str, None]:
+        """stream_generate 的异步版本，逐步返回 token"""
+        data = self._generate_data(prompt, system, temperature, stream=True)
+        session = await self._get_async_session()
+        async with session.post(f"{self.base_url}/generate", json=data) as response:
+            response.raise_for_status()
+            # 按行读取 NDJSON
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    obj = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if obj.get("done"):
+                    break
+                token = obj.get("response", "")
+                if token:
+                    yield token
+    
+    async def aclose(self):
+        """关闭当前事件循环上的异步会话（以及已结束的事件循环遗留的会话），在事件循环结束前调用"""
+        await self._close_orphan_sessions()
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+    
     def chat(self, messages: list, temperature: float = 0.7) -> str:
         """
         对话模式生成
@@ -0,0 +1,159 @@
+"""
+ONNX Runtime Embedding 后端：把 sentence-transformers 模型导出为 ONNX 并做 int8 动态量化
+
+CPU 上 int8 矩阵乘比 PyTorch 全精度快得多，模型体积也缩小到约 1/4。
+导出结果缓存在 MODEL_CACHE_DIR/onnx/ 下，只在第一次使用时导出（需要 torch、onnx 与 onnxruntime），
+之后加载只需要 onnxruntime 与分词器。encode() 与 SentenceTransformer.encode 的用法一致。
+"""
+import json
+import os
+import shutil
+import numpy as np
+from typing import List
+from tqdm import tqdm
+from config import MODEL_CACHE_DIR
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx_int8")
+
+# 导出目录中的文件
+ONNX_MODEL_NAME = "model.int8.onnx"
+ONNX_CONFIG_NAME = "encoder.json"
+
+
+def onnx_model_dir(model_name: str, cache_folder: str = None) -> str:
+    """量化模型的缓存目录"""
+    return os.path.join(cache_folder or MODEL_CACHE_DIR, "onnx", model_name.replace("/", "--") + "-int8")
+
+
+def export_onnx_int8(model_name: str, output_dir: str, cache_folder: str = None, local_files_only: bool = False):
+    """
+    导出并量化：SentenceTransformer 的 Transformer 部分导出为 ONNX（fp32），
+    再用 onnxruntime 做权重 int8 动态量化；池化方式与是否归一化记录在 encoder.json 中，推理时在 NumPy 中完成
+    """
+    try:
+        import torch
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        from sentence_transformers import SentenceTransformer
+        from sentence_transformers.models import Normalize, Pooling
+    except ImportError as e:
+        raise ImportError(f"导出 ONNX 模型需要 torch、onnx 与 onnxruntime（pip install onnx onnxruntime）: {e}")
+
+    print(f"正在导出 ONNX int8 模型: {model_name} -> {output_dir}（只需一次，可能需要几分钟）...")
+    st = SentenceTransformer(model_name, cache_folder=cache_folder or MODEL_CACHE_DIR,
+                             local_files_only=local_files_only, device="cpu")
+    transformer = st[0]
+    pooling = next((m for m in st if isinstance(m, Pooling)), None)
+    pooling_mode = pooling.get_pooling_mode_str() if pooling is not None else "cls"
+    if pooling_mode not in ("cls", "mean"):
+        raise ValueError(f"ONNX 后端只支持 cls / mean 池化，{model_name} 使用的是 {pooling_mode}")
+
+    tokenizer = transformer.tokenizer
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in tokenizer.model_input_names]
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    # fp32 模型只是中间产物（大模型会带外部权重文件），量化后删除
+    export_dir = os.path.join(output_dir, "export")
+    shutil.rmtree(export_dir, ignore_errors=True)
+    os.makedirs(export_dir)
+    fp32_path = os.path.join(export_dir, "model.onnx")
+    dummy = tokenizer(["示例文本 example"], return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    with torch.inference_mode():
+        torch.onnx.export(
+            _Encoder(transformer.auto_model.eval()),
+            tuple(dummy[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            do_constant_folding=True,
+        )
+
+    tmp_path = os.path.join(output_dir, ONNX_MODEL_NAME + ".tmp")
+    quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, os.path.join(output_dir, ONNX_MODEL_NAME))
+    shutil.rmtree(export_dir, ignore_errors=True)
+
+    tokenizer.save_pretrained(output_dir)
+    # 配置文件最后写入，存在即表示导出完整
+    with open(os.path.join(output_dir, ONNX_CONFIG_NAME), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model_name,
+            "pooling": pooling_mode,
+            "normalize": any(isinstance(m, Normalize) for m in st),
+            "max_seq_length": transformer.max_seq_length,
+            "input_names": input_names,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"✓ ONNX int8 模型已导出: {output_dir}")
+
+
+class OnnxEncoder:
+    """
+    基于 ONNX Runtime 的 int8 量化 Embedding 编码器
+
+    Args:
+        model_name: sentence-transformers 模型名
+        cache_folder: 模型缓存目录（默认 MODEL_CACHE_DIR）
+        local_files_only: 导出时是否只使用本地模型文件
+        threads: 算子内线程数，0 表示由 onnxruntime 自动决定
+    """
+
+    def __init__(self, model_name: str, cache_folder: str = None, local_files_only: bool = False,
+                 threads: int = 0):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(f"EMBEDDING_BACKEND=onnx_int8 需要 onnxruntime（pip install onnxruntime）: {e}")
+
+        self.model_dir = onnx_model_dir(model_name, cache_folder)
+        config_path = os.path.join(self.model_dir, ONNX_CONFIG_NAME)
+        if not os.path.exists(config_path):
+            os.makedirs(self.model_dir, exist_ok=True)
+            export_onnx_int8(model_name, self.model_dir, cache_folder, local_files_only)
+        with open(config_path, encoding="utf-8") as f:
+            config = json.load(f)
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.max_seq_length = config["max_seq_length"]
+        self.input_names = config["input_names"]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(self.model_dir, ONNX_MODEL_NAME), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """编码一批文本，返回 float32 矩阵（与 SentenceTransformer.encode 的输出一致）"""
+        batches = range(0, len(texts), batch_size)
+        outputs = []
+        for start in tqdm(batches, desc="编码中", disable=not show_progress_bar):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors="np",
+            )
+            hidden = self.session.run(None, {name: inputs[name].astype('int64') for name in self.input_names})[0]
+            if self.pooling == "cls":
+                embeddings = hidden[:, 0]
+            else:
+                mask = inputs["attention_mask"][..., None].astype('float32')
+                embeddings = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.normalize:
+                embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            outputs.append(embeddings.astype('float32'))
+        if not outputs:
+            return np.empty((0, self.session.get_outputs()[0].shape[-1] or 0), dtype='float32')
+        return np.concatenate(outputs)
@@ -84,7 +84,7 @@ def main():
             print(f"   现有记录数: {existing_count} 条")
             print(f"   新数据: {len(texts)} 条")
             print("\n请选择处理模式:")
-            print("  1. 追加模式 (推荐) - 将新数据添加到现有知识库，避免重复")
+            print("  1. 追加模式 (推荐) - 将新数据添加到现有知识库，避免重复；上次处理中断时从断点继续")
             print("  2. 覆盖模式 - 删除旧数据，只保留新数据")
             print("  3. 取消")
             
@@ -1,10 +1,15 @@
 """
 RAG 生成模块：结合检索结果和用户意图，生成最终 Prompt
+
+同步接口 generate / stream_generate；异步接口 agenerate / astream_generate 在线程池中执行检索，
+生成调用客户端的异步接口，一个事件循环可以同时驱动大量生成请求；事件循环结束前调用 aclose()
 """
+import asyncio
+import time
 from typing import List, Dict, Any
 from ollama_client import OllamaClient
 from vector_store import VectorStore
-from config import TOP_K
+from config import TOP_K, CROSS_ENCODER_RERANK, CROSS_ENCODER_CANDIDATES
 try:
     from prompt_templates import STYLES
 except ImportError:
@@ -14,10 +19,16 @@ except ImportError:
 class RAGGenerator:
     """RAG 检索增强生成器"""
     
-    def __init__(self, vector_store: VectorStore, client: Any = None):
+    def __init__(self, vector_store: VectorStore, client: Any = None, reranker: Any = None):
+        # 进程内的 VectorStore，或检索服务客户端 RetrievalClient（接口相同）
         self.vector_store = vector_store
         # 默认使用 Ollama，但也支持传入 GeminiClient
         self.client = client or OllamaClient()
+        # 可选的 Cross-Encoder 重排（需要 torch / transformers）
+        if reranker is None and CROSS_ENCODER_RERANK:
+            from reranker import CrossEncoderReranker
+            reranker = CrossEncoderReranker()
+        self.reranker = reranker
         self.current_style = "generic"
         self.system_prompt = self._get_system_prompt()
     
@@ -38,6 +49,17 @@ class RAGGenerator:
         style = STYLES.get(self.current_style, STYLES.get("generic"))
         return style.get("system_prompt", "")
     
+    def _retrieve(self, user_intent: str, top_k: int) -> List[Dict]:
+        """检索参考素材；开启重排时先取更大的候选池，在耗时预算内用 Cross-Encoder 重新排序"""
+        if self.reranker is None:
+            return [item for item, _ in self.vector_store.search(user_intent, top_k=top_k)]
+        
+        # 预算从请求开始计时，包含检索本身的耗时
+        deadline = time.perf_counter() + self.reranker.budget_ms / 1000
+        pool = self.vector_store.search(user_intent, top_k=max(top_k, CROSS_ENCODER_CANDIDATES))
+        ranked, _ = self.reranker.rerank(user_intent, pool, top_k, deadline=deadline)
+        return [item for item, _ in ranked]
+    
     def _build_context(self, user_intent: str, retrieved_items: List[Dict]) -> str:
         """构建上下文提示词"""
         context_parts = [f"用户意图: {user_intent}\n\n参考素材（共{len(retrieved_items)}条）:\n"]
@@ -66,9 +88,8 @@ class RAGGenerator:
         """生成最终 Prompt"""
         top_k = top_k or TOP_K
         
-        # 1. 向量检索
-        retrieved = self.vector_store.search(user_intent, top_k=top_k)
-        retrieved_items = [item for item, _ in retrieved]
+        # 1. 向量检索（可选重排）
+        retrieved_items = self._retrieve(user_intent, top_k)
         
         # 2. 构建上下文
         context = self._build_context(user_intent, retrieved_items)
@@ -92,9 +113,8 @@ class RAGGenerator:
         """流式生成 Prompt"""
         top_k = top_k or TOP_K
 
-        # 1. 向量检索
-        retrieved = self.vector_store.search(user_intent, top_k=top_k)
-        retrieved_items = [item for item, _ in retrieved]
+        # 1. 向量检索（可选重排）
+        retrieved_items = self._retrieve(user_intent, top_k)
 
         # 2. 构建上下文
         context = self._build_context(user_intent, retrieved_items)
@@ -108,3 +128,51 @@ class RAGGenerator:
         )
 
         return token_generator, retrieved_items
+
+    async def _aretrieve(self, user_intent: str, top_k: int) -> List[Dict]:
+        """检索（编码、FAISS 检索与重排都是阻塞计算）放到线程池执行，不阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._retrieve, user_intent, top_k)
+    
+    async def agenerate(self, user_intent: str, top_k: int = None) -> Dict:
+        """generate 的异步版本"""
+        top_k = top_k or TOP_K
+        retrieved_items = await self._aretrieve(user_intent, top_k)
+        context = self._build_context(user_intent, retrieved_items)
+        user_prompt = f"{context}\n\n请根据以上信息，生成一段高质量的中文绘图提示词："
+        
+        final_prompt = await self.client.agenerate(
+            prompt=user_prompt,
+            system=self.system_prompt,
+            temperature=0.7
+        )
+        
+        return {
+            "final_prompt": final_prompt.strip(),
+            "references": retrieved_items,
+            "user_intent": user_intent
+        }
+    
+    async def astream_generate(self, user_intent: str, top_k: int = None):
+        """
+        stream_generate 的异步版本
+        
+        Returns:
+            (异步 token 生成器, 参考素材)，用法: tokens, refs = await rag.astream_generate(...); async for t in tokens
+        """
+        top_k = top_k or TOP_K
+        retrieved_items = await self._aretrieve(user_intent, top_k)
+        context = self._build_context(user_intent, retrieved_items)
+        user_prompt = f"{context}\n\n请根据以上信息，生成一段高质量的中文绘图提示词："
+        
+        token_generator = self.client.astream_generate(
+            prompt=user_prompt,
+            system=self.system_prompt,
+            temperature=0.7
+        )
+        return token_generator, retrieved_items
+
+    async def aclose(self):
+        """关闭生成客户端在当前事件循环上的异步连接，服务端关闭或事件循环结束前调用"""
+        aclose = getattr(self.client, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,126 @@
+"""
+重排模块：用 Cross-Encoder 对向量检索的候选池重新打分，带单次请求的耗时预算
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from typing import Dict, List, Tuple
+from config import (
+    MODEL_CACHE_DIR,
+    LOCAL_FILES_ONLY,
+    CROSS_ENCODER_MODEL,
+    CROSS_ENCODER_BUDGET_MS,
+    CROSS_ENCODER_MAX_LENGTH,
+)
+
+
+def candidate_text(item: Dict) -> str:
+    """候选参与打分的文本：优先使用原始提示词"""
+    return (item.get("raw") or item.get("subject") or "").strip()
+
+
+class CrossEncoderReranker:
+    """
+    Cross-Encoder 重排器
+    
+    全部 (查询, 候选) 对拼成一个批次做一次前向计算。计算在后台线程中进行，
+    超出预算时直接返回原顺序；根据历史耗时预估本次会超时的请求不再启动计算。
+    """
+    
+    # 类级别的缓存，所有实例共享同一个模型、工作线程与耗时统计
+    _model_cache = {}
+    
+    def __init__(self, model_name: str = None, budget_ms: int = None):
+        self.model_name = model_name or CROSS_ENCODER_MODEL
+        self.budget_ms = CROSS_ENCODER_BUDGET_MS if budget_ms is None else budget_ms
+        
+        if self.model_name not in CrossEncoderReranker._model_cache:
+            print(f"正在加载重排模型: {self.model_name}...")
+            try:
+                tokenizer = AutoTokenizer.from_pretrained(
+                    self.model_name, cache_dir=MODEL_CACHE_DIR, local_files_only=LOCAL_FILES_ONLY
+                )
+                model = AutoModelForSequenceClassification.from_pretrained(
+                    self.model_name, cache_dir=MODEL_CACHE_DIR, local_files_only=LOCAL_FILES_ONLY
+                ).eval()
+            except Exception as e:
+                print(f"✗ 重排模型加载失败: {e}")
+                raise
+            CrossEncoderReranker._model_cache[self.model_name] = {
+                "tokenizer": tokenizer,
+                "model": model,
+                # 同一时间只允许一次计算，超时的计算仍在进行时新请求直接降级
+                "lock": threading.Lock(),
+                "executor": ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker"),
+                # 每个候选对的平均耗时（毫秒，指数滑动平均）
+                "ms_per_pair": None,
+            }
+            print("✓ 重排模型加载完成")
+        
+        self._shared = CrossEncoderReranker._model_cache[self.model_name]
+        self.tokenizer = self._shared["tokenizer"]
+        self.model = self._shared["model"]
+    
+    def score(self, query: str, texts: List[str]) -> np.ndarray:
+        """一次前向计算全部 (查询, 候选) 对的相关度得分"""
+        inputs = self.tokenizer(
+            [query] * len(texts), texts, padding=True, truncation=True,
+            max_length=CROSS_ENCODER_MAX_LENGTH, return_tensors="pt",
+        )
+        with torch.inference_mode():
+            logits = self.model(**inputs).logits
+        # 单输出的重排模型取唯一一列；二分类模型取"相关"一列
+        return logits[:, -1].float().numpy()
+    
+    def rerank(self, query: str, results: List[Tuple[Dict, float]], top_k: int,
+               deadline: float = None) -> Tuple[List[Tuple[Dict, float]], bool]:
+        """
+        在预算内对检索结果重新排序
+        
+        Args:
+            query: 用户查询
+            results: VectorStore.search 返回的 (元数据, 距离) 列表
+            top_k: 保留数量
+            deadline: time.perf_counter() 下的截止时间，默认从现在起 budget_ms
+        
+        Returns:
+            (结果, 是否完成重排)；未完成时为原顺序的前 top_k 条
+        """
+        fallback = results[:top_k]
+        if len(results) < 2:
+            return fallback, False
+        
+        deadline = deadline or time.perf_counter() + self.budget_ms / 1000
+        remaining = deadline - time.perf_counter()
+        ms_per_pair = self._shared["ms_per_pair"]
+        if remaining <= 0 or (ms_per_pair is not None and ms_per_pair * len(results) > remaining * 1000):
+            return fallback, False
+        
+        lock = self._shared["lock"]
+        if not lock.acquire(blocking=False):
+            return fallback, False
+        
+        texts = [candidate_text(item) for item, _ in results]
+        
+        def _run():
+            start = time.perf_counter()
+            try:
+                return self.score(query, texts)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000 / len(texts)
+                previous = self._shared["ms_per_pair"]
+                self._shared["ms_per_pair"] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+                lock.release()
+        
+        future = self._shared["executor"].submit(_run)
+        try:
+            scores = future.result(timeout=remaining)
+        except TimeoutError:
+            print(f"⚠️  重排超出耗时预算 ({self.budget_ms}ms)，使用向量检索顺序")
+            return fallback, False
+        
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        return [results[i] for i in order], True
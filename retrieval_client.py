@@ -0,0 +1,52 @@
+"""
+检索服务客户端：与 VectorStore 相同的 search / search_batch 接口，通过 HTTP 调用 retrieval_server.py
+
+app.py 与 RAGGenerator 在配置了 RETRIEVAL_SERVER_URL 时使用它代替进程内的 VectorStore，
+本进程不需要加载 Embedding 模型与索引（也不导入 faiss / torch）。
+"""
+import requests
+from typing import Dict, List, Tuple
+from config import RETRIEVAL_SERVER_URL, RETRIEVAL_TIMEOUT
+
+
+class RetrievalClient:
+    """检索服务客户端"""
+
+    def __init__(self, url: str = None, timeout: int = None):
+        self.url = (url or RETRIEVAL_SERVER_URL).rstrip("/")
+        self.timeout = timeout or RETRIEVAL_TIMEOUT
+        # 复用 HTTP 连接
+        self.session = requests.Session()
+
+    def _request(self, method: str, endpoint: str, payload: Dict = None) -> Dict:
+        try:
+            response = self.session.request(method, f"{self.url}/{endpoint}", json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"检索服务不可用 ({self.url}): {e}")
+        if response.status_code == 400:
+            # 参数错误与进程内检索一样抛出 ValueError
+            raise ValueError(response.json().get("error", response.text))
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            raise ConnectionError(f"检索服务出错 ({self.url}): {e}")
+        return response.json()
+
+    def health(self) -> Dict:
+        """服务状态：记录数、模型与批处理统计"""
+        return self._request("GET", "health")
+
+    def search(self, query: str, top_k: int = 5, **kwargs) -> List[Tuple[Dict, float]]:
+        """
+        检索，参数与 VectorStore.search 相同（nprobe / ef_search / mmr / mmr_lambda / filters / mode）
+
+        Returns:
+            (元数据, 距离) 元组列表
+        """
+        result = self._request("POST", "search", {"query": query, "top_k": top_k, **kwargs})
+        return [(item, distance) for item, distance in result["results"]]
+
+    def search_batch(self, queries: List[str], top_k: int = 5, **kwargs) -> List[List[Tuple[Dict, float]]]:
+        """批量检索，参数与 VectorStore.search_batch 相同"""
+        result = self._request("POST", "search_batch", {"queries": queries, "top_k": top_k, **kwargs})
+        return [[(item, distance) for item, distance in results] for results in result["results"]]
@@ -0,0 +1,197 @@
+"""
+检索服务：在独立进程中加载一份 Embedding 模型与索引，通过 HTTP 提供检索
+
+Streamlit 等多个进程共用同一个检索服务，无需各自加载模型与索引。
+并发到达的查询在 RETRIEVAL_BATCH_WINDOW_MS 毫秒的窗口内合并为一批，
+只做一次编码和一次 FAISS 检索（VectorStore.search_batch）。
+
+接口:
+    POST /search        {"query": "...", "top_k": 5, ...}      → {"results": [[元数据, 距离], ...]}
+    POST /search_batch  {"queries": ["...", ...], "top_k": 5, ...} → {"results": [[[元数据, 距离], ...], ...]}
+    GET  /health        → 索引规模与批处理统计
+
+检索参数与 VectorStore.search 相同（top_k / nprobe / ef_search / mmr / mmr_lambda / filters / mode）。
+
+用法:
+    python retrieval_server.py [--host 127.0.0.1] [--port 8765] [--window-ms 5] [--max-batch 64]
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Tuple
+from aiohttp import web
+from vector_store import VectorStore
+from config import RETRIEVAL_HOST, RETRIEVAL_PORT, RETRIEVAL_BATCH_WINDOW_MS, RETRIEVAL_MAX_BATCH
+
+
+SEARCH_PARAMS = ("top_k", "nprobe", "ef_search", "mmr", "mmr_lambda", "filters", "mode")
+
+
+class MicroBatcher:
+    """
+    把并发的单条查询合并为批量检索
+
+    检索参数相同的查询才能合并：第一条查询到达后等待 window_ms，期间到达的同参数查询
+    进入同一批；攒满 max_batch 条时立即检索。检索在单独的线程中串行执行，不阻塞事件循环，
+    上一批检索期间到达的查询自然汇成下一批。
+    """
+
+    def __init__(self, store: VectorStore, window_ms: float, max_batch: int):
+        self.store = store
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        # 参数键 -> (检索参数, [(查询, Future)])
+        self._pending: Dict[str, Tuple[Dict, List]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval")
+        # 事件循环只弱引用任务，进行中的批次在这里保持引用，完成后移除
+        self._tasks = set()
+        self.queries = 0
+        self.batches = 0
+
+    async def search(self, query: str, params: Dict) -> List[Tuple[Dict, float]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        if key not in self._pending:
+            self._pending[key] = (params, [])
+            loop.call_later(self.window, self._flush, key, self._pending[key])
+        batch = self._pending[key][1]
+        batch.append((query, future))
+        if len(batch) >= self.max_batch:
+            self._flush(key, self._pending[key])
+        return await future
+
+    def _flush(self, key: str, entry: Tuple[Dict, List]):
+        # 窗口到期时这一批可能已因攒满提前检索
+        if self._pending.get(key) is not entry:
+            return
+        del self._pending[key]
+        task = asyncio.ensure_future(self._run(*entry))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, params: Dict, batch: List):
+        self.queries += len(batch)
+        self.batches += 1
+        queries = [query for query, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(self.store.search_batch, queries, **params)
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict:
+        return {
+            "queries": self.queries,
+            "batches": self.batches,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+STORE = web.AppKey("store", VectorStore)
+BATCHER = web.AppKey("batcher", MicroBatcher)
+
+
+def _serialize(results: List[Tuple[Dict, float]]) -> List:
+    return [[item, float(distance)] for item, distance in results]
+
+
+async def _parse_request(request: web.Request, field: str) -> Tuple[object, Dict]:
+    """解析请求体，返回 (必需字段的值, 检索参数)；请求不合法时抛出 ValueError"""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ValueError("请求体不是合法的 JSON")
+    if not isinstance(body, dict) or field not in body:
+        raise ValueError(f"请求体需为包含 {field} 的 JSON 对象")
+    unknown = set(body) - set(SEARCH_PARAMS) - {field}
+    if unknown:
+        raise ValueError(f"未知参数: {', '.join(sorted(unknown))}")
+    return body[field], {name: body[name] for name in SEARCH_PARAMS if body.get(name) is not None}
+
+
+async def handle_search(request: web.Request) -> web.Response:
+    try:
+        query, params = await _parse_request(request, "query")
+        if not isinstance(query, str):
+            raise ValueError("query 需为字符串")
+        results = await request.app[BATCHER].search(query, params)
+    except (ValueError, TypeError) as e:
+        return web.json_response({"error": str(e)}, status=400)
+    return web.json_response({"results": _serialize(results)})
+
+
+async def handle_search_batch(request: web.Request) -> web.Response:
+    batcher = request.app[BATCHER]
+    try:
+        queries, params = await _parse_request(request, "queries")
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise ValueError("queries 需为字符串列表")
+        # 逐条进入批处理器，与其他请求的并发查询合并
+        results = await asyncio.gather(*(batcher.search(query, params) for query in queries))
+    except (ValueError, TypeError) as e:
+        return web.json_response({"error": str(e)}, status=400)
+    return web.json_response({"results": [_serialize(r) for r in results]})
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    store = request.app[STORE]
+    return web.json_response({
+        "status": "ok",
+        "records": int(store.index.ntotal),
+        "model": store.encoder_key,
+        **request.app[BATCHER].stats(),
+    })
+
+
+def create_app(store: VectorStore, window_ms: float = None, max_batch: int = None) -> web.Application:
+    """创建检索服务应用（store 需已加载索引）"""
+    app = web.Application()
+    app[STORE] = store
+    app[BATCHER] = MicroBatcher(
+        store,
+        RETRIEVAL_BATCH_WINDOW_MS if window_ms is None else window_ms,
+        max_batch or RETRIEVAL_MAX_BATCH,
+    )
+    app.router.add_post("/search", handle_search)
+    app.router.add_post("/search_batch", handle_search_batch)
+    app.router.add_get("/health", handle_health)
+
+    async def _close(app):
+        app[BATCHER].close()
+    app.on_cleanup.append(_close)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索服务")
+    parser.add_argument("--host", default=RETRIEVAL_HOST)
+    parser.add_argument("--port", type=int, default=RETRIEVAL_PORT)
+    parser.add_argument("--window-ms", type=float, default=RETRIEVAL_BATCH_WINDOW_MS, help="合并并发查询的等待窗口")
+    parser.add_argument("--max-batch", type=int, default=RETRIEVAL_MAX_BATCH, help="单批最多查询数")
+    args = parser.parse_args()
+
+    store = VectorStore()
+    if not store.exists():
+        print("✗ 索引文件缺失，请先运行 python build_index.py")
+        return
+    store.load_index()
+    store.encoder.encode(["init"])
+    print(f"✓ 检索服务启动: http://{args.host}:{args.port}（批处理窗口 {args.window_ms}ms，单批最多 {args.max_batch} 条）")
+    web.run_app(create_app(store, args.window_ms, args.max_batch), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
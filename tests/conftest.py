@@ -0,0 +1,83 @@
+"""
+测试公共夹具：用确定性的假 Embedding 代替真实模型，索引与元数据写到临时目录
+"""
+import json
+import zlib
+import numpy as np
+import pytest
+from vector_store import VectorStore
+
+
+FAKE_MODEL = "fake/bigram-64"
+
+
+class FakeEncoder:
+    """字符二元组哈希到固定维度后归一化：不需要下载模型，文字相近的文本向量也相近"""
+
+    dimension = 64
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for i in range(max(len(text) - 1, 1)):
+                vectors[row, zlib.crc32(text[i:i + 2].encode("utf-8")) % self.dimension] += 1
+            norm = np.linalg.norm(vectors[row])
+            vectors[row] = vectors[row] / norm if norm else 1 / np.sqrt(self.dimension)
+        return vectors
+
+
+def make_record(raw, art_style, mood, visual_elements, technical=("高清",)):
+    return {
+        "subject": visual_elements[0],
+        "art_style": art_style,
+        "visual_elements": list(visual_elements),
+        "mood": mood,
+        "technical": list(technical),
+        "raw": raw,
+    }
+
+
+SAMPLE_RECORDS = [
+    make_record("水彩风格的宁静湖泊，远处是连绵的青山", "水彩", "宁静", ["湖泊", "远山"]),
+    make_record("阳光洒在开满鲜花的花园里，水彩质感", "水彩", "温暖", ["花园", "阳光"]),
+    make_record("雨夜的街道，昏黄的街灯倒映在积水中", "油画", "忧郁", ["雨夜", "街灯"]),
+    make_record("夕阳下金色的麦田，厚涂油画笔触", "油画", "宁静", ["麦田", "夕阳"]),
+    make_record("赛博朋克城市，霓虹灯闪烁的高楼之间飞过无人机", "赛博朋克", "紧张", ["霓虹灯", "高楼"]),
+    make_record("霓虹灯照亮的潮湿小巷，一个戴兜帽的身影", "赛博朋克", "神秘", ["霓虹灯", "小巷"]),
+    make_record("星空下的海滩，长曝光摄影，银河清晰可见", "摄影", "宁静", ["海滩", "星空"]),
+    make_record("热闹的街头集市，人群熙熙攘攘，街头摄影", "摄影", "欢快", ["街头", "人群"]),
+]
+
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in records:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def make_store(tmp_path, monkeypatch):
+    """返回 make_store(index_type) -> VectorStore，各测试使用独立的临时目录"""
+    # 向量缓存等相对路径也落在临时目录
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "db").mkdir()
+    VectorStore._encoder_cache[FAKE_MODEL] = FakeEncoder()
+    VectorStore._dimension_cache[FAKE_MODEL] = FakeEncoder.dimension
+
+    def factory(index_type="flat"):
+        return VectorStore(model_name=FAKE_MODEL, index_path=str(tmp_path / "db" / "test.index"),
+                           metadata_path=str(tmp_path / "db" / "metadata.jsonl"), index_type=index_type)
+
+    yield factory
+    VectorStore._encoder_cache.pop(FAKE_MODEL, None)
+    VectorStore._dimension_cache.pop(FAKE_MODEL, None)
+    VectorStore._query_embedding_cache.clear()
+
+
+@pytest.fixture
+def built_store(make_store, tmp_path):
+    """用 SAMPLE_RECORDS 全量构建的 flat 索引"""
+    store = make_store()
+    store.build_index(write_jsonl(tmp_path / "records.jsonl", SAMPLE_RECORDS), incremental=False)
+    return store
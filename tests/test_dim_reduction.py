@@ -0,0 +1,44 @@
+"""
+降维：PCA / 截断的拟合、变换与保存加载
+"""
+import numpy as np
+import pytest
+from dim_reduction import DimReducer
+
+
+@pytest.fixture
+def embeddings():
+    rng = np.random.default_rng(0)
+    # 方差集中在前几维的样本
+    samples = rng.normal(size=(200, 32)) * np.linspace(3, 0.1, 32)
+    return (samples / np.linalg.norm(samples, axis=1, keepdims=True)).astype('float32')
+
+
+@pytest.mark.parametrize("kind", ["pca", "truncate"])
+def test_fit_transform_save_load_round_trip(embeddings, tmp_path, kind):
+    reducer = DimReducer.fit(kind, embeddings, 8)
+    reduced = reducer.transform(embeddings)
+    assert reduced.shape == (len(embeddings), 8) and reduced.dtype == np.float32
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1, atol=1e-5)
+
+    path = str(tmp_path / "reducer.npz")
+    reducer.save(path)
+    loaded = DimReducer.load(path)
+    assert (loaded.kind, loaded.input_dim, loaded.output_dim) == (kind, 32, 8)
+    assert np.array_equal(loaded.transform(embeddings), reduced)
+
+
+def test_pca_keeps_nearest_neighbours(embeddings):
+    reduced = DimReducer.fit("pca", embeddings, 16).transform(embeddings)
+    original = np.argsort(-(embeddings @ embeddings[0]))[1:6]
+    projected = np.argsort(-(reduced @ reduced[0]))[1:11]
+    assert len(set(original) & set(projected)) >= 3
+
+
+def test_fit_rejects_invalid_dimensions(embeddings):
+    with pytest.raises(ValueError):
+        DimReducer.fit("pca", embeddings, 32)
+    with pytest.raises(ValueError):
+        DimReducer.fit("pca", embeddings[:4], 8)
+    with pytest.raises(ValueError):
+        DimReducer.fit("none", embeddings, 8)
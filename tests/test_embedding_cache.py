@@ -0,0 +1,59 @@
+"""
+向量缓存：追加写入后立即可查，重新打开后与写入内容一致
+"""
+import os
+import numpy as np
+from embedding_cache import EmbeddingCache
+
+
+def test_put_lookup_and_reopen(tmp_path, monkeypatch):
+    # 调小合并阈值，覆盖增量表与主表合并的路径
+    monkeypatch.setattr(EmbeddingCache, "_MIN_DELTA", 16)
+    cache = EmbeddingCache(str(tmp_path), "fake/model", 4)
+    rng = np.random.default_rng(0)
+    keys, vectors = [], []
+    for _ in range(20):
+        batch = np.unique(rng.integers(-2**62, 2**62, size=10, dtype=np.int64))
+        assert (cache.lookup(batch) == -1).all()
+        batch_vectors = rng.random((len(batch), 4), dtype=np.float32)
+        cache.put(batch, batch_vectors)
+        keys.append(batch)
+        vectors.append(batch_vectors)
+        rows = cache.lookup(keys[0])
+        np.testing.assert_array_equal(cache.read(rows), vectors[0])
+
+    keys, vectors = np.concatenate(keys), np.concatenate(vectors)
+    np.testing.assert_array_equal(cache.read(cache.lookup(keys)), vectors)
+    reopened = EmbeddingCache(str(tmp_path), "fake/model", 4)
+    assert len(reopened) == len(keys)
+    np.testing.assert_array_equal(reopened.read(reopened.lookup(keys)), vectors)
+
+
+def test_truncates_interrupted_write(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "fake/model", 4)
+    cache.put(np.array([1, 2], dtype=np.int64), np.ones((2, 4), dtype=np.float32))
+    # 向量已写入、哈希未写入时中断
+    with open(cache.vectors_path, "ab") as f:
+        f.write(np.zeros((1, 4), dtype=np.float32).tobytes())
+    reopened = EmbeddingCache(str(tmp_path), "fake/model", 4)
+    assert len(reopened) == 2
+    assert (reopened.lookup(np.array([1, 2, 3], dtype=np.int64)) >= 0).tolist() == [True, True, False]
+
+
+def test_partial_vector_row_is_truncated_before_next_put(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "fake/model", 4)
+    cache.put(np.array([1, 2], dtype=np.int64), np.ones((2, 4), dtype=np.float32))
+    # 向量写到一半中断：行数向下取整后与哈希一致，但文件末尾多出半行
+    with open(cache.vectors_path, "ab") as f:
+        f.write(np.zeros(2, dtype=np.float32).tobytes())
+
+    reopened = EmbeddingCache(str(tmp_path), "fake/model", 4)
+    assert len(reopened) == 2
+    assert os.path.getsize(reopened.vectors_path) == 2 * 4 * 4
+    new_vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+    reopened.put(np.array([3, 4], dtype=np.int64), new_vectors)
+
+    for cache in (reopened, EmbeddingCache(str(tmp_path), "fake/model", 4)):
+        rows = cache.lookup(np.array([1, 2, 3, 4], dtype=np.int64))
+        np.testing.assert_array_equal(cache.read(rows[:2]), np.ones((2, 4), dtype=np.float32))
+        np.testing.assert_array_equal(cache.read(rows[2:]), new_vectors)
@@ -0,0 +1,150 @@
+"""
+ETL 断点续跑：已完成的记录精确跳过，失败的记录重试并替换占位记录，中断后从断点继续
+"""
+import json
+import threading
+import time
+import pytest
+from etl_journal import DONE, ETLJournal, journal_path_for, prompt_version, record_key
+from etl_pipeline import ETLPipeline
+
+
+class FakeLLM:
+    """
+    按原文返回固定的结构化 JSON；failing 中的文本返回无法解析的内容，
+    第 interrupt_at 次调用或处理 interrupt_on 时中断，delays 为每条文本的处理耗时
+    """
+
+    model = "fake-llm"
+
+    def __init__(self, failing=(), interrupt_at=None, interrupt_on=None, delays=None):
+        self.failing = set(failing)
+        self.interrupt_at = interrupt_at
+        self.interrupt_on = interrupt_on
+        self.delays = delays or {}
+        self.calls = []
+        self.finished = []
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, system=None, temperature=0.7):
+        text = prompt.rsplit("\n", 1)[-1]
+        with self._lock:
+            self.calls.append(text)
+            interrupt = (self.interrupt_at is not None and len(self.calls) == self.interrupt_at
+                         or text == self.interrupt_on)
+        time.sleep(self.delays.get(text, 0))
+        with self._lock:
+            self.finished.append(text)
+        if interrupt:
+            raise KeyboardInterrupt
+        if text in self.failing:
+            return "not json"
+        return json.dumps({"subject": text, "art_style": "摄影", "visual_elements": [], "mood": "",
+                           "technical": [], "raw": f"译文:{text}"}, ensure_ascii=False)
+
+
+TEXTS = [f"prompt {i}" for i in range(6)]
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def assert_journal_matches(pipeline, output_path, texts):
+    """断点日志中每条记录的偏移都指向输出文件中它自己的那一行"""
+    journal = ETLJournal(journal_path_for(output_path))
+    version = prompt_version(pipeline.system_prompt)
+    with open(output_path, "rb") as f:
+        for text in texts:
+            entry = journal.get(record_key(text, FakeLLM.model, version))
+            assert entry["status"] == DONE
+            f.seek(entry["offset"])
+            assert json.loads(f.readline())["raw"] == f"译文:{text}"
+    assert len(journal.entries) == len(texts)
+
+
+@pytest.fixture
+def output_path(tmp_path, monkeypatch):
+    # ETLPipeline 会创建相对路径下的 data 目录
+    monkeypatch.chdir(tmp_path)
+    return str(tmp_path / "structured.jsonl")
+
+
+def test_resume_retries_only_failed_records(output_path):
+    first = FakeLLM(failing={"prompt 2"})
+    ETLPipeline(first).process_batch(TEXTS, output_path, concurrency=1)
+    assert first.calls == TEXTS
+    assert [item["raw"] for item in read_output(output_path)][2] == "prompt 2"
+
+    second = FakeLLM()
+    ETLPipeline(second).process_batch(TEXTS, output_path, append=True, concurrency=1)
+    assert second.calls == ["prompt 2"]
+    # 失败时写入的占位记录被删除，每条原文恰好一条结果
+    assert sorted(item["raw"] for item in read_output(output_path)) == sorted(f"译文:{t}" for t in TEXTS)
+
+    third = FakeLLM()
+    ETLPipeline(third).process_batch(TEXTS, output_path, append=True, concurrency=1)
+    assert third.calls == []
+
+
+def test_resume_after_interrupt(output_path):
+    interrupted = FakeLLM(interrupt_at=4)
+    with pytest.raises(KeyboardInterrupt):
+        ETLPipeline(interrupted).process_batch(TEXTS, output_path, concurrency=1)
+    assert len(read_output(output_path)) == 3
+
+    resumed = FakeLLM()
+    ETLPipeline(resumed).process_batch(TEXTS, output_path, append=True, concurrency=1)
+    assert resumed.calls == TEXTS[3:]
+    assert [item["raw"] for item in read_output(output_path)] == [f"译文:{t}" for t in TEXTS]
+
+
+def test_unjournaled_trailing_record_is_reprocessed(output_path):
+    ETLPipeline(FakeLLM()).process_batch(TEXTS[:3], output_path, concurrency=1)
+    # 输出已写入、断点日志未写入时中断
+    with open(output_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"raw": "译文:prompt 3"}, ensure_ascii=False) + "\n")
+
+    resumed = FakeLLM()
+    ETLPipeline(resumed).process_batch(TEXTS, output_path, append=True, concurrency=1)
+    assert resumed.calls == TEXTS[3:]
+    assert [item["raw"] for item in read_output(output_path)] == [f"译文:{t}" for t in TEXTS]
+
+
+def test_changed_system_prompt_reprocesses(output_path):
+    ETLPipeline(FakeLLM()).process_batch(TEXTS[:2], output_path, concurrency=1)
+    pipeline = ETLPipeline(FakeLLM())
+    pipeline.system_prompt += "\n新增规则"
+    pipeline.process_batch(TEXTS[:2], output_path, append=True, concurrency=1)
+    # 提示词版本变化后 key 不同；旧的 raw 已是译文，不会被当作已存在
+    assert pipeline.client.calls == TEXTS[:2]
+
+
+def test_out_of_order_completion_keeps_input_order(output_path):
+    # 越靠前的请求越慢，完成顺序与输入顺序相反
+    client = FakeLLM(delays={text: 0.02 * (len(TEXTS) - i) for i, text in enumerate(TEXTS)})
+    pipeline = ETLPipeline(client)
+    pipeline.process_batch(TEXTS, output_path, concurrency=3)
+
+    assert client.finished != TEXTS
+    assert [item["raw"] for item in read_output(output_path)] == [f"译文:{t}" for t in TEXTS]
+    assert_journal_matches(pipeline, output_path, TEXTS)
+
+
+def test_resume_after_interrupt_with_requests_in_flight(output_path):
+    # 第 3 个请求中断时其后的请求已经发出，其中一些已先于它完成
+    delays = {text: 0.05 if i == 2 else 0.0 for i, text in enumerate(TEXTS)}
+    interrupted = FakeLLM(interrupt_on=TEXTS[2], delays=delays)
+    with pytest.raises(KeyboardInterrupt):
+        ETLPipeline(interrupted).process_batch(TEXTS, output_path, concurrency=4)
+    # 只按输入顺序写入了中断点之前的结果，已完成但排在后面的结果没有写入
+    assert set(interrupted.finished) > set(TEXTS[:3])
+    assert [item["raw"] for item in read_output(output_path)] == [f"译文:{t}" for t in TEXTS[:2]]
+
+    resumed = FakeLLM()
+    pipeline = ETLPipeline(resumed)
+    pipeline.process_batch(TEXTS, output_path, append=True, concurrency=4)
+    assert sorted(resumed.calls) == TEXTS[2:]
+    assert [item["raw"] for item in read_output(output_path)] == [f"译文:{t}" for t in TEXTS]
+    assert_journal_matches(pipeline, output_path, TEXTS)
@@ -0,0 +1,54 @@
+"""
+manifest 校验：不兼容（全量重建）、源文件变化（增量更新）与索引文件损坏
+"""
+import os
+from conftest import FAKE_MODEL, SAMPLE_RECORDS, write_jsonl
+from manifest import REBUILD, UPDATE, WARNING, check_manifest, read_manifest
+from vector_store import check_index_files, manifest_config
+
+
+def levels(issues):
+    return {level for level, _ in issues}
+
+
+def test_consistent_index_has_no_issues(built_store):
+    assert built_store.check_index() == []
+    assert built_store.check_index(deep=True) == []
+
+
+def test_incompatible_config_requires_rebuild(built_store):
+    manifest = read_manifest(built_store.manifest_path)
+    expected = manifest_config(FAKE_MODEL, manifest["backend"], "flat", 64)
+    assert check_manifest(manifest, expected) == []
+
+    assert levels(check_manifest(manifest, dict(expected, model="other/model"))) == {REBUILD}
+    assert levels(check_manifest(manifest, dict(expected, model_dimension=128))) == {REBUILD}
+    # 索引类型只能全量重建后生效；只读加载时可降为提示
+    assert levels(check_manifest(manifest, dict(expected, index_type="hnsw"))) == {REBUILD}
+    assert levels(check_manifest(manifest, dict(expected, index_type="hnsw"), structure_level=WARNING)) == {WARNING}
+    assert levels(check_index_files(built_store.index_path + ".missing", expected)) == {REBUILD}
+
+
+def test_changed_source_requires_update(built_store, tmp_path):
+    path = tmp_path / "records.jsonl"
+    write_jsonl(path, SAMPLE_RECORDS + SAMPLE_RECORDS[:1])
+    assert levels(built_store.check_index()) == {UPDATE}
+
+    os.remove(path)
+    assert levels(built_store.check_index()) == {WARNING}
+
+
+def test_deep_check_detects_content_change(built_store):
+    stat = os.stat(built_store.bm25_path)
+    with open(built_store.bm25_path, "r+b") as f:
+        first = f.read(1)
+        f.seek(0)
+        f.write(bytes([first[0] ^ 0xFF]))
+    os.utime(built_store.bm25_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    # 大小与修改时间都没变，只有重新计算校验和才能发现
+    assert built_store.check_index() == []
+    assert levels(built_store.check_index(deep=True)) == {REBUILD}
+
+    os.remove(built_store.bm25_path)
+    assert levels(built_store.check_index()) == {REBUILD}
@@ -0,0 +1,29 @@
+"""
+MMR 多样性重排
+"""
+import numpy as np
+from vector_store import mmr_order
+
+
+def test_mmr_prefers_diverse_candidates():
+    query = np.array([1.0, 0.0, 0.0])
+    vectors = np.array([
+        [0.9, 0.1, 0.0],
+        [0.9, 0.11, 0.0],  # 与第一条几乎相同
+        [0.7, 0.0, 0.7],
+    ])
+    assert mmr_order(query, vectors, 1.0).tolist() == [0, 1, 2]
+    # 相关度权重降低后，与已选结果重复的候选排到后面
+    assert mmr_order(query, vectors, 0.5).tolist() == [0, 2, 1]
+
+
+def test_mmr_with_lambda_one_keeps_vector_order(built_store):
+    query = "霓虹灯 城市"
+    plain = built_store.search(query, top_k=5, mmr=False)
+    reranked = built_store.search(query, top_k=5, mmr=True, mmr_lambda=1.0)
+    assert [item["raw"] for item, _ in reranked] == [item["raw"] for item, _ in plain]
+    assert [dist for _, dist in reranked] == sorted(dist for _, dist in reranked)
+
+    # 第一条总是与查询最相关的候选
+    diverse = built_store.search(query, top_k=5, mmr=True, mmr_lambda=0.3)
+    assert diverse[0][0]["raw"] == plain[0][0]["raw"]
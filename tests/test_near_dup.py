@@ -0,0 +1,46 @@
+"""
+近重复检测：leader 聚类不做传递合并
+"""
+from metadata_store import SqliteMetadataStore
+from near_dup import NearDupDetector
+
+
+def run(start: int, length: int = 10) -> str:
+    """一段互不重复的汉字"""
+    return "".join(chr(0x4e00 + start + i) for i in range(length))
+
+
+def assign(store, detector, records):
+    store.add(records.items())
+    store.add_near_dups(*detector.assign(records, store))
+
+
+def test_similarity_chain_is_not_merged(tmp_path):
+    # a~b 与 b~c 的 Jaccard 约 0.47，a 与 c 只有约 0.17
+    a, b, c = (run(50) + run(60) + run(70), run(60) + run(70) + run(80), run(70) + run(80) + run(90))
+    store = SqliteMetadataStore(str(tmp_path / "metadata.db"))
+    detector = NearDupDetector(threshold=0.3)
+    # 前提：b 与 a、c 都落在同一个 LSH 桶里，传递合并会把三条连成一簇
+    buckets = [set(detector.bucket_keys(detector.signature(detector.shingle_hashes({"raw": x}))))
+               for x in (a, b, c)]
+    assert buckets[0] & buckets[1] and buckets[1] & buckets[2]
+    assign(store, detector, {1: {"raw": a}, 2: {"raw": b}, 3: {"raw": c}})
+
+    clusters = store.get_clusters([1, 2, 3])
+    assert clusters[1] == clusters[2] == 1
+    assert clusters[3] == 3
+    store.close()
+
+
+def test_incremental_records_join_existing_leader(tmp_path):
+    store = SqliteMetadataStore(str(tmp_path / "metadata.db"))
+    detector = NearDupDetector(threshold=0.3)
+    assign(store, detector, {1: {"raw": run(0, 30)}, 2: {"raw": run(100, 30)}})
+    assign(store, detector, {3: {"raw": run(0, 30) + "。"}, 4: {"raw": run(200, 30)}})
+
+    clusters = store.get_clusters([1, 2, 3, 4])
+    assert clusters == {1: 1, 2: 2, 3: 1, 4: 4}
+    # 已归簇的记录再次写入时沿用原来的簇
+    assign(store, detector, {3: {"raw": run(0, 30) + "。", "mood": "新"}})
+    assert store.get_clusters([3]) == {3: 1}
+    store.close()
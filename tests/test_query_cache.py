@@ -0,0 +1,41 @@
+"""
+查询缓存：LRU 命中统计与查询归一化
+"""
+from vector_store import LRUCache, VectorStore, normalize_query
+
+
+def test_lru_evicts_least_recently_used_and_counts_hits():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1}
+
+    disabled = LRUCache(0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None
+    assert disabled.stats() == {"size": 0, "maxsize": 0, "hits": 0, "misses": 1}
+
+
+def test_normalize_query_folds_format_differences():
+    assert normalize_query("  霓虹灯\t城市\n") == "霓虹灯 城市"
+    assert normalize_query("Cyberpunk  CITY") == "cyberpunk city"
+    # 全角字母、数字与全角空格转为半角
+    assert normalize_query("ＣＹＢＥＲ　８Ｋ") == "cyber 8k"
+
+
+def test_formatting_variants_share_query_embedding(built_store, monkeypatch):
+    encoded = []
+    encode = built_store.encoder.encode
+    monkeypatch.setattr(built_store.encoder, "encode",
+                        lambda texts, **kwargs: encoded.extend(texts) or encode(texts, **kwargs))
+    before = VectorStore.query_cache_stats()
+
+    first = built_store.search("霓虹灯 ＣＩＴＹ", top_k=3)
+    second = built_store.search("  霓虹灯　City ", top_k=3)
+    assert encoded == ["霓虹灯 city"]
+    assert [item["raw"] for item, _ in first] == [item["raw"] for item, _ in second]
+    assert VectorStore.query_cache_stats()["misses"] == before["misses"] + 1
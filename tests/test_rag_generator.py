@@ -0,0 +1,70 @@
+"""
+RAGGenerator 的异步接口：用桩客户端代替 LLM，检索使用假 Embedding 构建的索引
+"""
+import asyncio
+import threading
+from rag_generator import RAGGenerator
+
+
+class StubClient:
+    """记录收到的提示词，同步 / 异步接口返回相同的内容"""
+
+    def __init__(self):
+        self.prompts = []
+        self.closed = False
+
+    def generate(self, prompt, system=None, temperature=0.7):
+        self.prompts.append(prompt)
+        return "  霓虹灯下的赛博朋克城市  "
+
+    async def agenerate(self, prompt, system=None, temperature=0.7):
+        await asyncio.sleep(0)
+        return self.generate(prompt, system, temperature)
+
+    async def astream_generate(self, prompt, system=None, temperature=0.7):
+        self.prompts.append(prompt)
+        for token in ["霓虹灯", "下的", "城市"]:
+            await asyncio.sleep(0)
+            yield token
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_agenerate_matches_generate(built_store):
+    client = StubClient()
+    rag = RAGGenerator(built_store, client=client)
+    expected = rag.generate("霓虹灯 城市", top_k=3)
+
+    async def run():
+        result = await rag.agenerate("霓虹灯 城市", top_k=3)
+        await rag.aclose()
+        return result
+
+    assert asyncio.run(run()) == expected
+    assert expected["final_prompt"] == "霓虹灯下的赛博朋克城市"
+    assert len(expected["references"]) == 3
+    assert client.prompts[0] == client.prompts[1]
+    assert client.closed
+
+
+def test_astream_generate_retrieves_off_the_event_loop(built_store, monkeypatch):
+    client = StubClient()
+    rag = RAGGenerator(built_store, client=client)
+    search = built_store.search
+    threads = []
+
+    def recording_search(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return search(*args, **kwargs)
+    monkeypatch.setattr(built_store, "search", recording_search)
+
+    async def run():
+        tokens, references = await rag.astream_generate("宁静的湖泊", top_k=2)
+        return [token async for token in tokens], references, threading.current_thread()
+
+    tokens, references, loop_thread = asyncio.run(run())
+    assert tokens == ["霓虹灯", "下的", "城市"]
+    assert [item["raw"] for item in references] == [item["raw"] for item, _ in search("宁静的湖泊", top_k=2)]
+    assert threads and threads[0] is not loop_thread
+    assert "宁静的湖泊" in client.prompts[0]
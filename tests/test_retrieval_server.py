@@ -0,0 +1,51 @@
+"""
+检索服务的批处理器：窗口内的并发查询合并为一次 search_batch
+"""
+import asyncio
+from retrieval_server import MicroBatcher
+
+
+class RecordingStore:
+    """记录每次 search_batch 的查询，每条查询返回带自身文本的结果"""
+
+    def __init__(self):
+        self.calls = []
+
+    def search_batch(self, queries, **params):
+        self.calls.append((list(queries), params))
+        return [[({"raw": query}, float(i))] for i, query in enumerate(queries)]
+
+
+def test_concurrent_queries_merge_into_one_batch():
+    store = RecordingStore()
+    queries = ["宁静的湖泊", "霓虹灯 城市", "街头摄影"]
+
+    async def run():
+        batcher = MicroBatcher(store, window_ms=50, max_batch=64)
+        try:
+            results = await asyncio.gather(*(batcher.search(query, {"top_k": 3}) for query in queries))
+            assert not batcher._tasks
+            return results, batcher.stats()
+        finally:
+            batcher.close()
+
+    results, stats = asyncio.run(run())
+    assert store.calls == [(queries, {"top_k": 3})]
+    assert [[item["raw"] for item, _ in result] for result in results] == [[query] for query in queries]
+    assert stats == {"queries": 3, "batches": 1, "avg_batch_size": 3.0}
+
+
+def test_different_params_and_full_batches_are_split():
+    store = RecordingStore()
+
+    async def run():
+        batcher = MicroBatcher(store, window_ms=50, max_batch=2)
+        try:
+            return await asyncio.gather(batcher.search("a", {"top_k": 3}), batcher.search("b", {"top_k": 3}),
+                                        batcher.search("c", {"top_k": 3}), batcher.search("d", {"top_k": 5}))
+        finally:
+            batcher.close()
+
+    results = asyncio.run(run())
+    assert sorted(queries for queries, _ in store.calls) == [["a", "b"], ["c"], ["d"]]
+    assert [result[0][0]["raw"] for result in results] == ["a", "b", "c", "d"]
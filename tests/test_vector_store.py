@@ -0,0 +1,217 @@
+"""
+VectorStore：稳定 id 的增量更新与删除、过滤检索、近重复去重
+"""
+import faiss
+import pytest
+from conftest import SAMPLE_RECORDS, make_record, write_jsonl
+from metadata_store import record_id
+
+
+def index_ids(store):
+    return set(faiss.vector_to_array(store.index.id_map).tolist())
+
+
+@pytest.mark.parametrize("index_type", ["flat", "sq8"])
+def test_upsert_and_delete_keep_ids_stable(make_store, tmp_path, index_type):
+    store = make_store(index_type)
+    store.build_index(write_jsonl(tmp_path / "records.jsonl", SAMPLE_RECORDS), incremental=False)
+    ids = [record_id(item) for item in SAMPLE_RECORDS]
+    assert index_ids(store) == set(ids)
+
+    # raw 不变只改字段：同一个 id 原地更新，不产生新向量
+    changed = dict(SAMPLE_RECORDS[2], mood="孤独")
+    assert store.upsert([changed]) == (0, 1)
+    # 内容未变的记录直接跳过
+    assert store.upsert([SAMPLE_RECORDS[0]]) == (0, 0)
+    added = make_record("古老的石桥横跨清澈的小溪", "水彩", "宁静", ["石桥", "小溪"])
+    assert store.upsert([added]) == (1, 0)
+    assert index_ids(store) == set(ids) | {record_id(added)}
+
+    assert store.delete([ids[5]]) == 1
+    assert store.delete([ids[5]]) == 0
+    assert store.index.ntotal == len(SAMPLE_RECORDS)
+
+    # 重新加载后 id 与记录的对应关系不变
+    reloaded = make_store(index_type)
+    reloaded.load_index(prefetch=False)
+    assert index_ids(reloaded) == set(ids) - {ids[5]} | {record_id(added)}
+    assert reloaded.metadata.get(ids[2])["mood"] == "孤独"
+    assert reloaded.metadata.get(ids[5]) is None
+    for i in (0, 1, 3, 4, 6, 7):
+        assert reloaded.metadata.get(ids[i]) == SAMPLE_RECORDS[i]
+
+
+def test_incremental_build_reuses_ids(make_store, tmp_path):
+    path = tmp_path / "records.jsonl"
+    store = make_store()
+    store.build_index(write_jsonl(path, SAMPLE_RECORDS[:6]), incremental=False)
+    before = index_ids(store)
+
+    store = make_store()
+    store.build_index(write_jsonl(path, SAMPLE_RECORDS), incremental=True)
+    assert index_ids(store) == before | {record_id(item) for item in SAMPLE_RECORDS[6:]}
+
+    # 同步模式删除文件中已不存在的记录
+    store = make_store()
+    store.build_index(write_jsonl(path, SAMPLE_RECORDS[1:]), incremental=True, prune=True)
+    assert record_id(SAMPLE_RECORDS[0]) not in index_ids(store)
+    assert len(store.metadata) == len(SAMPLE_RECORDS) - 1
+
+
+def test_full_vectors_repaired_after_interrupted_append(make_store, tmp_path, monkeypatch):
+    import numpy as np
+    import vector_store
+    from conftest import FakeEncoder
+    monkeypatch.setattr(vector_store, "EXACT_RERANK", True)
+    store = make_store("sq8")
+    store.build_index(write_jsonl(tmp_path / "records.jsonl", SAMPLE_RECORDS[:6]), incremental=False)
+    assert store.upsert(SAMPLE_RECORDS[6:7]) == (1, 0)
+
+    # 向量已追加、id 未追加时中断（同一进程内继续更新）
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.zeros(FakeEncoder.dimension // 2, dtype=vector_store.VECTORS_DTYPE).tobytes())
+    assert store.upsert(SAMPLE_RECORDS[7:]) == (1, 0)
+    rows, id_rows = store._count_full_vectors()
+    assert rows == id_rows == len(SAMPLE_RECORDS)
+
+    reloaded = make_store("sq8")
+    reloaded.load_index(prefetch=False)
+    assert reloaded.full_vectors is not None
+    ids = np.array([record_id(item) for item in SAMPLE_RECORDS], dtype=np.int64)
+    expected = FakeEncoder().encode([vector_store.build_search_text(item) for item in SAMPLE_RECORDS])
+    np.testing.assert_allclose(reloaded._candidate_vectors(ids), expected, atol=1e-3)
+
+
+def test_hnsw_rejects_updates_without_modifying(make_store, tmp_path):
+    store = make_store("hnsw")
+    store.build_index(write_jsonl(tmp_path / "records.jsonl", SAMPLE_RECORDS), incremental=False)
+    ids = [record_id(item) for item in SAMPLE_RECORDS]
+
+    with pytest.raises(ValueError, match="HNSW"):
+        store.upsert([dict(SAMPLE_RECORDS[0], mood="孤独")])
+    with pytest.raises(ValueError, match="HNSW"):
+        store.delete([ids[0]])
+    # 不存在的 id 不涉及删除向量
+    assert store.delete([12345]) == 0
+    assert store.index.ntotal == len(SAMPLE_RECORDS)
+    assert store.metadata.get(ids[0]) == SAMPLE_RECORDS[0]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_filtered_search(make_store, tmp_path, index_type):
+    store = make_store(index_type)
+    store.build_index(write_jsonl(tmp_path / "records.jsonl", SAMPLE_RECORDS), incremental=False)
+
+    results = store.search("宁静的风景", top_k=10, filters={"art_style": "水彩"})
+    assert sorted(item["raw"] for item, _ in results) == sorted(
+        item["raw"] for item in SAMPLE_RECORDS if item["art_style"] == "水彩")
+
+    # 同一字段的多个值为"或"
+    results = store.search("宁静的风景", top_k=10, filters={"art_style": ["水彩", "油画"]})
+    assert {item["art_style"] for item, _ in results} == {"水彩", "油画"}
+    assert len(results) == 4
+
+    # 不同字段之间为"且"，列表字段按元素匹配
+    results = store.search("城市", top_k=10, filters={"visual_elements": "霓虹灯", "mood": "神秘"})
+    assert [item["raw"] for item, _ in results] == [SAMPLE_RECORDS[5]["raw"]]
+
+    assert store.search("城市", top_k=10, filters={"mood": "不存在的情绪"}) == []
+    with pytest.raises(ValueError):
+        store.search("城市", filters={"raw": "霓虹灯"})
+
+
+def test_near_duplicates_collapse_to_one_result(make_store, tmp_path):
+    near_dup = dict(SAMPLE_RECORDS[6], raw=SAMPLE_RECORDS[6]["raw"] + "，超高清")
+    store = make_store()
+    store.build_index(write_jsonl(tmp_path / "records.jsonl", SAMPLE_RECORDS + [near_dup]), incremental=False)
+
+    pair = [record_id(SAMPLE_RECORDS[6]), record_id(near_dup)]
+    clusters = store.metadata.get_clusters(pair)
+    assert clusters[pair[0]] == clusters[pair[1]]
+    assert len(set(store.metadata.get_clusters(record_id(item) for item in SAMPLE_RECORDS).values())) == \
+        len(SAMPLE_RECORDS)
+
+    results = store.search("星空下的海滩", top_k=5)
+    raws = [item["raw"] for item, _ in results]
+    assert len(results) == 5
+    assert sum(raw in (SAMPLE_RECORDS[6]["raw"], near_dup["raw"]) for raw in raws) == 1
+
+    # 增量加入的近重复记录归入已有的簇
+    later = dict(SAMPLE_RECORDS[4], raw=SAMPLE_RECORDS[4]["raw"] + "，电影感")
+    store.upsert([later])
+    clusters = store.metadata.get_clusters([record_id(SAMPLE_RECORDS[4]), record_id(later)])
+    assert len(set(clusters.values())) == 1
+    raws = [item["raw"] for item, _ in store.search("赛博朋克城市 霓虹灯 高楼", top_k=5)]
+    assert sum(raw in (SAMPLE_RECORDS[4]["raw"], later["raw"]) for raw in raws) == 1
+
+
+def test_near_duplicates_in_different_clusters_are_still_collapsed(make_store, tmp_path, monkeypatch):
+    import near_dup
+    # 建库时不归簇（每条记录自成一簇），检索时仍按 Jaccard 与已采纳结果去重
+    monkeypatch.setattr(near_dup, "NEAR_DUP_THRESHOLD", 1.01)
+    near_dup_record = dict(SAMPLE_RECORDS[6], raw=SAMPLE_RECORDS[6]["raw"] + "，超高清")
+    store = make_store()
+    store.build_index(write_jsonl(tmp_path / "records.jsonl", SAMPLE_RECORDS + [near_dup_record]),
+                      incremental=False)
+    pair = [record_id(SAMPLE_RECORDS[6]), record_id(near_dup_record)]
+    assert len(set(store.metadata.get_clusters(pair).values())) == 2
+
+    raws = [item["raw"] for item, _ in store.search("星空下的海滩", top_k=5)]
+    assert sum(raw in (SAMPLE_RECORDS[6]["raw"], near_dup_record["raw"]) for raw in raws) == 1
+
+
+def test_upsert_marks_lexical_index_stale(built_store):
+    from manifest import read_manifest
+    added = make_record("古老的石桥横跨清澈的小溪", "水彩", "宁静", ["石桥", "小溪"])
+    built_store.upsert([added])
+    assert read_manifest(built_store.manifest_path)["lexical_stale"] is True
+
+    results = built_store.search("石桥 小溪", top_k=3, mode="hybrid")
+    assert added["raw"] in [item["raw"] for item, _ in results]
+    # 可写的 store 在检索时重建并写回
+    assert read_manifest(built_store.manifest_path)["lexical_stale"] is False
+
+
+@pytest.mark.parametrize("options", [
+    {"mode": "vector"},
+    {"mode": "hybrid"},
+    {"mode": "vector", "filters": {"art_style": ["水彩", "摄影"]}},
+    {"mode": "vector", "mmr": True, "mmr_lambda": 0.5},
+    {"mode": "hybrid", "mmr": True, "mmr_lambda": 0.5},
+])
+def test_search_batch_matches_looped_search(built_store, options):
+    queries = ["宁静的湖泊", "霓虹灯 城市", "街头摄影 人群", "宁静的湖泊"]
+    batched = built_store.search_batch(queries, top_k=3, **options)
+    assert len(batched) == len(queries)
+    for query, results in zip(queries, batched):
+        looped = built_store.search(query, top_k=3, **options)
+        assert [item["raw"] for item, _ in results] == [item["raw"] for item, _ in looped]
+        assert [dist for _, dist in results] == pytest.approx([dist for _, dist in looped])
+
+
+def test_search_batch_encodes_each_query_once_without_cache(built_store, monkeypatch):
+    from vector_store import LRUCache, VectorStore
+    # QUERY_CACHE_SIZE=0：混合检索与 MMR 复用本批的查询向量
+    monkeypatch.setattr(VectorStore, "_query_embedding_cache", LRUCache(0))
+    encoded = []
+    encode = built_store.encoder.encode
+    monkeypatch.setattr(built_store.encoder, "encode",
+                        lambda texts, **kwargs: encoded.extend(texts) or encode(texts, **kwargs))
+
+    queries = ["宁静的湖泊", "霓虹灯 城市"]
+    built_store.search_batch(queries, top_k=3, mode="hybrid", mmr=True)
+    assert sorted(encoded) == sorted(queries)
+
+
+def test_incremental_manifest_skips_checksums(built_store):
+    from manifest import WARNING, read_manifest
+    checksums = {item["path"]: item["checksum"] for item in read_manifest(built_store.manifest_path)["artifacts"]}
+    assert built_store.index_path in checksums
+
+    built_store.upsert([make_record("古老的石桥横跨清澈的小溪", "水彩", "宁静", ["石桥", "小溪"])])
+    artifacts = {item["path"]: item for item in read_manifest(built_store.manifest_path)["artifacts"]}
+    # 改动过的文件只记录大小与修改时间，未改动的文件沿用全量构建时的校验和
+    assert "checksum" not in artifacts[built_store.index_path]
+    for path, item in artifacts.items():
+        assert item.get("checksum") in (None, checksums.get(path))
+    assert {level for level, _ in built_store.check_index(deep=True)} <= {WARNING}
@@ -1,41 +1,470 @@
 """
 向量化与索引模块：使用 Embedding 模型生成向量，构建 FAISS 索引
+
+faiss 与 sentence_transformers 导入耗时较长，在首次建库/加载/编码时才导入
 """
-import json
-import jsonlines
 import os
+import threading
+import unicodedata
+from collections import OrderedDict
 import numpy as np
-import faiss
-import difflib
-from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Tuple
+from embedding_cache import EmbeddingCache, text_keys
+from encode_pool import EncodePool, POOL_MIN_TEXTS
+from length_batching import encode_bucketed
+from onnx_encoder import OnnxEncoder, EMBEDDING_BACKENDS
+from dim_reduction import DimReducer
+from manifest import (
+    manifest_path_for, read_manifest, write_manifest, file_fingerprint, check_manifest, REBUILD, WARNING,
+)
+from near_dup import NearDupDetector, dedup_text, shingle_hashes, jaccard_many
+from lexical_index import BM25Index, rrf_fuse
+from metadata_store import (
+    JsonlMetadata, SqliteMetadataStore, record_id, serialize_record, normalize_filters,
+    resolve_jsonl_paths, scan_record_ids, iter_jsonl_chunks,
+)
 from config import (
     EMBEDDING_MODEL,
     INDEX_PATH,
     METADATA_PATH,
+    METADATA_OFFSETS_PATH,
+    METADATA_DB_PATH,
     MODEL_CACHE_DIR,
     LOCAL_FILES_ONLY,
+    INDEX_TYPE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    IVF_TRAIN_SIZE,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    EXACT_RERANK,
+    RERANK_FACTOR,
+    VECTORS_PATH,
+    VECTOR_IDS_PATH,
+    VECTORS_DTYPE,
+    MMAP_INDEX,
+    PREFETCH_ON_LOAD,
+    EMBEDDING_CACHE,
+    EMBEDDING_CACHE_DIR,
+    QUERY_CACHE_SIZE,
+    QUERY_CANDIDATE_CACHE,
+    MMR_ENABLED,
+    MMR_LAMBDA,
+    FILTER_EXACT_MAX,
+    SEARCH_MODE,
+    BM25_PATH,
+    RRF_K,
+    NEAR_DUP_THRESHOLD,
+    NEAR_DUP_SHINGLE,
+    INGEST_CHUNK_SIZE,
+    ENCODE_WORKERS,
+    ENCODE_THREADS_PER_WORKER,
+    EMBEDDING_BACKEND,
+    ONNX_THREADS,
+    ENCODE_TOKEN_BUDGET,
+    ENCODE_MAX_BATCH,
+    DIM_REDUCTION,
+    REDUCED_DIM,
 )
 
 
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "pq", "ivf_sq8")
+
+
+def create_index(index_type: str, dimension: int, num_vectors: int):
+    """
+    索引工厂：根据类型创建（尚未训练的）FAISS 索引，统一使用 L2 距离
+    
+    Args:
+        index_type: flat / ivf_flat / ivf_pq / hnsw / sq8 / pq / ivf_sq8
+        dimension: 向量维度
+        num_vectors: 预计入库的向量数量（用于自动选择 IVF 聚类数）
+    
+    Returns:
+        支持 add_with_ids / remove_ids 的索引
+    """
+    import faiss
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}，可选: {', '.join(INDEX_TYPES)}")
+    
+    # PQ 的每个子量化器需要至少 2^nbits 个训练点，数据太少时退化为 IVF-Flat
+    if index_type == "ivf_pq" and num_vectors < 2 ** PQ_NBITS:
+        print(f"⚠️  数据量 {num_vectors} 不足以训练 PQ，改用 ivf_flat")
+        index_type = "ivf_flat"
+    if index_type == "pq" and num_vectors < 2 ** PQ_NBITS:
+        print(f"⚠️  数据量 {num_vectors} 不足以训练 PQ，改用 sq8")
+        index_type = "sq8"
+    if index_type in ("pq", "ivf_pq") and dimension % PQ_M != 0:
+        raise ValueError(f"PQ_M={PQ_M} 必须整除向量维度 {dimension}")
+    
+    # 非 IVF 索引外包 IndexIDMap2，以记录的稳定 id 作为检索结果标签
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    
+    if index_type == "sq8":
+        return faiss.IndexIDMap2(
+            faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+        )
+    
+    if index_type == "pq":
+        return faiss.IndexIDMap2(faiss.IndexPQ(dimension, PQ_M, PQ_NBITS, faiss.METRIC_L2))
+    
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(index)
+    
+    # IVF 系列：聚类数默认取 4*sqrt(N)，并保证每个聚类至少约 39 个训练点
+    nlist = IVF_NLIST or int(4 * np.sqrt(max(num_vectors, 1)))
+    nlist = max(1, min(nlist, num_vectors // 39))
+    if index_type == "ivf_flat":
+        spec = f"IVF{nlist},Flat"
+    elif index_type == "ivf_sq8":
+        spec = f"IVF{nlist},SQ8"
+    else:
+        spec = f"IVF{nlist},PQ{PQ_M}x{PQ_NBITS}"
+    index = faiss.index_factory(dimension, spec, faiss.METRIC_L2)
+    # IVF 原生支持自定义 id；IndexIDMap2 的删除依赖子索引重新编号，不适用于 IVF。
+    # 哈希表直接映射让 IVF 支持按 id 删除和取回向量
+    faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def train_index(index, embeddings: np.ndarray, seed: int = 1234):
+    """训练需要训练的索引（IVF 聚类 / PQ 码本），样本过多时随机采样"""
+    if index.is_trained:
+        return
+    
+    train_vectors = embeddings
+    if len(embeddings) > IVF_TRAIN_SIZE:
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(embeddings), IVF_TRAIN_SIZE, replace=False)
+        train_vectors = embeddings[sample]
+    
+    print(f"正在训练索引（{len(train_vectors)} 条样本）...")
+    index.train(np.ascontiguousarray(train_vectors, dtype='float32'))
+
+
+def index_kind(index) -> str:
+    """识别索引的检索方式：ivf / hnsw / flat（会穿透 IDMap、PreTransform 等包装层）"""
+    import faiss
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexPreTransform)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def supports_ids(index) -> bool:
+    """索引是否支持以稳定 id 增删（旧版直接使用 IndexFlatL2 的索引只能按位置寻址）"""
+    import faiss
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        return True
+    if isinstance(index, faiss.IndexIVF):
+        return index.direct_map.type == faiss.DirectMap.Hashtable
+    return False
+
+
+def make_search_params(kind: str, k: int, nprobe: int = None, ef_search: int = None, sel=None):
+    """
+    构造单次检索的 SearchParameters，避免修改共享索引上的全局参数
+    
+    Args:
+        sel: faiss.IDSelector，只在选中的 id 中检索
+    
+    Returns:
+        flat 索引且没有 sel 时返回 None
+    """
+    import faiss
+    if kind == "ivf":
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or IVF_NPROBE
+    elif kind == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        # efSearch 小于 k 时无法返回足够的结果
+        params.efSearch = max(ef_search or HNSW_EF_SEARCH, k)
+    elif sel is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if sel is not None:
+        params.sel = sel
+    return params
+
+
+def rerank_exact(query_vector: np.ndarray, indices: np.ndarray, full_vectors: np.ndarray,
+                 keep: int, rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    用全精度向量对压缩索引返回的候选集做精确 L2 重排
+    
+    Args:
+        query_vector: 单条查询向量 (dim,)
+        indices: 候选 id（可能包含 -1 补位）
+        full_vectors: 内存映射的全精度向量 (N, dim)，只会读取候选所在的行
+        keep: 重排后保留的数量
+        rows: 候选在 full_vectors 中的行号（-1 表示缺失），默认与 id 相同
+    
+    Returns:
+        (distances, indices)，按精确距离升序
+    """
+    if rows is None:
+        rows = indices
+    mask = (indices >= 0) & (rows >= 0) & (rows < len(full_vectors))
+    valid, valid_rows = indices[mask], rows[mask]
+    if len(valid) == 0:
+        return np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+    
+    candidates = np.asarray(full_vectors[valid_rows], dtype='float32')
+    diff = candidates - query_vector
+    exact = np.einsum('ij,ij->i', diff, diff)
+    order = np.argsort(exact, kind='stable')[:keep]
+    return exact[order], valid[order]
+
+
+def mmr_order(query_vector: np.ndarray, vectors: np.ndarray, lam: float) -> np.ndarray:
+    """
+    最大边际相关性（MMR）排序
+    
+    每一步选择 λ·与查询的相似度 − (1−λ)·与已选候选的最大相似度 最高的候选（余弦相似度），
+    候选两两之间的相似度由一次矩阵乘法得到。
+    
+    Returns:
+        候选下标的新顺序
+    """
+    v = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    q = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+    relevance = v @ q
+    similarity = v @ v.T
+    
+    order = [int(np.argmax(relevance))]
+    max_sim = similarity[order[0]].copy()
+    selected = np.zeros(len(v), dtype=bool)
+    selected[order[0]] = True
+    for _ in range(len(v) - 1):
+        scores = lam * relevance - (1 - lam) * max_sim
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        order.append(best)
+        selected[best] = True
+        np.maximum(max_sim, similarity[best], out=max_sim)
+    return np.array(order, dtype='int64')
+
+
+def is_ivf_file(index_path: str) -> bool:
+    """
+    根据文件头判断磁盘上的索引是否为 IVF 系列
+
+    faiss 序列化的索引以 4 字节类型标记开头，IVF 系列（IwFl / IwPQ / IwSq 等）都以 "Iw" 开头；
+    只读文件头，不依赖配置中的 INDEX_TYPE（配置可能已改为其他类型而索引尚未重建）。
+    """
+    with open(index_path, 'rb') as f:
+        return f.read(2) == b"Iw"
+
+
+def read_index_mmap(index_path: str):
+    """
+    以内存映射方式读取索引，页面在首次访问时才从磁盘载入
+    
+    IVF 倒排表使用 IO_FLAG_MMAP；Flat/SQ/PQ/HNSW 的向量编码需 faiss>=1.10 的 IO_FLAG_MMAP_IFC。
+    按磁盘上索引的实际类型选择，当前 faiss 版本或索引类型不支持时回退为普通读取。
+    
+    Returns:
+        (index, 是否成功内存映射)
+    """
+    import faiss
+    if is_ivf_file(index_path):
+        flags = faiss.IO_FLAG_MMAP
+    elif hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        flags = faiss.IO_FLAG_MMAP_IFC
+    else:
+        return faiss.read_index(index_path), False
+    
+    try:
+        return faiss.read_index(index_path, flags | faiss.IO_FLAG_READ_ONLY), True
+    except RuntimeError as e:
+        print(f"⚠️  内存映射加载失败，改为普通加载: {e}")
+        return faiss.read_index(index_path), False
+
+
+def sidecar_path(index_path: str, suffix: str, default: str) -> str:
+    """
+    与索引放在一起的附属文件（BM25、全精度向量等）的路径
+
+    默认索引沿用 config 中的路径（兼容已有的 db 目录），其他索引路径在其文件名后加后缀，
+    同一目录下的多个索引互不覆盖。
+    """
+    if os.path.abspath(index_path) == os.path.abspath(INDEX_PATH):
+        return default
+    return os.path.splitext(index_path)[0] + suffix
+
+
+def prefetch_files(paths: List[str], chunk_size: int = 1 << 20) -> threading.Thread:
+    """
+    在后台线程中顺序预读文件，把页面提前装入页缓存，避免首批查询阻塞在缺页上
+    """
+    def _worker():
+        buffer = bytearray(chunk_size)
+        for path in paths:
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'rb', buffering=0) as f:
+                    if hasattr(os, "posix_fadvise"):
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                    while f.readinto(buffer):
+                        pass
+            except OSError:
+                pass
+    
+    thread = threading.Thread(target=_worker, name="vector-store-prefetch", daemon=True)
+    thread.start()
+    return thread
+
+
+# 检索文本构建规则的版本，记录在 manifest 中；修改 build_search_text 后加 1，旧索引会提示需要全量重建
+SEARCH_TEXT_VERSION = 1
+
+
+def manifest_config(model_name: str, backend: str, index_type: str, model_dimension: int = None) -> Dict:
+    """
+    给定配置下 manifest 应有的内容（用于写入与校验）
+    
+    model_dimension 为 None 时不校验模型维度：不加载模型就无法得知，模型与后端一致时维度也一致。
+    """
+    return {
+        "model": model_name,
+        "backend": backend,
+        "model_dimension": model_dimension,
+        "metric": "l2",
+        "search_text_version": SEARCH_TEXT_VERSION,
+        "index_type": index_type,
+        "reduction": f"{DIM_REDUCTION}:{REDUCED_DIM}" if DIM_REDUCTION != "none" else "none",
+    }
+
+
+def check_index_files(index_path: str, expected: Dict, deep: bool = False,
+                      structure_level: str = REBUILD) -> List[Tuple[str, str]]:
+    """对照索引旁的 manifest 校验（不需要加载模型与索引），返回值同 manifest.check_manifest"""
+    path = manifest_path_for(index_path)
+    manifest = read_manifest(path)
+    if manifest is None:
+        return [(REBUILD, f"没有 manifest ({path})，无法确认索引由哪个模型和数据构建")]
+    return check_manifest(manifest, expected, deep=deep, structure_level=structure_level)
+
+
+def build_search_text(item: Dict) -> str:
+    """构建用于检索的文本（组合多个字段）"""
+    parts = []
+    
+    if item.get("subject"):
+        parts.append(item["subject"])
+    if item.get("art_style"):
+        parts.append(item["art_style"])
+    if item.get("visual_elements"):
+        parts.extend(item["visual_elements"])
+    if item.get("mood"):
+        parts.append(item["mood"])
+    if item.get("technical"):
+        parts.extend(item["technical"])
+    
+    # 如果所有字段都为空，使用原始文本
+    if not parts:
+        parts.append(item.get("raw", ""))
+    
+    return " ".join(parts)
+
+
+def normalize_query(query: str) -> str:
+    """查询归一化：全角转半角、统一小写、折叠空白，只有格式差异的查询共享缓存"""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+class LRUCache:
+    """线程安全的定长 LRU 缓存，带命中统计"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
 class VectorStore:
     """向量存储与检索"""
     
     # 类级别的缓存，所有实例共享同一个 encoder
     _encoder_cache = {}
     _dimension_cache = {}
+    # 进程级查询向量缓存：(模型, 归一化查询) -> 向量
+    _query_embedding_cache = LRUCache(QUERY_CACHE_SIZE)
     
-    def __init__(self, model_name: str = None, index_path: str = None, metadata_path: str = None):
+    def __init__(self, model_name: str = None, index_path: str = None, metadata_path: str = None,
+                 index_type: str = None, backend: str = None):
         self.model_name = model_name or EMBEDDING_MODEL
+        self.backend = backend or EMBEDDING_BACKEND
+        if self.backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"不支持的 Embedding 后端: {self.backend}，可选: {', '.join(EMBEDDING_BACKENDS)}")
+        # 不同后端的向量有细微差异，encoder、查询缓存与建库向量缓存都按后端区分
+        self.encoder_key = self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
         self.index_path = index_path or INDEX_PATH
+        # metadata_path 指向旧版 metadata.jsonl，仅用于兼容读取与迁移；新数据写入同名的 .db
         self.metadata_path = metadata_path or METADATA_PATH
+        if metadata_path is None:
+            self.metadata_offsets_path = METADATA_OFFSETS_PATH
+            self.metadata_db_path = METADATA_DB_PATH
+        else:
+            self.metadata_offsets_path = metadata_path + ".offsets"
+            self.metadata_db_path = os.path.splitext(metadata_path)[0] + ".db"
+        self.index_type = index_type or INDEX_TYPE
+        # BM25 词法索引、全精度向量与降维矩阵都与向量索引放在一起
+        self.bm25_path = sidecar_path(self.index_path, ".bm25.npz", BM25_PATH)
+        self.vectors_path = sidecar_path(self.index_path, ".vectors.bin", VECTORS_PATH)
+        self.vector_ids_path = sidecar_path(self.index_path, ".vectors.ids", VECTOR_IDS_PATH)
+        self.reducer_path = os.path.splitext(self.index_path)[0] + ".reducer.npz"
+        self.manifest_path = manifest_path_for(self.index_path)
+        # 本次建库的源文件指纹与向量是否归一化，写入 manifest
+        self._sources = None
+        self._normalized = None
         
         # 使用缓存的 encoder，避免重复加载
-        if self.model_name not in VectorStore._encoder_cache:
-            print(f"正在加载 Embedding 模型: {self.model_name}...")
+        if self.encoder_key not in VectorStore._encoder_cache:
+            print(f"正在加载 Embedding 模型: {self.model_name} (后端: {self.backend})...")
             # 检查模型是否已下载
             try:
-                import os
                 # 使用配置的本地缓存目录
                 model_cache_path = os.path.join(MODEL_CACHE_DIR, f"models--{self.model_name.replace('/', '--')}")
                 
@@ -48,18 +477,26 @@ class VectorStore:
             
             try:
                 # 指定 cache_folder 为项目目录下的 models，必要时开启本地离线加载
-                encoder = SentenceTransformer(
-                    self.model_name,
-                    cache_folder=MODEL_CACHE_DIR,
-                    local_files_only=LOCAL_FILES_ONLY,
-                )
-                # 获取实际向量维度
-                test_embedding = encoder.encode(["test"])
-                dimension = test_embedding.shape[1]
+                if self.backend == "onnx_int8":
+                    encoder = OnnxEncoder(self.model_name, cache_folder=MODEL_CACHE_DIR,
+                                          local_files_only=LOCAL_FILES_ONLY, threads=ONNX_THREADS)
+                else:
+                    from sentence_transformers import SentenceTransformer
+                    encoder = SentenceTransformer(
+                        self.model_name,
+                        cache_folder=MODEL_CACHE_DIR,
+                        local_files_only=LOCAL_FILES_ONLY,
+                    )
+                # 获取实际向量维度：同一模型构建的索引 manifest 中已有记录，不需要探测编码
+                manifest = read_manifest(self.manifest_path) or {}
+                if manifest.get("model") == self.model_name and manifest.get("backend") == self.backend:
+                    dimension = manifest["model_dimension"]
+                else:
+                    dimension = encoder.encode(["test"]).shape[1]
                 print(f"✓ 模型加载完成，向量维度: {dimension}")
                 # 缓存 encoder 和维度
-                VectorStore._encoder_cache[self.model_name] = encoder
-                VectorStore._dimension_cache[self.model_name] = dimension
+                VectorStore._encoder_cache[self.encoder_key] = encoder
+                VectorStore._dimension_cache[self.encoder_key] = dimension
             except Exception as e:
                 print(f"✗ 模型加载失败: {e}")
                 raise
@@ -67,238 +504,893 @@ class VectorStore:
             print(f"✓ 使用内存中缓存的 Embedding 模型: {self.model_name}")
         
         # 使用缓存的 encoder
-        self.encoder = VectorStore._encoder_cache[self.model_name]
-        self.dimension = VectorStore._dimension_cache[self.model_name]
+        self.encoder = VectorStore._encoder_cache[self.encoder_key]
+        self.dimension = VectorStore._dimension_cache[self.encoder_key]
         
         self.index = None
+        self.index_kind = "flat"
+        # 降维变换（DIM_REDUCTION），随索引加载，入库与查询向量都经过它
+        self.reducer = None
         self.metadata = []
+        # 全精度向量的内存映射（仅在 EXACT_RERANK 开启时使用）
+        self.full_vectors = None
+        self._vector_row_ids = None
+        self._vector_rows = None
+        # 是否已以可写方式加载（upsert / delete 需要）
+        self._writable = False
+        # 建库用的向量缓存，首次编码时打开
+        self.embedding_cache = None
+        # 多进程编码池只在 build_index 期间使用，首次需要编码时启动
+        self._encode_workers = 0
+        self._encode_pool = None
+        # 查询候选缓存与当前索引绑定，索引变化时清空
+        self._candidate_cache = LRUCache(QUERY_CACHE_SIZE if QUERY_CANDIDATE_CACHE else 0)
+        # 索引无法还原向量时（且没有全精度向量文件）MMR 与小集合精确过滤自动跳过，只提示一次
+        self._reconstruct_unavailable = False
+        # BM25 索引在第一次混合检索时加载；upsert / delete 之后标记为过期，之后按需重建
+        self.lexical = None
+        self._lexical_stale = False
     
-    def build_index(self, jsonl_path: str, incremental: bool = True):
+    def build_index(self, jsonl_paths, incremental: bool = True, prune: bool = False, workers: int = None):
         """
         从 JSONL 文件构建向量索引（支持增量更新）
         
+        数据按 INGEST_CHUNK_SIZE 条分块流式处理：读取 → 构建检索文本 → 编码 → 写入索引 → 写入元数据，
+        除 FAISS 索引本身外，内存占用只与分块大小有关。
+        
         Args:
-            jsonl_path: 结构化数据 JSONL 文件路径
-            incremental: 是否使用增量模式（只处理新增数据）
+            jsonl_paths: JSONL 文件路径、路径列表或目录（目录下的全部 .jsonl）
+            incremental: 是否使用增量模式（只处理新增或内容变化的记录）
+            prune: 增量模式下是否同时删除源文件中已不存在的记录
+            workers: 编码进程数（默认 ENCODE_WORKERS），大于 1 时在第一次需要编码时启动多进程编码池
         """
-        print(f"正在读取数据: {jsonl_path}...")
-        
-        # 读取 JSONL 文件中的所有数据
-        all_items = []
-        with jsonlines.open(jsonl_path) as reader:
-            for item in reader:
-                all_items.append(item)
-        
-        print(f"✓ 读取了 {len(all_items)} 条记录")
-        
-        # 检查是否使用增量模式
-        existing_metadata = []
-        existing_raws = set()
+        self._encode_workers = ENCODE_WORKERS if workers is None else workers
+        try:
+            self._build_index(jsonl_paths, incremental, prune)
+        finally:
+            self._encode_workers = 0
+            if self._encode_pool is not None:
+                self._encode_pool.close()
+                self._encode_pool = None
+    
+    def _build_index(self, jsonl_paths, incremental: bool, prune: bool):
+        paths = resolve_jsonl_paths(jsonl_paths)
+        print(f"正在读取数据: {', '.join(paths)}...")
+        # 读取前记录指纹，建库期间源文件的改动会在下次加载时被发现
+        self._sources = [file_fingerprint(path) for path in paths]
+        source_ids, latest = scan_record_ids(paths)
+        print(f"✓ 读取了 {len(source_ids)} 条记录（不重复 {int(latest.sum())} 条）")
         
         if incremental and self.exists():
             print("\n检测到现有索引，使用增量模式...")
             try:
-                # 读取现有元数据
-                with open(self.metadata_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if line.strip():
-                            item = json.loads(line)
-                            existing_metadata.append(item)
-                            existing_raws.add(item.get('raw', ''))
+                self._load_for_update()
+                print(f"  现有索引: {self.index.ntotal} 条记录")
                 
-                print(f"  现有索引: {len(existing_metadata)} 条记录")
+                added = updated = 0
+                for chunk in self._iter_latest_chunks(paths, latest):
+                    chunk_added, chunk_updated = self._upsert(chunk)
+                    added += chunk_added
+                    updated += chunk_updated
                 
-                # 找出新增的记录（基于 raw 字段去重）
-                new_items = [item for item in all_items if item.get('raw', '') not in existing_raws]
+                deleted = 0
+                if prune:
+                    stored_ids = np.fromiter(self.metadata.ids(), dtype='int64')
+                    deleted = self._delete(stored_ids[~np.isin(stored_ids, source_ids)].tolist())
                 
-                if not new_items:
+                if not (added or updated or deleted):
+                    # 源文件可能只是被重新写出，更新 manifest 中的指纹，避免之后一直提示需要更新
+                    if self._lexical_stale:
+                        self._save_lexical(self.metadata.items())
+                    self._write_manifest()
                     print("✓ 没有新数据，索引已是最新状态")
                     return
                 
-                print(f"  新增记录: {len(new_items)} 条")
-                
-                # 加载现有索引
-                self.index = faiss.read_index(self.index_path)
-                print(f"  已加载现有索引: {self.index.ntotal} 条")
-                
-                # 只处理新增数据
-                texts = []
-                metadata_list = []
-                for item in new_items:
-                    search_text = self._build_search_text(item)
-                    texts.append(search_text)
-                    metadata_list.append(item)
-                
-                # 生成新数据的向量
-                if texts:
-                    print(f"\n正在为 {len(texts)} 条新记录生成向量...")
-                    # 使用更大的批量大小加快处理速度
-                    batch_size = min(64, len(texts))
-                    embeddings = self.encoder.encode(texts, show_progress_bar=True, batch_size=batch_size)
-                    embeddings = np.array(embeddings).astype('float32')
-                    
-                    # 添加到现有索引
-                    print("正在将新向量添加到索引...")
-                    self.index.add(embeddings)
-                    
-                    # 合并元数据
-                    existing_metadata.extend(metadata_list)
-                    metadata_list = existing_metadata
-                    
-                    print(f"✓ 已添加 {len(new_items)} 条新记录到索引")
-                
+                # 整次构建只重建一次 BM25
+                self._save(rebuild_lexical=True)
+                print(f"✓ 增量更新完成：新增 {added} 条，更新 {updated} 条，删除 {deleted} 条")
+                print(f"  索引大小: {self.index.ntotal} 条")
+                return
             except Exception as e:
                 print(f"⚠️  增量更新失败: {e}")
                 print("   将使用全量重建模式...")
-                incremental = False
         
-        # 全量重建模式
-        if not incremental or not self.exists():
-            print("\n使用全量重建模式...")
-            texts = []
-            metadata_list = []
-            
-            for item in all_items:
-                search_text = self._build_search_text(item)
-                texts.append(search_text)
-                metadata_list.append(item)
-            
-            # 生成向量
-            print(f"正在为 {len(texts)} 条记录生成向量...")
-            # 使用更大的批量大小加快处理速度
-            batch_size = min(64, len(texts))
-            embeddings = self.encoder.encode(texts, show_progress_bar=True, batch_size=batch_size)
-            embeddings = np.array(embeddings).astype('float32')
+        self._rebuild(paths, latest)
+    
+    def _iter_latest_chunks(self, paths: List[str], latest: np.ndarray):
+        """分块读取记录，跳过之后还会再次出现的重复记录（同一条提示词以最后一次出现为准）"""
+        position = 0
+        for chunk in iter_jsonl_chunks(paths, INGEST_CHUNK_SIZE):
+            keep = latest[position:position + len(chunk)]
+            position += len(chunk)
+            yield [item for item, k in zip(chunk, keep) if k]
+    
+    def _rebuild(self, paths: List[str], latest: np.ndarray):
+        """全量重建：索引在内存中逐块追加，元数据与全精度向量先写临时文件，完成后原子替换"""
+        print("\n使用全量重建模式...")
+        num_records = int(latest.sum())
+        if num_records == 0:
+            print("✗ 没有可用的记录")
+            return
+        print(f"  每块 {INGEST_CHUNK_SIZE} 条")
+        
+        # 训练样本（不超过 IVF_TRAIN_SIZE 条）的向量会进入向量缓存，正式编码时直接命中
+        self.reducer = None
+        sample = None
+        if DIM_REDUCTION == "pca":
+            sample = self._training_sample(paths, latest)
+            self.reducer = DimReducer.fit(DIM_REDUCTION, sample, REDUCED_DIM)
+            sample = self.reducer.transform(sample)
+        elif DIM_REDUCTION != "none":
+            # 截断只需要知道模型维度
+            self.reducer = DimReducer.fit(DIM_REDUCTION, np.empty((0, self.dimension), dtype='float32'), REDUCED_DIM)
+        
+        print(f"正在构建 FAISS 索引 (类型: {self.index_type}, {self.index_dimension} 维)...")
+        self.index = create_index(self.index_type, self.index_dimension, num_records)
+        self.index_kind = index_kind(self.index)
+        if not self.index.is_trained:
+            train_index(self.index, sample if sample is not None else self._training_sample(paths, latest))
+        self._candidate_cache.clear()
+        
+        tmp_db_path = self.metadata_db_path + ".tmp"
+        tmp_paths = [tmp_db_path, self.vectors_path + ".tmp", self.vector_ids_path + ".tmp"]
+        for path in tmp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        store = SqliteMetadataStore(tmp_db_path)
+        detector = NearDupDetector()
+        
+        processed = 0
+        for chunk in self._iter_latest_chunks(paths, latest):
+            records = {record_id(item): item for item in chunk}
+            ids = np.fromiter(records.keys(), dtype='int64', count=len(records))
+            texts = [build_search_text(item) for item in records.values()]
+            embeddings = self._encode_texts(texts)
+            if processed == 0:
+                # L2 距离与余弦相似度是否等价取决于向量是否归一化，记录在 manifest 中
+                self._normalized = bool(np.allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-3))
+            self.index.add_with_ids(embeddings, ids)
+            if EXACT_RERANK:
+                self._append_full_vectors(embeddings, ids, suffix=".tmp")
+            store.add(records.items())
+            # 近重复簇：与已写入的记录比较，同簇记录检索时只保留一条
+            store.add_near_dups(*detector.assign(records, store))
             
-            # 构建 FAISS 索引
-            print("正在构建 FAISS 索引...")
-            self.index = faiss.IndexFlatL2(self.dimension)  # L2 距离
-            self.index.add(embeddings)
+            processed += len(records)
+            print(f"  已处理 {processed}/{num_records} 条")
         
-        # 确保目录存在
-        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        self._save_index()
+        print(f"✓ 近重复检测完成：{len(store)} 条记录归入 {store.cluster_count()} 个簇")
+        self._save_lexical(store.items())
         
-        # 保存索引
-        faiss.write_index(self.index, self.index_path)
-        print(f"✓ 索引已保存: {self.index_path}")
+        store.close()
+        os.replace(tmp_db_path, self.metadata_db_path)
+        self.metadata = SqliteMetadataStore(self.metadata_db_path)
+        self._writable = True
+        print(f"✓ 元数据已保存: {self.metadata_db_path}")
+        
+        if EXACT_RERANK:
+            os.replace(self.vectors_path + ".tmp", self.vectors_path)
+            os.replace(self.vector_ids_path + ".tmp", self.vector_ids_path)
+            print(f"✓ 全精度向量已保存: {self.vectors_path}")
+            self._open_full_vectors()
         
-        # 保存元数据
-        self.metadata = metadata_list
-        os.makedirs(os.path.dirname(self.metadata_path), exist_ok=True)
-        with open(self.metadata_path, 'w', encoding='utf-8') as f:
-            for item in metadata_list:
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
-        print(f"✓ 元数据已保存: {self.metadata_path}")
+        self._write_manifest(self.index_type)
         
-        print(f"\n✓ 向量库构建完成！")
+        print("\n✓ 向量库构建完成！")
         print(f"  索引大小: {self.index.ntotal} 条")
     
-    def _build_search_text(self, item: Dict) -> str:
-        """构建用于检索的文本（组合多个字段）"""
-        parts = []
-        
-        if item.get("subject"):
-            parts.append(item["subject"])
-        if item.get("art_style"):
-            parts.append(item["art_style"])
-        if item.get("visual_elements"):
-            parts.extend(item["visual_elements"])
-        if item.get("mood"):
-            parts.append(item["mood"])
-        if item.get("technical"):
-            parts.extend(item["technical"])
-        
-        # 如果所有字段都为空，使用原始文本
-        if not parts:
-            parts.append(item.get("raw", ""))
-        
-        return " ".join(parts)
-    
-    def load_index(self):
-        """加载已保存的索引"""
+    def _training_sample(self, paths: List[str], latest: np.ndarray) -> np.ndarray:
+        """取数据开头不超过 IVF_TRAIN_SIZE 条记录的向量作为训练样本（IVF 聚类与 PCA 拟合）"""
+        texts = []
+        for chunk in self._iter_latest_chunks(paths, latest):
+            texts.extend(build_search_text(item) for item in chunk)
+            if len(texts) >= IVF_TRAIN_SIZE:
+                break
+        texts = texts[:IVF_TRAIN_SIZE]
+        print(f"正在为 {len(texts)} 条训练样本生成向量...")
+        return self._encode_texts(texts)
+    
+    def upsert(self, records: List[Dict]) -> Tuple[int, int]:
+        """
+        插入或更新记录：只为新增和内容变化的记录生成向量，未变化的记录直接跳过
+        
+        Args:
+            records: 结构化记录列表
+        
+        Returns:
+            (新增条数, 更新条数)
+        """
+        self._load_for_update()
+        added, updated = self._upsert(records)
+        if added or updated:
+            self._save()
+        return added, updated
+    
+    def delete(self, ids: List[int]) -> int:
+        """
+        按稳定 id 删除记录（id 可由 metadata_store.record_id 计算）
+        
+        Returns:
+            删除的条数
+        """
+        self._load_for_update()
+        deleted = self._delete(ids)
+        if deleted:
+            self._save()
+        return deleted
+    
+    def _load_for_update(self):
+        """以可写方式加载索引与元数据库（内存映射加载的索引是只读的）"""
+        import faiss
+        if self._writable:
+            return
+        if not self.exists():
+            raise FileNotFoundError(f"索引文件不存在: {self.index_path}，请先全量构建")
+        self._check_manifest()
+        
+        index = faiss.read_index(self.index_path)
+        self._lexical_stale = self._manifest_lexical_stale()
+        if not supports_ids(index) or not os.path.exists(self.metadata_db_path):
+            raise ValueError("现有索引为旧版格式（按位置寻址），不支持增量更新，需要全量重建一次")
+        
+        self.index = index
+        self.index_kind = index_kind(index)
+        self._load_reducer()
+        self.metadata = SqliteMetadataStore(self.metadata_db_path)
+        if EXACT_RERANK:
+            self._open_full_vectors()
+        self._writable = True
+    
+    def _upsert(self, records: List[Dict]) -> Tuple[int, int]:
+        """upsert 的核心逻辑，不落盘"""
+        # 同一批次内重复的 id 以最后一次出现为准
+        batch = {record_id(item): item for item in records}
+        stored = self.metadata.get_serialized(batch.keys())
+        changed = {i: item for i, item in batch.items() if stored.get(i) != serialize_record(item)}
+        if not changed:
+            return 0, 0
+        
+        updated_ids = [i for i in changed if i in stored]
+        if updated_ids:
+            self._remove_vectors(updated_ids)
+        
+        ids = np.fromiter(changed.keys(), dtype='int64', count=len(changed))
+        texts = [build_search_text(item) for item in changed.values()]
+        print(f"\n正在为 {len(texts)} 条新增或变化的记录生成向量...")
+        embeddings = self._encode_texts(texts)
+        
+        self.index.add_with_ids(embeddings, ids)
+        if EXACT_RERANK:
+            self._append_full_vectors(embeddings, ids)
+        self.metadata.add(changed.items())
+        self.metadata.add_near_dups(*NearDupDetector().assign(changed, self.metadata))
+        return len(changed) - len(updated_ids), len(updated_ids)
+    
+    def _delete(self, ids: List[int]) -> int:
+        """delete 的核心逻辑，不落盘"""
+        # 只处理库中存在的记录，不存在的 id 不需要（HNSW 上也不应因此报错）
+        ids = list(self.metadata.get_serialized(ids))
+        if len(ids) == 0:
+            return 0
+        self._remove_vectors(ids)
+        return self.metadata.delete(ids)
+    
+    def _remove_vectors(self, ids: List[int]):
+        """
+        从索引中移除向量（在修改元数据之前调用）
+        
+        HNSW 图不支持删除节点：旧向量会以同一 id 留在图中并继续参与排序，因此直接报错，
+        不做任何修改；build_index 的增量模式会因此改为全量重建。
+        """
+        if self.index_kind == "hnsw":
+            raise ValueError(f"HNSW 索引不支持删除或更新向量（涉及 {len(ids)} 条已有记录），"
+                             f"请全量重建索引，或改用支持删除的索引类型（flat / ivf_flat / sq8 等）")
+        self.index.remove_ids(np.asarray(ids, dtype='int64'))
+    
+    def _save(self, rebuild_lexical: bool = False):
+        """
+        增量修改后落盘：索引整体重写，元数据已在事务中提交
+        
+        BM25 的 idf 与平均长度依赖全部文档，只能从元数据库整体重建；单次 upsert / delete 只在
+        manifest 中标记为过期，由 build_index 的增量模式、rebuild_lexical() 或下一次混合检索重建。
+        """
+        self._candidate_cache.clear()
+        self._save_index()
+        if rebuild_lexical:
+            self._save_lexical(self.metadata.items())
+        else:
+            self.lexical = None
+            self._lexical_stale = True
+        if EXACT_RERANK:
+            self._open_full_vectors()
+        self._write_manifest()
+    
+    def _save_lexical(self, records):
+        """构建并保存 BM25 词法索引"""
+        self.lexical = BM25Index.build(records)
+        self.lexical.save(self.bm25_path)
+        self._lexical_stale = False
+        print(f"✓ BM25 索引已保存: {self.bm25_path} ({len(self.lexical.keys)} 个词项)")
+    
+    def rebuild_lexical(self):
+        """从元数据库重建 BM25 索引（upsert / delete 之后调用，或运行 python build_index.py --rebuild-lexical）"""
+        self._load_for_update()
+        self._save_lexical(self.metadata.items())
+        self._write_manifest()
+    
+    def _lexical_index(self):
+        """按需加载 BM25 索引；已过期时重建，旧版索引没有 BM25 文件时返回 None"""
+        if self.lexical is not None:
+            return self.lexical
+        if self._lexical_stale:
+            if self._writable:
+                self.rebuild_lexical()
+            else:
+                # 只读加载时不写文件（其他进程可能正在使用），只在内存中重建
+                print("⚠️  BM25 索引在 upsert / delete 后已过期，本进程在内存中重建；"
+                      "运行 python build_index.py --rebuild-lexical 写回磁盘")
+                self.lexical = BM25Index.build(self.metadata.items())
+        elif os.path.exists(self.bm25_path):
+            self.lexical = BM25Index.load(self.bm25_path)
+        return self.lexical
+    
+    def _save_index(self):
+        """保存索引（先写临时文件再替换，其他进程正在映射的旧文件不受影响）"""
+        import faiss
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        # 降维矩阵先于索引写入；未降维的索引删除旧矩阵
+        if self.reducer is not None:
+            self.reducer.save(self.reducer_path)
+        elif os.path.exists(self.reducer_path):
+            os.remove(self.reducer_path)
+        tmp_index_path = self.index_path + ".tmp"
+        faiss.write_index(self.index, tmp_index_path)
+        os.replace(tmp_index_path, self.index_path)
+        print(f"✓ 索引已保存: {self.index_path}")
+    
+    def _append_full_vectors(self, embeddings: np.ndarray, ids: np.ndarray, suffix: str = ""):
+        """将全精度向量及其记录 id 追加到向量文件（追加不会影响已有的内存映射区域）"""
+        os.makedirs(os.path.dirname(self.vectors_path) or ".", exist_ok=True)
+        if not suffix:
+            self._repair_full_vectors()
+        files = (
+            (self.vectors_path + suffix, np.ascontiguousarray(embeddings, dtype=VECTORS_DTYPE).tobytes()),
+            (self.vector_ids_path + suffix, np.ascontiguousarray(ids, dtype='int64').tobytes()),
+        )
+        for path, data in files:
+            with open(path, 'ab') as f:
+                f.write(data)
+    
+    def _count_full_vectors(self) -> Tuple[int, int]:
+        """向量文件与 id 文件中的完整行数"""
+        row_bytes = self.index_dimension * np.dtype(VECTORS_DTYPE).itemsize
+        rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        id_rows = os.path.getsize(self.vector_ids_path) // 8 if os.path.exists(self.vector_ids_path) else 0
+        return rows, id_rows
+    
+    def _repair_full_vectors(self):
+        """
+        追加前修复向量文件：两次追加之间中断会让两个文件行数不一致或末尾留下半行，
+        把两个文件都截断到完整行数较少的一方，之后追加的向量才能与 id 逐行对应
+        """
+        rows, id_rows = self._count_full_vectors()
+        keep = min(rows, id_rows)
+        row_bytes = self.index_dimension * np.dtype(VECTORS_DTYPE).itemsize
+        sizes = ((self.vectors_path, keep * row_bytes), (self.vector_ids_path, keep * 8))
+        if all(not os.path.exists(path) or os.path.getsize(path) == size for path, size in sizes):
+            return
+        print(f"⚠️  全精度向量文件与 id 文件不一致（{rows} / {id_rows} 行，可能是上次写入中断），"
+              f"截断到 {keep} 行；缺少全精度向量的记录在全量重建前不参与精确重排")
+        for path, size in sizes:
+            if os.path.exists(path):
+                os.truncate(path, size)
+    
+    def _open_full_vectors(self):
+        """
+        以只读方式内存映射全精度向量文件，并建立 id -> 行号的查找表
+        
+        向量文件只追加：更新过的记录以最后一行为准，删除的记录留下的旧行在全量重建时清理。
+        """
+        self.full_vectors = None
+        rows, id_rows = self._count_full_vectors()
+        if rows != id_rows:
+            # 两个文件逐行对应，较短一方之前的行仍然可用；下次追加前截断修复
+            print(f"⚠️  全精度向量文件与 id 文件行数不一致 ({rows} / {id_rows})，只使用前 {min(rows, id_rows)} 行，"
+                  f"下次增量更新时修复")
+            rows = min(rows, id_rows)
+        if rows == 0:
+            print("⚠️  全精度向量文件缺失，已禁用精确重排")
+            return
+        
+        row_ids = np.fromfile(self.vector_ids_path, dtype='int64', count=rows)
+        order = np.argsort(row_ids, kind='stable')
+        sorted_ids = row_ids[order]
+        # 同一 id 出现多次时保留最后写入的一行
+        last = np.append(sorted_ids[1:] != sorted_ids[:-1], True)
+        self._vector_row_ids = sorted_ids[last]
+        self._vector_rows = order[last]
+        self.full_vectors = np.memmap(self.vectors_path, dtype=VECTORS_DTYPE, mode='r',
+                                      shape=(rows, self.index_dimension))
+        print(f"✓ 已映射全精度向量: {self.vectors_path} ({VECTORS_DTYPE})")
+    
+    def _rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        """将记录 id 映射为向量文件行号，找不到的返回 -1"""
+        pos = np.searchsorted(self._vector_row_ids, ids)
+        pos = np.minimum(pos, len(self._vector_row_ids) - 1)
+        found = self._vector_row_ids[pos] == ids
+        return np.where(found, self._vector_rows[pos], -1)
+    
+    def _manifest_config(self) -> Dict:
+        """当前配置下 manifest 应有的内容（用于写入与校验）"""
+        return manifest_config(self.model_name, self.backend, self.index_type, self.dimension)
+    
+    def _write_manifest(self, index_type: str = None):
+        """
+        写入 manifest：模型、维度、度量、是否归一化、记录数、源文件指纹与各索引文件的指纹
+        
+        全量重建时记录各索引文件的校验和；增量修改时只记录大小与修改时间，避免每次 upsert / delete
+        都重读全部文件，未改动的文件沿用原校验和。没有校验和的文件在深度校验时按大小与修改时间比较。
+        
+        Args:
+            index_type: 全量重建时为当前配置；增量修改时为 None，沿用原 manifest 中的值
+        """
+        previous = read_manifest(self.manifest_path) or {}
+        artifacts = [self.index_path, self.metadata_db_path, self.bm25_path, self.reducer_path]
+        if EXACT_RERANK:
+            artifacts += [self.vectors_path, self.vector_ids_path]
+        manifest = self._manifest_config()
+        manifest.update(
+            index_type=index_type or previous.get("index_type", self.index_type),
+            reduction=(f"{self.reducer.kind}:{self.reducer.output_dim}" if self.reducer is not None else "none"),
+            index_dimension=self.index.d,
+            normalized=self._normalized if self._normalized is not None else previous.get("normalized"),
+            records=len(self.metadata),
+            vectors=int(self.index.ntotal),
+            sources=self._sources if self._sources is not None else previous.get("sources", []),
+            lexical_stale=self._lexical_stale,
+            artifacts=self._artifact_fingerprints(artifacts, previous, checksum=index_type is not None),
+        )
+        write_manifest(self.manifest_path, manifest)
+        print(f"✓ manifest 已保存: {self.manifest_path}")
+    
+    @staticmethod
+    def _artifact_fingerprints(paths: List[str], previous: Dict, checksum: bool) -> List[Dict]:
+        """各索引文件的指纹；不计算校验和时，大小与修改时间都未变的文件沿用原 manifest 中的校验和"""
+        if checksum:
+            return [file_fingerprint(path) for path in paths if os.path.exists(path)]
+        recorded = {item["path"]: item for item in previous.get("artifacts", [])}
+        fingerprints = []
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            fingerprint = file_fingerprint(path, checksum=False)
+            old = recorded.get(path)
+            if (old and old.get("checksum") and old["size"] == fingerprint["size"]
+                    and old["mtime_ns"] == fingerprint["mtime_ns"]):
+                fingerprint["checksum"] = old["checksum"]
+            fingerprints.append(fingerprint)
+        return fingerprints
+    
+    def _manifest_lexical_stale(self) -> bool:
+        return bool((read_manifest(self.manifest_path) or {}).get("lexical_stale"))
+    
+    def check_index(self, deep: bool = False, structure_level: str = REBUILD) -> List[Tuple[str, str]]:
+        """
+        对照 manifest 检查索引是否需要重建
+        
+        Args:
+            deep: 是否重新计算各文件的校验和（默认只比较大小与修改时间）
+            structure_level: 索引类型 / 降维方式与配置不一致时的级别（见 manifest.check_manifest）
+        
+        Returns:
+            [(级别, 说明)]，级别为 rebuild（需全量重建）/ update（增量更新即可）/ warning
+        """
+        return check_index_files(self.index_path, self._manifest_config(), deep=deep,
+                                 structure_level=structure_level)
+    
+    def _check_manifest(self, read_only: bool = False):
+        """
+        加载前校验 manifest：向量空间不兼容或文件损坏时抛出异常，其余问题只提示
+        
+        Args:
+            read_only: 只读加载时索引类型与配置不一致只提示（现有索引仍可检索）；
+                       增量修改时则需要全量重建，否则新配置永远不会生效
+        """
+        if read_manifest(self.manifest_path) is None:
+            print("⚠️  索引没有 manifest（旧版索引），无法校验模型与数据是否一致；下次建库时自动生成")
+            return
+        rebuild = []
+        for level, message in self.check_index(structure_level=WARNING if read_only else REBUILD):
+            if level == REBUILD:
+                rebuild.append(message)
+            else:
+                print(f"⚠️  {message}")
+        if rebuild:
+            raise ValueError("索引需要全量重建：\n  " + "\n  ".join(rebuild))
+    
+    @property
+    def index_dimension(self) -> int:
+        """索引中向量的维度（降维后的维度）"""
+        return self.reducer.output_dim if self.reducer is not None else self.dimension
+    
+    def _reduce(self, embeddings: np.ndarray) -> np.ndarray:
+        """对模型输出的向量应用降维变换（未降维时原样返回）"""
+        return self.reducer.transform(embeddings) if self.reducer is not None else embeddings
+    
+    def _load_reducer(self):
+        """加载与索引放在一起的降维矩阵，并检查与模型、索引的维度是否一致"""
+        self.reducer = DimReducer.load(self.reducer_path) if os.path.exists(self.reducer_path) else None
+        if self.reducer is not None:
+            if self.reducer.input_dim != self.dimension:
+                raise ValueError(f"降维矩阵的输入维度 ({self.reducer.input_dim}) 与当前模型 ({self.dimension}) "
+                                 f"不一致，请全量重建索引")
+            print(f"✓ 已加载降维矩阵: {self.reducer_path} ({self.reducer.kind}, "
+                  f"{self.reducer.input_dim} → {self.reducer.output_dim} 维)")
+        if self.index.d != self.index_dimension:
+            raise ValueError(f"索引维度 ({self.index.d}) 与当前模型{'降维后' if self.reducer else ''}的维度 "
+                             f"({self.index_dimension}) 不一致，请全量重建索引")
+    
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        为建库文本生成向量；开启 EMBEDDING_CACHE 时只编码缓存中没有的文本（缓存的是降维前的向量）
+        """
+        if not texts:
+            return np.empty((0, self.index_dimension), dtype='float32')
+        if not EMBEDDING_CACHE:
+            return self._reduce(self._encode_uncached(texts))
+        
+        if self.embedding_cache is None:
+            self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, self.encoder_key, self.dimension)
+        cache = self.embedding_cache
+        
+        keys = text_keys(texts)
+        rows = cache.lookup(keys)
+        hit = rows >= 0
+        embeddings = np.empty((len(texts), self.dimension), dtype='float32')
+        if hit.any():
+            embeddings[hit] = cache.read(rows[hit])
+        
+        missing = np.flatnonzero(~hit)
+        print(f"  向量缓存命中 {int(hit.sum())} 条，需编码 {len(missing)} 条")
+        if len(missing):
+            # 同一批次内重复的文本只编码一次
+            unique_keys, first, inverse = np.unique(keys[missing], return_index=True, return_inverse=True)
+            new_embeddings = self._encode_uncached([texts[missing[i]] for i in first])
+            embeddings[missing] = new_embeddings[inverse]
+            cache.put(unique_keys, new_embeddings)
+        return self._reduce(embeddings)
+    
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        """直接调用 Embedding 模型编码（按 token 长度分桶，批次大小由 ENCODE_TOKEN_BUDGET 决定）"""
+        use_pool = self._encode_workers not in (0, 1) and (
+            # 少量文本不值得启动编码池（每个进程都要加载一次模型）
+            self._encode_pool is not None or len(texts) >= POOL_MIN_TEXTS
+        )
+        if use_pool:
+            if self._encode_pool is None:
+                self._encode_pool = EncodePool(
+                    self.model_name, self._encode_workers, ENCODE_THREADS_PER_WORKER,
+                    cache_folder=MODEL_CACHE_DIR, local_files_only=LOCAL_FILES_ONLY, backend=self.backend,
+                )
+            print(f"  多进程编码 {len(texts)} 条...")
+            return self._encode_pool.encode(texts, ENCODE_TOKEN_BUDGET, ENCODE_MAX_BATCH)
+        return encode_bucketed(self.encoder, texts, ENCODE_TOKEN_BUDGET, ENCODE_MAX_BATCH, show_progress_bar=True)
+    
+    def load_index(self, use_mmap: bool = None, prefetch: bool = None):
+        """
+        加载已保存的索引
+        
+        Args:
+            use_mmap: 是否以内存映射方式加载索引（默认 MMAP_INDEX）
+            prefetch: 是否在后台预读索引与元数据文件（默认 PREFETCH_ON_LOAD）
+        """
+        import faiss
+        use_mmap = MMAP_INDEX if use_mmap is None else use_mmap
+        prefetch = PREFETCH_ON_LOAD if prefetch is None else prefetch
+        
         if not os.path.exists(self.index_path):
             raise FileNotFoundError(f"索引文件不存在: {self.index_path}")
         
-        if not os.path.exists(self.metadata_path):
-            raise FileNotFoundError(f"元数据文件不存在: {self.metadata_path}")
+        if not os.path.exists(self.metadata_db_path) and not os.path.exists(self.metadata_path):
+            raise FileNotFoundError(f"元数据文件不存在: {self.metadata_db_path}")
         
         print(f"正在加载索引: {self.index_path}...")
-        self.index = faiss.read_index(self.index_path)
-        print(f"✓ 索引加载完成，包含 {self.index.ntotal} 条记录")
+        self._check_manifest(read_only=True)
+        self._writable = False
+        self._candidate_cache.clear()
+        self._reconstruct_unavailable = False
+        self.lexical = None
+        self._lexical_stale = self._manifest_lexical_stale()
+        mapped = False
+        if use_mmap:
+            self.index, mapped = read_index_mmap(self.index_path)
+        else:
+            self.index = faiss.read_index(self.index_path)
+        self.index_kind = index_kind(self.index)
+        self._load_reducer()
+        print(f"✓ 索引加载完成，包含 {self.index.ntotal} 条记录 (类型: {self.index_kind}"
+              f"{', 内存映射' if mapped else ''})")
         
-        print(f"正在加载元数据: {self.metadata_path}...")
-        self.metadata = []
-        with open(self.metadata_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    self.metadata.append(json.loads(line))
-        print(f"✓ 元数据加载完成，包含 {len(self.metadata)} 条记录")
+        # 元数据按 id 随机读取，只解码检索命中的记录；旧版 JSONL 通过偏移表按需解码
+        if os.path.exists(self.metadata_db_path):
+            metadata_file = self.metadata_db_path
+            self.metadata = SqliteMetadataStore(self.metadata_db_path, readonly=True)
+        else:
+            metadata_file = self.metadata_path
+            self.metadata = JsonlMetadata(self.metadata_path, self.metadata_offsets_path)
+        print(f"✓ 元数据就绪: {metadata_file}，包含 {len(self.metadata)} 条记录")
+        if not (isinstance(self.metadata, SqliteMetadataStore) and self.metadata.has_near_dups()):
+            print("⚠️  元数据中没有近重复簇信息，检索时对候选现算 shingle 相似度去重；全量重建索引后改为按预先计算的近重复簇去重")
+        
+        if EXACT_RERANK:
+            self._open_full_vectors()
+        
+        if prefetch:
+            prefetch_files([self.index_path if mapped else None, metadata_file,
+                            self.vectors_path if self.full_vectors is not None else None])
     
-    def search(self, query: str, top_k: int = 5) -> List[Tuple[Dict, float]]:
+    def search(self, query: str, top_k: int = 5, nprobe: int = None,
+               ef_search: int = None, mmr: bool = None,
+               mmr_lambda: float = None, filters: Dict = None,
+               mode: str = None) -> List[Tuple[Dict, float]]:
         """
         向量检索（包含去重逻辑）
         
         Args:
             query: 查询文本
             top_k: 返回 Top-K 个结果
+            nprobe: IVF 索引探查的聚类数（默认 IVF_NPROBE）
+            ef_search: HNSW 索引的搜索宽度（默认 HNSW_EF_SEARCH）
+            mmr: 是否对候选做 MMR 多样性重排（默认 MMR_ENABLED）
+            mmr_lambda: MMR 中相关度的权重（默认 MMR_LAMBDA）
+            filters: 过滤条件，如 {"art_style": "摄影", "visual_elements": ["霓虹灯"]}；
+                     不同字段为"且"，同一字段的多个值为"或"，过滤在 FAISS 检索内完成
+            mode: "vector" 纯向量检索，"hybrid" 融合 BM25 词法检索（默认 SEARCH_MODE）
         
         Returns:
             (元数据, 距离) 元组列表
         """
+        return self.search_batch([query], top_k=top_k, nprobe=nprobe, ef_search=ef_search,
+                                 mmr=mmr, mmr_lambda=mmr_lambda, filters=filters, mode=mode)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 5, nprobe: int = None,
+                     ef_search: int = None, mmr: bool = None,
+                     mmr_lambda: float = None, filters: Dict = None,
+                     mode: str = None) -> List[List[Tuple[Dict, float]]]:
+        """
+        批量向量检索：一次前向编码全部查询，一次 FAISS 检索整个查询矩阵，再逐条去重
+        
+        结果与逐条调用 search 一致。
+        
+        Returns:
+            与 queries 一一对应的 (元数据, 距离) 元组列表
+        """
         if self.index is None:
             raise ValueError("索引未加载，请先调用 load_index() 或 build_index()")
+        if not queries:
+            return []
+        
+        normalized = [normalize_query(q) for q in queries]
         
-        # 生成查询向量
-        query_vector = self.encoder.encode([query], show_progress_bar=False, batch_size=1)
-        query_vector = np.array(query_vector).astype('float32')
+        # 过滤条件先在倒排索引上求出允许的 id 集合
+        filters = normalize_filters(filters) if filters else ()
+        allowed = self.metadata.filter_ids(filters) if filters else None
+        if allowed is not None and len(allowed) == 0:
+            return [[] for _ in queries]
         
         # 检索更多候选结果以进行去重（取 3 倍数量）
         candidate_k = top_k * 3
-        distances, indices = self.index.search(query_vector, candidate_k)
         
-        # 组装结果并去重
+        # 命中候选缓存的查询既不编码也不检索
+        candidate_keys = [(q, candidate_k, nprobe, ef_search, filters) for q in normalized]
+        candidates = [self._candidate_cache.get(key) for key in candidate_keys]
+        pending = [i for i, c in enumerate(candidates) if c is None]
+        
+        encoded = {}
+        if pending:
+            # 生成查询向量，一次 FAISS 检索全部未命中的查询
+            pending_vectors = self._encode_queries([normalized[i] for i in pending])
+            searched = self._search_candidates(pending_vectors, candidate_k, nprobe, ef_search, allowed)
+            for i, vector, candidate in zip(pending, pending_vectors, searched):
+                encoded[i] = vector
+                candidates[i] = candidate
+                self._candidate_cache.put(candidate_keys[i], candidate)
+        
+        mode = mode or SEARCH_MODE
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"不支持的检索模式: {mode}，可选: vector / hybrid")
+        mmr = MMR_ENABLED if mmr is None else mmr
+        query_vectors = None
+        if mode == "hybrid" or mmr:
+            # 本批已编码的向量直接复用（QUERY_CACHE_SIZE=0 时不会重复编码），只补编命中候选缓存的查询
+            rest = [i for i in range(len(queries)) if i not in encoded]
+            if rest:
+                encoded.update(zip(rest, self._encode_queries([normalized[i] for i in rest])))
+            query_vectors = np.stack([encoded[i] for i in range(len(queries))])
+        
+        if mode == "hybrid":
+            lexical = self._lexical_index()
+            if lexical is None:
+                print("⚠️  没有 BM25 索引，混合检索退化为向量检索；全量重建或增量更新索引后生成")
+            else:
+                candidates = [self._hybrid_candidates(lexical, query, query_vector, distances, indices,
+                                                      candidate_k, allowed)
+                              for query, query_vector, (distances, indices)
+                              in zip(normalized, query_vectors, candidates)]
+        
+        if mmr:
+            mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+            candidates = [self._mmr_candidates(query_vector, distances, indices, mmr_lambda)
+                          for query_vector, (distances, indices) in zip(query_vectors, candidates)]
+        
+        return [self._dedup_results(distances, indices, top_k) for distances, indices in candidates]
+    
+    def _hybrid_candidates(self, lexical: BM25Index, query: str, query_vector: np.ndarray,
+                           distances: np.ndarray, indices: np.ndarray, candidate_k: int,
+                           allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        向量候选与 BM25 候选按 RRF 融合排序
+        
+        只被词法检索召回的记录没有向量距离，用其向量现算 L2 距离，保证返回值含义不变。
+        """
+        mask = indices >= 0
+        distances, indices = distances[mask], indices[mask]
+        _, lexical_ids = lexical.search(query, candidate_k, allowed)
+        fused = rrf_fuse([indices, lexical_ids], k=RRF_K)
+        
+        known = dict(zip(indices.tolist(), distances.tolist()))
+        missing = np.array([i for i in fused.tolist() if i not in known], dtype='int64')
+        if len(missing):
+            vectors = self._candidate_vectors(missing)
+            if vectors is None:
+                known.update((i, float('inf')) for i in missing.tolist())
+            else:
+                diff = vectors - query_vector
+                known.update(zip(missing.tolist(), np.einsum('ij,ij->i', diff, diff).tolist()))
+        return np.array([known[i] for i in fused.tolist()], dtype='float32'), fused
+    
+    def _mmr_candidates(self, query_vector: np.ndarray, distances: np.ndarray, indices: np.ndarray,
+                        mmr_lambda: float) -> Tuple[np.ndarray, np.ndarray]:
+        """按 MMR 重新排列候选，距离保持原值；取不到候选向量时保持原顺序"""
+        mask = indices >= 0
+        distances, indices = distances[mask], indices[mask]
+        # 旧版本代码更新过的 HNSW 索引中同一 id 可能出现多次，只保留第一次
+        _, first = np.unique(indices, return_index=True)
+        first.sort()
+        distances, indices = distances[first], indices[first]
+        if len(indices) < 2:
+            return distances, indices
+        
+        vectors = self._candidate_vectors(indices)
+        if vectors is None:
+            return distances, indices
+        order = mmr_order(query_vector, vectors, mmr_lambda)
+        return distances[order], indices[order]
+    
+    def _candidate_vectors(self, ids: np.ndarray):
+        """取候选（或过滤后记录）的向量：优先读全精度向量文件，否则从索引中还原（压缩索引为近似值）"""
+        if self.full_vectors is not None:
+            rows = self._rows_for_ids(ids)
+            if (rows >= 0).all():
+                return np.asarray(self.full_vectors[rows], dtype='float32')
+        
+        if self._reconstruct_unavailable:
+            return None
+        try:
+            return np.vstack([self.index.reconstruct(int(i)) for i in ids])
+        except RuntimeError as e:
+            print(f"⚠️  当前索引无法还原向量，MMR 重排与小集合精确过滤检索将被跳过: {e}")
+            self._reconstruct_unavailable = True
+            return None
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """编码（已归一化的）查询，命中进程级缓存的跳过编码，其余一次前向完成"""
+        cache = VectorStore._query_embedding_cache
+        vectors = [cache.get((self.encoder_key, q)) for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        
+        if missing:
+            texts = [queries[i] for i in missing]
+            encoded = self.encoder.encode(texts, show_progress_bar=False, batch_size=len(texts))
+            encoded = np.array(encoded).astype('float32')
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+                cache.put((self.encoder_key, queries[i]), vector)
+        
+        # 缓存的是模型原始向量，降维在缓存之后，同一进程中不同维度的索引可以共用缓存
+        return self._reduce(np.stack(vectors))
+    
+    @classmethod
+    def query_cache_stats(cls) -> Dict:
+        """进程级查询向量缓存的命中统计"""
+        return cls._query_embedding_cache.stats()
+    
+    def _search_candidates(self, query_vectors: np.ndarray, candidate_k: int, nprobe: int = None,
+                           ef_search: int = None, allowed: np.ndarray = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        对查询矩阵执行一次 FAISS 检索，返回每条查询的 (距离, id) 候选
+        
+        Args:
+            allowed: 过滤后允许返回的 id（升序），为 None 时不过滤
+        """
+        import faiss
+        if allowed is not None and self.index_kind != "flat" and len(allowed) <= FILTER_EXACT_MAX:
+            # 允许的记录很少时，图/倒排检索容易在过滤后凑不够候选，直接精确计算更快也更准
+            exact = self._search_subset(query_vectors, allowed, candidate_k)
+            if exact is not None:
+                return exact
+        
+        # 开启精确重排时，从压缩索引中取更宽的候选集，再用全精度向量重排
+        fetch_k = candidate_k * RERANK_FACTOR if self.full_vectors is not None else candidate_k
+        sel = faiss.IDSelectorBatch(allowed) if allowed is not None else None
+        params = make_search_params(self.index_kind, fetch_k, nprobe=nprobe, ef_search=ef_search, sel=sel)
+        distances, indices = self.index.search(query_vectors, fetch_k, params=params)
+        if self.full_vectors is None:
+            return list(zip(distances, indices))
+        
+        candidates = []
+        for query_vector, row_indices in zip(query_vectors, indices):
+            rows = self._rows_for_ids(row_indices)
+            candidates.append(rerank_exact(query_vector, row_indices, self.full_vectors, candidate_k, rows=rows))
+        return candidates
+    
+    def _search_subset(self, query_vectors: np.ndarray, ids: np.ndarray,
+                       k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """在给定的少量记录上精确计算 L2 距离，取不到向量时返回 None"""
+        import faiss
+        vectors = self._candidate_vectors(ids)
+        if vectors is None:
+            return None
+        distances, positions = faiss.knn(query_vectors, vectors, min(k, len(ids)))
+        return [(row_distances, ids[row_positions]) for row_distances, row_positions in zip(distances, positions)]
+    
+    def _dedup_results(self, distances: np.ndarray, indices: np.ndarray,
+                       top_k: int) -> List[Tuple[Dict, float]]:
+        """
+        按距离顺序组装单条查询的结果，近重复的记录只保留距离最近的一条
+        
+        同簇直接判为重复（建库时算好，一次查询取回全部候选的簇）；不同簇的候选再与已采纳结果
+        现算 shingle Jaccard（候选只有 top_k*3 条，向量化计算），补上 leader 聚类分到不同簇的相似对。
+        旧版元数据没有簇信息时只走第二步。
+        """
         results = []
-        # 存储已采纳结果的 raw 文本，用于模糊去重
-        accepted_raws = []
+        clusters = self.metadata.get_clusters(int(i) for i in indices if i >= 0)
+        accepted_clusters = set()
+        # 已采纳结果的 shingle 哈希（没有 raw 的记录不参与比较）
+        accepted_shingles = []
+        # 旧版本代码更新过的 HNSW 索引中残留同 id 的旧向量，同一 id 可能出现多次
+        seen_ids = set()
         
-        for i, (idx, dist) in enumerate(zip(indices[0], distances[0])):
-            if idx < len(self.metadata):
-                item = self.metadata[idx]
-                raw_text = item.get('raw', '').strip()
-                
-                # 如果没有 raw 文本，暂时放行（或者使用其他字段构建指纹）
-                if not raw_text:
-                    results.append((item, float(dist)))
-                    if len(results) >= top_k:
-                        break
-                    continue
-                
-                # 模糊去重检查
-                is_duplicate = False
-                for existing_raw in accepted_raws:
-                    # 计算相似度 ratio
-                    # 如果 raw 文本非常短，相似度阈值可能需要调整，这里假设 prompt 都有一定长度
-                    similarity = difflib.SequenceMatcher(None, raw_text, existing_raw).ratio()
-                    if similarity > 0.6:  # 相似度超过 60% 视为重复（用户反馈例子非常相似）
-                        is_duplicate = True
-                        break
-                
-                if is_duplicate:
+        for idx, dist in zip(indices, distances):
+            # 近似索引在候选不足时会用 -1 补位；已删除记录的残留向量没有元数据
+            if idx < 0 or idx in seen_ids:
+                continue
+            seen_ids.add(idx)
+            cluster = clusters.get(int(idx), int(idx))
+            if cluster in accepted_clusters:
+                continue
+            item = self.metadata.get(int(idx))
+            if item is None:
+                continue
+            hashes = shingle_hashes(dedup_text(item), NEAR_DUP_SHINGLE)
+            if len(hashes):
+                if accepted_shingles and jaccard_many(hashes, accepted_shingles).max() >= NEAR_DUP_THRESHOLD:
                     continue
-                
-                # 通过检查，加入结果集
-                results.append((item, float(dist)))
-                accepted_raws.append(raw_text)
-                
-                # 收集够了 top_k 个就停止
-                if len(results) >= top_k:
-                    break
+                accepted_shingles.append(hashes)
+            
+            accepted_clusters.add(cluster)
+            results.append((item, float(dist)))
+            if len(results) >= top_k:
+                break
         
         return results
     
     def exists(self) -> bool:
         """检查索引文件是否存在"""
-        return os.path.exists(self.index_path) and os.path.exists(self.metadata_path)
+        return os.path.exists(self.index_path) and (
+            os.path.exists(self.metadata_db_path) or os.path.exists(self.metadata_path)
+        )
 
 
 if __name__ == "__main__":